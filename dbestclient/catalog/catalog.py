@@ -4,18 +4,249 @@
 # the University of Warwick
 # Q.Ma.2@warwick.ac.uk
 
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from dbestclient.catalog.modelformat import (LEGACY_SUFFIX, get_model_size,
+                                             load_model, remove_model_file)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def describe_model(model_wrapper) -> dict:
+    """summarize a model for the manifest, without keeping a reference to it.
+
+    Args:
+        model_wrapper (GenericQueryEngine): the model.
+
+    Returns:
+        dict: the model type, the columns it covers and the number of groups.
+    """
+    columns = []
+    usecols = getattr(model_wrapper, "usecols", None)
+    if isinstance(usecols, dict):
+        for key in ["y", "x_continous", "x_categorical", "gb"]:
+            columns += [col for col in usecols.get(key) or [] if col not in columns]
+    else:
+        for attr in ["density_column", "x_categorical_columns", "group_by_columns", "groupby_attribute"]:
+            value = getattr(model_wrapper, attr, None)
+            if value is None:
+                continue
+            for col in value if isinstance(value, list) else [value]:
+                if col not in columns:
+                    columns.append(col)
+
+    n_total_point = getattr(model_wrapper, "n_total_point", None)
+    n_total_points = getattr(model_wrapper, "n_total_points", None)
+    if isinstance(n_total_point, dict):
+        n_groups = len(n_total_point)
+    elif isinstance(n_total_points, dict):
+        n_groups = sum(len(value) if isinstance(value, dict) else 1
+                       for value in n_total_points.values())
+    else:
+        n_groups = None
+    return {"type": type(model_wrapper).__name__, "columns": columns, "n_groups": n_groups}
+
 
 class DBEstModelCatalog:
+    """The catalog of models in the warehouse.
+
+    The warehouse manifest records the name, type, size, columns and group count of each model, so the
+    catalog can be listed without loading any model. Models are loaded on first use, and the resident
+    models are bounded by runtime_config["max_resident_models"] and runtime_config["max_resident_bytes"],
+    evicting the least recently used ones. The catalog is safe to use from several threads.
+    """
+
     def __init__(self):
-        self.model_catalog = {}
+        self.lock = threading.RLock()
+        self.model_catalog = OrderedDict()  # resident models, the least recently used first.
+        self.manifest = {}
+        self.warehouse = None
+
+    def load_manifest(self, warehouse: str, runtime_config) -> int:
+        """read the warehouse manifest, and reconcile it with the model files in the warehouse.
+
+        Args:
+            warehouse (str): the warehouse directory.
+            runtime_config (dict): the runtime configuration.
+
+        Returns:
+            int: the number of models in the warehouse.
+        """
+        with self.lock:
+            self.warehouse = warehouse
+            manifest_file = os.path.join(warehouse, MANIFEST_FILE)
+            manifest = {}
+            if os.path.exists(manifest_file):
+                with open(manifest_file, "r") as f:
+                    manifest = json.load(f).get("models", {})
+
+            b_changed = False
+            suffix = runtime_config["model_suffix"]
+            # the models, with the model file name as the key. models in the legacy dill format
+            # are listed under the same key, unless they have been converted already.
+            files = {}
+            for file_name in os.listdir(warehouse):
+                if file_name.endswith(LEGACY_SUFFIX) and suffix != LEGACY_SUFFIX:
+                    key = file_name[:-len(LEGACY_SUFFIX)] + suffix
+                    files.setdefault(key, file_name)
+                elif file_name.endswith(suffix):
+                    files[file_name] = file_name
+            for key in list(manifest):
+                if key not in files or manifest[key]["file"] != files[key]:  # changed outside of DBEst
+                    manifest.pop(key)
+                    b_changed = True
+            for key, file_name in files.items():
+                size = get_model_size(os.path.join(warehouse, file_name))
+                if key not in manifest or manifest[key]["size"] != size:
+                    # unknown, or replaced outside of DBEst; the details are filled in when it is loaded.
+                    manifest[key] = {"name": key[:-len(suffix)],
+                                     "file": file_name, "size": size, "type": None,
+                                     "columns": None, "n_groups": None}
+                    b_changed = True
+            self.manifest = manifest
+            if b_changed:
+                self.save_manifest()
+            return len(self.manifest)
+
+    def save_manifest(self):
+        """write the manifest to the warehouse, atomically."""
+        if self.warehouse is None:
+            return
+        manifest_file = os.path.join(self.warehouse, MANIFEST_FILE)
+        with open(manifest_file + ".tmp", "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "models": self.manifest}, f, indent=1)
+        os.replace(manifest_file + ".tmp", manifest_file)
 
     def add_model_wrapper(self, model_wrapper, runtime_config):
         if hasattr(model_wrapper, 'groupby_value'):        # using regression and kde
             if model_wrapper.groupby_value is None:
-                self.model_catalog[model_wrapper.init_pickle_file_name(runtime_config
-                                                                       )] = model_wrapper
+                self.add_model(model_wrapper.init_pickle_file_name(runtime_config),
+                               model_wrapper, runtime_config)
             else:
                 self.model_catalog[model_wrapper.dir] = model_wrapper.models
         else:  # using kde
-            self.model_catalog[model_wrapper.init_pickle_file_name(runtime_config)
-                               ] = model_wrapper
+            self.add_model(model_wrapper.init_pickle_file_name(runtime_config),
+                           model_wrapper, runtime_config)
+
+    def add_model(self, file_name: str, model_wrapper, runtime_config):
+        """add a model, which has been serialized to the warehouse, to the catalog.
+
+        Args:
+            file_name (str): the model file name in the warehouse.
+            model_wrapper (GenericQueryEngine): the model.
+            runtime_config (dict): the runtime configuration.
+        """
+        with self.lock:
+            size = 0
+            if self.warehouse is not None and os.path.exists(os.path.join(self.warehouse, file_name)):
+                size = get_model_size(os.path.join(self.warehouse, file_name))
+            entry = {"name": file_name[:-len(runtime_config["model_suffix"])],
+                     "file": file_name, "size": size}
+            entry.update(describe_model(model_wrapper))
+            self.manifest[file_name] = entry
+            self.save_manifest()
+
+            self.model_catalog[file_name] = model_wrapper
+            self.model_catalog.move_to_end(file_name)
+            self.register_worker_model(file_name, model_wrapper, runtime_config)
+            self.evict(runtime_config, keep=file_name)
+
+    def has_model(self, file_name: str) -> bool:
+        with self.lock:
+            return file_name in self.manifest or file_name in self.model_catalog
+
+    def get_model(self, file_name: str, runtime_config):
+        """get a model, loading it from the warehouse on first use.
+
+        Args:
+            file_name (str): the model file name in the warehouse.
+            runtime_config (dict): the runtime configuration.
+
+        Returns:
+            GenericQueryEngine: the model, or None if it does not exist.
+        """
+        with self.lock:
+            if file_name in self.model_catalog:
+                self.model_catalog.move_to_end(file_name)
+                return self.model_catalog[file_name]
+            if file_name not in self.manifest:
+                return None
+            entry = self.manifest[file_name]
+
+        # the other models are still served while this one is being loaded.
+        if runtime_config["v"]:
+            print("loading model " + entry["name"] + "...")
+        model = load_model(os.path.join(self.warehouse, entry["file"]))
+
+        with self.lock:
+            if file_name in self.model_catalog:  # loaded by another thread in the meantime.
+                return self.model_catalog[file_name]
+            if entry["type"] is None:
+                entry.update(describe_model(model))
+                self.save_manifest()
+            self.model_catalog[file_name] = model
+            self.register_worker_model(file_name, model, runtime_config)
+            self.evict(runtime_config, keep=file_name)
+            return model
+
+    def remove_model(self, file_name: str) -> bool:
+        """remove a model from the catalog, the manifest and the warehouse.
+
+        Args:
+            file_name (str): the model file name in the warehouse.
+
+        Returns:
+            bool: False if the model does not exist.
+        """
+        with self.lock:
+            self.model_catalog.pop(file_name, None)
+            entry = self.manifest.pop(file_name, None)
+            if entry is None:
+                return False
+            if self.warehouse is not None:
+                remove_model_file(os.path.join(self.warehouse, entry["file"]))
+            self.save_manifest()
+            return True
+
+    def get_model_names(self) -> list:
+        """list the models in the warehouse, from the manifest only."""
+        with self.lock:
+            return sorted(self.manifest)
+
+    def evict(self, runtime_config, keep: str = None):
+        """evict the least recently used models, until the resident models are within the bounds.
+
+        Args:
+            runtime_config (dict): the runtime configuration.
+            keep (str, optional): a model never to evict, usually the one being used. Defaults to None.
+        """
+        with self.lock:
+            max_models = runtime_config.get("max_resident_models")
+            max_bytes = runtime_config.get("max_resident_bytes")
+
+            def resident_bytes():
+                return sum(self.manifest[name]["size"] for name in self.model_catalog if name in self.manifest)
+
+            for name in list(self.model_catalog):
+                b_over_count = max_models is not None and len(self.model_catalog) > max_models
+                b_over_bytes = max_bytes is not None and resident_bytes() > max_bytes
+                if not (b_over_count or b_over_bytes):
+                    break
+                if name != keep and name in self.manifest:  # models not in the warehouse can not be reloaded.
+                    self.model_catalog.pop(name)
+                    if runtime_config.get("worker_pool") is not None:
+                        runtime_config["worker_pool"].unregister(name)
+
+    def register_worker_model(self, file_name: str, model, runtime_config):
+        """make a resident model available to the worker pool, if any, which loads it from the warehouse."""
+        if runtime_config.get("worker_pool") is None:
+            return
+        path = None
+        entry = self.manifest.get(file_name)
+        if self.warehouse is not None and entry is not None and os.path.exists(os.path.join(self.warehouse, entry["file"])):
+            path = os.path.join(self.warehouse, entry["file"])
+        runtime_config["worker_pool"].register(file_name, model, path)
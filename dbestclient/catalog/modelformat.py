@@ -0,0 +1,372 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""The on-disk model format of the warehouse.
+
+A model is stored as a directory, holding
+    - header.json: the structure of the model, with all small values inline,
+    - arrays/<i>.npy: numpy arrays, torch tensors, frequency tables and embedding tables,
+    - blobs/<i>.dill: objects that have no columnar representation, e.g. category_encoders encoders.
+Arrays are loaded with np.load(mmap_mode='r'), so a model is available without reading it as a whole.
+Models in the previous format, a single dill file, are still readable by load_model().
+"""
+
+import importlib
+import json
+import os
+import shutil
+
+import dill
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.preprocessing import OneHotEncoder
+
+FORMAT_NAME = "dbest-model"
+FORMAT_VERSION = 1
+LEGACY_SUFFIX = ".dill"
+HEADER_FILE = "header.json"
+# lists and dicts with fewer items are kept inline in the header.
+MIN_ARRAY_SIZE = 8
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+def class_path(obj) -> str:
+    return type(obj).__module__ + ":" + type(obj).__qualname__
+
+
+def load_class(path: str):
+    module_name, qualname = path.split(":")
+    cls = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    return cls
+
+
+class ModelWriter:
+    """encode a model into the columnar format."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.n_array = 0
+        self.n_blob = 0
+        self.memo = {}
+        self.keep_alive = []
+
+    def write(self, model):
+        os.makedirs(os.path.join(self.path, "arrays"))
+        os.makedirs(os.path.join(self.path, "blobs"))
+        root = self.encode(model)
+        with open(os.path.join(self.path, HEADER_FILE), "w") as f:
+            json.dump({"format": FORMAT_NAME, "version": FORMAT_VERSION, "root": root}, f)
+
+    def add_array(self, array) -> str:
+        file_name = "arrays/" + str(self.n_array) + ".npy"
+        self.n_array += 1
+        np.save(os.path.join(self.path, file_name), array, allow_pickle=False)
+        return file_name
+
+    def add_blob(self, obj) -> str:
+        file_name = "blobs/" + str(self.n_blob) + ".dill"
+        self.n_blob += 1
+        with open(os.path.join(self.path, file_name), "wb") as f:
+            dill.dump(obj, f)
+        return file_name
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, str)):
+            return value
+        if isinstance(value, (np.integer, np.floating, np.bool_)):  # np.float64 is a float, too.
+            return {"kind": "scalar", "dtype": value.dtype.str, "value": value.item()}
+        if isinstance(value, (int, float)):
+            return value
+
+        # objects referenced more than once, e.g. an encoder shared by two models, are written once.
+        if id(value) in self.memo:
+            return {"kind": "ref", "id": self.memo[id(value)]}
+        self.memo[id(value)] = len(self.memo)
+        self.keep_alive.append(value)
+        encoded = self.encode_object(value)
+        encoded["id"] = self.memo[id(value)]
+        return encoded
+
+    def encode_object(self, value) -> dict:
+        if isinstance(value, np.ndarray):
+            if value.dtype.kind in "biufcUS":
+                return {"kind": "ndarray", "file": self.add_array(value)}
+            return {"kind": "ndarray_object", "shape": list(value.shape),
+                    "items": [self.encode(i) for i in value.reshape(-1)]}
+        if isinstance(value, torch.Tensor):
+            return {"kind": "tensor", "file": self.add_array(value.detach().cpu().numpy())}
+        if isinstance(value, (list, tuple)):
+            kind = "list" if isinstance(value, list) else "tuple"
+            array = self.homogeneous_array(value)
+            if array is not None:
+                return {"kind": kind + "_array", "file": self.add_array(array)}
+            return {"kind": kind, "items": [self.encode(i) for i in value]}
+        if isinstance(value, dict):
+            return self.encode_dict(value)
+        if isinstance(value, nn.Module):
+            return self.encode_module(value)
+        if isinstance(value, OneHotEncoder) and hasattr(value, "categories_"):
+            # the categories keep their type, as numbers and their text do not compare nor sort alike.
+            categories = []
+            for c in value.categories_:
+                b_object = c.dtype == object and all(type(i) is str for i in c)
+                categories.append({"object": b_object, "values": self.encode(c.astype(str) if b_object else c)})
+            return {"kind": "onehot", "handle_unknown": value.handle_unknown,
+                    "dtype": np.dtype(value.dtype).name, "sparse_output": get_onehot_sparse(value),
+                    "categories": categories}
+        if type(value).__module__.startswith("dbestclient."):
+            state = value.__getstate__() if hasattr(value, "__getstate__") else value.__dict__
+            return {"kind": "object", "class": class_path(value), "state": self.encode(state)}
+        return {"kind": "blob", "file": self.add_blob(value)}
+
+    def homogeneous_array(self, items):
+        if len(items) < MIN_ARRAY_SIZE:
+            return None
+        if all(type(i) is str for i in items):
+            return np.array(items, dtype=str)
+        if all(type(i) is int for i in items):
+            return np.array(items, dtype=np.int64)
+        if all(type(i) is float for i in items):
+            return np.array(items, dtype=np.float64)
+        return None
+
+    def encode_dict(self, value: dict) -> dict:
+        keys = list(value.keys())
+        if len(keys) >= MIN_ARRAY_SIZE and all(type(k) is str for k in keys):
+            values = list(value.values())
+            # frequency tables, group index, etc.
+            array = self.homogeneous_array(values)
+            if array is not None and array.dtype.kind != "U":
+                return {"kind": "table", "keys": self.add_array(np.array(keys, dtype=str)),
+                        "values": self.add_array(array)}
+            # embedding tables.
+            if all(isinstance(v, np.ndarray) and v.dtype.kind == "f" for v in values) \
+                    and len(set((v.shape, v.dtype.str) for v in values)) == 1:
+                return {"kind": "vector_table", "keys": self.add_array(np.array(keys, dtype=str)),
+                        "values": self.add_array(np.stack(values))}
+        return {"kind": "dict", "keys": [self.encode(k) for k in keys],
+                "values": [self.encode(v) for v in value.values()]}
+
+    def encode_module(self, module: nn.Module) -> dict:
+        arch = describe_module(module)
+        if arch is None:
+            return {"kind": "blob", "file": self.add_blob(module)}
+        state = {key: self.add_array(tensor.detach().cpu().numpy())
+                 for key, tensor in module.state_dict().items()}
+        return {"kind": "module", "arch": arch, "state": state, "training": module.training}
+
+
+def describe_module(module: nn.Module):
+    """describe the architecture of the supported networks, to rebuild them without pickle.
+
+    Returns:
+        dict: the architecture, or None if the module is not supported.
+    """
+    # imported here, as mdn depends on the catalog via the query engines.
+    from dbestclient.ml.mdn import MDN
+
+    if isinstance(module, nn.Sequential):
+        layers = [describe_module(layer) for layer in module]
+        if any(layer is None for layer in layers):
+            return None
+        return {"type": "Sequential", "layers": layers}
+    if isinstance(module, MDN):
+        return {"type": "MDN", "in_features": module.in_features,
+                "out_features": module.out_features, "num_gaussians": module.num_gaussians}
+    if isinstance(module, nn.Linear):
+        return {"type": "Linear", "in_features": module.in_features,
+                "out_features": module.out_features, "bias": module.bias is not None}
+    if isinstance(module, nn.Dropout):
+        return {"type": "Dropout", "p": module.p}
+    if isinstance(module, nn.Softmax):
+        return {"type": "Softmax", "dim": module.dim}
+    if type(module) in (nn.Tanh, nn.ReLU, nn.Sigmoid):
+        return {"type": type(module).__name__}
+    return None
+
+
+def build_module(arch: dict) -> nn.Module:
+    from dbestclient.ml.mdn import MDN
+
+    if arch["type"] == "Sequential":
+        return nn.Sequential(*[build_module(layer) for layer in arch["layers"]])
+    if arch["type"] == "MDN":
+        return MDN(arch["in_features"], arch["out_features"], arch["num_gaussians"], "cpu")
+    if arch["type"] == "Linear":
+        return nn.Linear(arch["in_features"], arch["out_features"], bias=arch["bias"])
+    if arch["type"] == "Dropout":
+        return nn.Dropout(arch["p"])
+    if arch["type"] == "Softmax":
+        return nn.Softmax(dim=arch["dim"])
+    return getattr(nn, arch["type"])()
+
+
+class ModelReader:
+    """decode a model from the columnar format."""
+
+    def __init__(self, path: str, mmap_mode="r"):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.memo = {}
+
+    def read(self):
+        with open(os.path.join(self.path, HEADER_FILE), "r") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError("Not a DBEst model: " + self.path)
+        if header["version"] > FORMAT_VERSION:
+            raise ValueError("The model is written by a newer version of DBEst, version "
+                             + str(header["version"]) + ": " + self.path)
+        return self.decode(header["root"])
+
+    def load_array(self, file_name: str):
+        return np.load(os.path.join(self.path, file_name), mmap_mode=self.mmap_mode, allow_pickle=False)
+
+    def decode(self, value):
+        if not isinstance(value, dict):
+            return value
+        kind = value["kind"]
+        if kind == "scalar":
+            return np.array(value["value"], dtype=value["dtype"])[()]
+        if kind == "ref":
+            return self.memo[value["id"]]
+
+        if kind == "ndarray":
+            obj = self.load_array(value["file"])
+        elif kind == "ndarray_object":
+            obj = np.empty(len(value["items"]), dtype=object)
+            obj[:] = [self.decode(i) for i in value["items"]]
+            obj = obj.reshape(value["shape"])
+        elif kind == "tensor":
+            obj = torch.from_numpy(np.array(self.load_array(value["file"])))
+        elif kind in ("list_array", "tuple_array"):
+            obj = self.load_array(value["file"]).tolist()
+            if kind == "tuple_array":
+                obj = tuple(obj)
+        elif kind == "list":
+            obj = []
+            self.memo[value["id"]] = obj
+            obj.extend(self.decode(i) for i in value["items"])
+        elif kind == "tuple":
+            obj = tuple(self.decode(i) for i in value["items"])
+        elif kind == "table":
+            obj = dict(zip(self.load_array(value["keys"]).tolist(),
+                           self.load_array(value["values"]).tolist()))
+        elif kind == "vector_table":
+            vectors = self.load_array(value["values"])
+            obj = dict(zip(self.load_array(value["keys"]).tolist(), vectors))
+        elif kind == "dict":
+            obj = {}
+            self.memo[value["id"]] = obj
+            for k, v in zip(value["keys"], value["values"]):
+                obj[self.decode(k)] = self.decode(v)
+        elif kind == "module":
+            obj = build_module(value["arch"])
+            obj.load_state_dict({key: torch.from_numpy(np.array(self.load_array(file_name)))
+                                 for key, file_name in value["state"].items()})
+            obj.train(value["training"])
+        elif kind == "onehot":
+            categories = []
+            for c in value["categories"]:
+                if "values" not in c:  # the categories of the first models of this format are text.
+                    categories.append(np.asarray(self.decode(c)))
+                elif c["object"]:
+                    categories.append(np.asarray(self.decode(c["values"])).astype(object))
+                else:
+                    categories.append(np.asarray(self.decode(c["values"])))
+            kwargs = {"sparse_output" if hasattr(OneHotEncoder(), "sparse_output") else "sparse":
+                      value.get("sparse_output", True)}
+            obj = OneHotEncoder(categories=categories, handle_unknown=value["handle_unknown"],
+                                dtype=np.dtype(value.get("dtype", "float64")), **kwargs)
+            row = np.empty((1, len(categories)), dtype=object)
+            row[0] = [c[0] for c in categories]
+            obj.fit(row if any(c.dtype == object for c in categories) else row.astype(np.result_type(*categories)))
+        elif kind == "object":
+            cls = load_class(value["class"])
+            obj = cls.__new__(cls)
+            # register before decoding the state, for objects referring to themselves.
+            self.memo[value["id"]] = obj
+            state = self.decode(value["state"])
+            if hasattr(obj, "__setstate__"):
+                obj.__setstate__(state)
+            elif state:
+                obj.__dict__.update(state)
+        elif kind == "blob":
+            with open(os.path.join(self.path, value["file"]), "rb") as f:
+                obj = dill.load(f)
+        else:
+            raise ValueError("Unknown kind " + kind + " in model " + self.path)
+        self.memo[value["id"]] = obj
+        return obj
+
+
+def get_onehot_sparse(enc: OneHotEncoder) -> bool:
+    """whether a one-hot encoder returns sparse matrices. The setting was renamed in scikit-learn 1.2."""
+    return bool(getattr(enc, "sparse_output", getattr(enc, "sparse", True)))
+
+
+def save_model(model, path: str):
+    """save a model to the warehouse, replacing the previous version if any.
+
+    Args:
+        model (GenericQueryEngine): the model.
+        path (str): the model directory.
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    ModelWriter(tmp_path).write(model)
+    remove_model_file(path)
+    os.rename(tmp_path, path)
+
+
+def load_model(path: str):
+    """load a model, in either the columnar format or the legacy dill format.
+
+    Args:
+        path (str): the model directory, or the legacy .dill file.
+
+    Returns:
+        GenericQueryEngine: the model.
+    """
+    if os.path.isdir(path):
+        return ModelReader(path).read()
+    with open(path, "rb") as f:
+        return dill.load(f)
+
+
+def remove_model_file(path: str):
+    """remove a model from the disk, in either format."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def get_model_size(path: str) -> int:
+    """the size of a model on the disk, in bytes."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, files in os.walk(path) for file_name in files)
+    return os.path.getsize(path)
@@ -4,8 +4,10 @@
 # the University of Warwick
 # Q.Ma.2@warwick.ac.uk
 
+import glob
 import os
 import os.path
+import threading
 import warnings
 from datetime import datetime
 from multiprocessing import set_start_method as set_start_method_cpu
@@ -28,7 +30,11 @@ from dbestclient.executor.queryenginemdn import (
     MdnQueryEngineXCategoricalOneModel,
     QueryEngineFrequencyTable,
 )
-from dbestclient.io.sampling import DBEstSampling
+from dbestclient.executor.workerpool import WorkerPool
+from dbestclient.io.columnar import is_columnar
+from dbestclient.io.reservoir import is_stream
+from dbestclient.io.samplestore import SampleStore
+from dbestclient.io.sampling import DBEstSampling, is_partitioned, shared_scan
 from dbestclient.ml.modeltrainer import GroupByModelTrainer, KdeModelTrainer
 from dbestclient.parser.parser import (
     DBEstParser,
@@ -51,10 +57,18 @@ class SqlExecutor:
 
     def __init__(self):
         self.parser = None
+        # serializes the queries other than SELECT, see execute().
+        self.lock = threading.RLock()
         self.config = DbestConfig()  # model-related configuration
         self.runtime_config = RUNTIME_CONF
         self.last_config = None
+        # set by execute_batch(): the samplers waiting for a shared scan, per file.
+        self.shared_scan = None
+        self.shared_samplers = {}  # the samplers fed by the shared scan, per model.
         self.model_catalog = DBEstModelCatalog()
+        # long-lived workers for parallel predictions, shared by all queries.
+        self.worker_pool = WorkerPool()
+        self.runtime_config["worker_pool"] = self.worker_pool
         self.init_slaves()
         self.init_model_catalog()
 
@@ -64,27 +78,13 @@ class SqlExecutor:
         self.use_kde = True
 
     def init_model_catalog(self):
-        # search the warehouse, and add all available models.
-        n_model = 0
+        # read the warehouse manifest, models are loaded on first use.
         t1 = datetime.now()
-        for file_name in os.listdir(self.config.get_config()["warehousedir"]):
-            # load simple models
-            if file_name.endswith(self.runtime_config["model_suffix"]):
-                if n_model == 0:
-                    print("start loading pre-existing models.")
-
-                with open(
-                    self.config.get_config()["warehousedir"] + "/" + file_name, "rb"
-                ) as f:
-                    model = dill.load(f)
-                self.model_catalog.model_catalog[
-                    file_name
-                    # model.init_pickle_file_name(self.runtime_config)
-                ] = model
-                n_model += 1
+        n_model = self.model_catalog.load_manifest(
+            self.config.get_config()["warehousedir"], self.runtime_config)
 
         if n_model > 0:
-            print("Loaded " + str(n_model) + " models.", end=" ")
+            print("Found " + str(n_model) + " models.", end=" ")
             if self.runtime_config["b_show_latency"]:
                 t2 = datetime.now()
                 print("time cost ", (t2 - t1).total_seconds(), "s")
@@ -108,16 +108,76 @@ class SqlExecutor:
                 print("Local mode is on, as no slaves are provided.")
 
     def execute(self, sql):
-        # prepare the parser
+        # prepare the parser, each query has its own one.
         if type(sql) == str:
-            self.parser = DBEstParser()
-            self.parser.parse(sql)
+            parser = DBEstParser()
+            parser.parse(sql)
         elif type(sql) == DBEstParser:
-            self.parser = sql
+            parser = sql
         else:
             print("Unrecognized SQL! Please check it!")
             exit(-1)
 
+        # several SELECT can run at the same time, each with a copy of the runtime configuration. The
+        # other queries change the configuration, the catalog or the warehouse, and are serialized.
+        if not parser.if_nested_query() and parser.get_query_type() == "select":
+            return self.execute_select(parser)
+        with self.lock:
+            self.parser = parser
+            return self.execute_parsed()
+
+    def execute_batch(self, sqls):
+        """execute several CREATE queries, with the samples of the models built on the same file
+        made by a single scan of it, instead of one scan per model.
+
+        Args:
+            sqls (list): the CREATE queries, as str or DBEstParser.
+
+        Raises:
+            ValueError: if a query is not a CREATE query.
+
+        Returns:
+            list: the results of the queries.
+        """
+        parsers = []
+        for sql in sqls:
+            if type(sql) == str:
+                parser = DBEstParser()
+                parser.parse(sql)
+            else:
+                parser = sql
+            if parser.if_nested_query() or parser.get_query_type() != "create":
+                raise ValueError("only CREATE queries can be batched.")
+            parsers.append(parser)
+
+        with self.lock:
+            # each CREATE resets the configuration, so all of them use the one set before the batch.
+            config = self.last_config
+            self.shared_scan = {}
+            try:
+                for parser in parsers:
+                    self.parser = parser
+                    self.last_config = config
+                    self.execute_parsed()
+                split_char = (config or DbestConfig()).get_config()["csv_split_char"]
+                b_skip_first_row = (config or DbestConfig()).get_config()["table_header"] is None
+                for file, samplers in self.shared_scan.items():
+                    print("Scanning " + file + " for " + str(len(samplers)) + " models...")
+                    shared_scan(file, samplers, split_char=split_char, b_skip_first_row=b_skip_first_row)
+            finally:
+                self.shared_scan = None
+
+            results = []
+            try:
+                for parser in parsers:
+                    self.parser = parser
+                    self.last_config = config
+                    results.append(self.execute_parsed())
+            finally:
+                self.shared_samplers = {}
+            return results
+
+    def execute_parsed(self):
         # execute the query
         if self.parser.if_nested_query():
             warnings.warn("Nested query is currently not supported!")
@@ -137,6 +197,10 @@ class SqlExecutor:
                 tbl = tbl.replace("'", "")
                 if os.path.isfile(tbl):  # the absolute path is provided
                     original_data_file = tbl
+                elif is_partitioned(tbl) and glob.glob(tbl):  # the partitions, as 'dir/*.dat'
+                    original_data_file = tbl
+                elif is_stream(tbl):  # the standard input, as '-'
+                    original_data_file = tbl
                 else:  # the file is in the warehouse direcotry
                     original_data_file = (
                         self.config.get_config()["warehousedir"] + "/" + tbl
@@ -192,11 +256,8 @@ class SqlExecutor:
                         warehouse=self.config.get_config()["warehousedir"]
                     )
 
-                if os.path.exists(
-                    os.path.join(
-                        self.config.get_config()["warehousedir"],
-                        mdl + self.runtime_config["model_suffix"],
-                    )
+                if self.model_catalog.has_model(
+                    mdl + self.runtime_config["model_suffix"]
                 ):
                     print(
                         "Model {0} exists in the warehouse, please use"
@@ -204,6 +265,19 @@ class SqlExecutor:
                     )
                     return
 
+                if self.shared_scan is not None:
+                    # planning a batch, the sample is made later by a scan shared with the other models.
+                    if sampler.prepare_shared_scan(
+                        original_data_file, ratio, method, split_char=self.config.get_config()["csv_split_char"],
+                        num_total_records=self.n_total_records,
+                        source_format=self.config.get_config()["source_format"],
+                    ):
+                        self.shared_scan.setdefault(original_data_file, []).append(sampler)
+                        self.shared_samplers[mdl] = sampler
+                    return
+                if mdl in self.shared_samplers:
+                    sampler = self.shared_samplers.pop(mdl)
+
                 print("Start creating model " + mdl)
                 time1 = datetime.now()
 
@@ -219,6 +293,8 @@ class SqlExecutor:
                         + mdl
                         + ".csv",
                         num_total_records=self.n_total_records,
+                        b_line_index=self.runtime_config["b_line_index"],
+                        source_format=self.config.get_config()["source_format"],
                     )
                 else:
                     sampler.make_sample(
@@ -227,6 +303,8 @@ class SqlExecutor:
                         method,
                         split_char=self.config.get_config()["csv_split_char"],
                         num_total_records=self.n_total_records,
+                        b_line_index=self.runtime_config["b_line_index"],
+                        source_format=self.config.get_config()["source_format"],
                     )
                 
                 if self.runtime_config["sampling_only"]:
@@ -268,6 +346,9 @@ class SqlExecutor:
 
                 else:  # if group by is involved in the query
                     if self.config.get_config()["reg_type"] == "qreg":
+                        if is_partitioned(original_data_file) or is_stream(original_data_file) or \
+                                is_columnar(original_data_file, self.config.get_config()["source_format"]):
+                            raise ValueError("qreg models only support delimited text files.")
                         xys = sampler.getyx(yheader, xheader_continous)
                         n_total_point = get_group_count_from_table(
                             original_data_file,
@@ -740,108 +821,6 @@ class SqlExecutor:
                 self.last_config = None
                 return
 
-            elif sql_type == "select":  # process SELECT query
-                start_time = datetime.now()
-                predictions = None
-                # DML, provide the prediction using models
-                mdl = self.parser.get_from_name()
-                gb_to_print, [
-                    func,
-                    yheader,
-                    distinct_condition,
-                ] = self.parser.get_dml_aggregate_function_and_variable()
-                # for query with WHERE clause containing range selector
-                if (
-                    self.parser.if_where_exists()
-                    and self.parser.get_dml_where_categorical_equal_and_range()[2]
-                ):
-
-                    print("OK")
-                    where_conditions = (
-                        self.parser.get_dml_where_categorical_equal_and_range()
-                    )
-
-                    if (
-                        mdl + self.runtime_config["model_suffix"] 
-                        not in self.model_catalog.model_catalog
-                    ):
-                        print("Model " + mdl + " does not exist.")
-                        return
-                    model = self.model_catalog.model_catalog[
-                        mdl + self.runtime_config["model_suffix"]
-                    ]
-                    x_header_density = model.density_column
-
-                    [x_lb, x_ub] = [
-                        where_conditions[2][x_header_density][i] for i in [0, 1]
-                    ]
-                    filter_dbest = dict(where_conditions[2])
-                    filter_dbest = [
-                        filter_dbest[next(iter(filter_dbest))][i] for i in [0, 1]
-                    ]
-
-                    predictions = model.predicts(
-                        func,
-                        x_lb,
-                        x_ub,
-                        where_conditions,
-                        self.runtime_config,
-                        groups=None,
-                        filter_dbest=filter_dbest,
-                    )
-
-                elif func == "var":
-                    print("var!!")
-                    model = self.model_catalog.model_catalog[
-                        mdl + self.runtime_config["model_suffix"]
-                    ]
-                    x_header_density = model.density_column
-                    predictions = model.predicts(
-                        "var", runtime_config=self.runtime_config
-                    )
-                    # return predictions
-                else:  # for query without WHERE range selector clause
-                    print("OK")
-                    where_conditions = (
-                        self.parser.get_dml_where_categorical_equal_and_range()
-                    )
-                    if (
-                        mdl + self.runtime_config["model_suffix"]
-                        not in self.model_catalog.model_catalog
-                    ):
-                        print("Model " + mdl + " does not exist.")
-                        return
-                    model = self.model_catalog.model_catalog[
-                        mdl + self.runtime_config["model_suffix"]
-                    ]
-                    predictions = model.predicts(
-                        func,
-                        None,
-                        None,
-                        where_conditions,
-                        self.runtime_config,
-                        groups=None,
-                        filter_dbest=None,
-                    )
-
-                if self.runtime_config["b_print_to_screen"]:
-                    # print(predictions.to_csv(sep=',', index=False))  # sep='\t'
-                    print(predictions.to_string(index=False))  # max_rows=5
-
-                if self.runtime_config["result2file"]:
-                    predictions.to_csv(self.runtime_config["result2file"],header=False, sep=',', index=False, quoting=csv.QUOTE_NONE, quotechar="",  escapechar=" ")
-                    # print(predictions.to_csv(sep=',', index=False))  # sep='\t'
-                    # with open(self.runtime_config["result2file"],'w') as f:
-                    #     out = 
-                    #     f.write(predictions.to_string(index=False))  # max_rows=5
-
-                if self.runtime_config["b_show_latency"]:
-                    end_time = datetime.now()
-                    time_cost = (end_time - start_time).total_seconds()
-                    print("Time cost: %.4fs." % time_cost)
-                print("------------------------")
-                return predictions
-
             elif sql_type == "set":  # process SET query
                 if self.last_config:
                     self.config = self.last_config
@@ -858,6 +837,17 @@ class SqlExecutor:
                                 print(
                                     "encoder is not set to a proper value, use default encoding type: binary."
                                 )
+                        if key.lower() == "source_format":
+                            value = str(value).lower()
+                            if value not in ["csv", "parquet", "arrow", "npy"]:
+                                value = None
+                                print(
+                                    "source_format is not set to a proper value, the format is given by the file extension."
+                                )
+                        if key.lower() in ["train_time_budget", "early_stopping_patience"]:
+                            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                                value = None
+                                print(key + " is not set to a number, it is turned off.")
 
                         self.config.get_config()[key] = value
                         print("OK, " + key + " is updated.")
@@ -907,12 +897,13 @@ class SqlExecutor:
 
             elif sql_type == "drop":  # process DROP query
                 model_name = self.parser.drop_get_model()
-                model_path = os.path.join(
-                    self.config.get_config()["warehousedir"],
-                    model_name + self.runtime_config["model_suffix"],
-                )
-                if os.path.isfile(model_path):
-                    os.remove(model_path)
+                if self.model_catalog.remove_model(
+                    model_name + self.runtime_config["model_suffix"]
+                ):
+                    self.worker_pool.unregister(
+                        model_name + self.runtime_config["model_suffix"])
+                    # the samples no other model uses are removed as well.
+                    SampleStore(self.config.get_config()["warehousedir"]).release(model_name)
                     print("OK. model is dropped.")
                     return True
                 else:
@@ -922,7 +913,8 @@ class SqlExecutor:
                 print("OK")
                 t_start = datetime.now()
                 if self.runtime_config["b_print_to_screen"]:
-                    for key in self.model_catalog.model_catalog:
+                    # only the manifest is read, no model is loaded.
+                    for key in self.model_catalog.get_model_names():
                         print(key.replace(self.runtime_config["model_suffix"], ""))
                 if self.runtime_config["v"]:
                     t_end = datetime.now()
@@ -932,5 +924,116 @@ class SqlExecutor:
                 print("Unsupported query type, please check your SQL.")
                 return
 
+    def execute_select(self, parser):
+        """answer a SELECT query. It is safe to call concurrently: the models, their parameter caches
+        and the worker pool may be used by several threads.
+
+        Args:
+            parser (DBEstParser): the parsed query.
+
+        Returns:
+            pd.DataFrame: the predictions.
+        """
+        # a copy, as the engines write to it.
+        runtime_config = dict(self.runtime_config)
+        start_time = datetime.now()
+        predictions = None
+        # DML, provide the prediction using models
+        mdl = parser.get_from_name()
+        gb_to_print, [
+            func,
+            yheader,
+            distinct_condition,
+        ] = parser.get_dml_aggregate_function_and_variable()
+        # for query with WHERE clause containing range selector
+        if (
+            parser.if_where_exists()
+            and parser.get_dml_where_categorical_equal_and_range()[2]
+        ):
+
+            print("OK")
+            where_conditions = (
+                parser.get_dml_where_categorical_equal_and_range()
+            )
+
+            if not self.model_catalog.has_model(
+                mdl + runtime_config["model_suffix"]
+            ):
+                print("Model " + mdl + " does not exist.")
+                return
+            model = self.model_catalog.get_model(
+                mdl + runtime_config["model_suffix"], runtime_config
+            )
+            x_header_density = model.density_column
+
+            [x_lb, x_ub] = [
+                where_conditions[2][x_header_density][i] for i in [0, 1]
+            ]
+            filter_dbest = dict(where_conditions[2])
+            filter_dbest = [
+                filter_dbest[next(iter(filter_dbest))][i] for i in [0, 1]
+            ]
+
+            predictions = model.predicts(
+                func,
+                x_lb,
+                x_ub,
+                where_conditions,
+                runtime_config,
+                groups=None,
+                filter_dbest=filter_dbest,
+            )
+
+        elif func == "var":
+            print("var!!")
+            model = self.model_catalog.get_model(
+                mdl + runtime_config["model_suffix"], runtime_config
+            )
+            x_header_density = model.density_column
+            predictions = model.predicts(
+                "var", runtime_config=runtime_config
+            )
+            # return predictions
+        else:  # for query without WHERE range selector clause
+            print("OK")
+            where_conditions = (
+                parser.get_dml_where_categorical_equal_and_range()
+            )
+            if not self.model_catalog.has_model(
+                mdl + runtime_config["model_suffix"]
+            ):
+                print("Model " + mdl + " does not exist.")
+                return
+            model = self.model_catalog.get_model(
+                mdl + runtime_config["model_suffix"], runtime_config
+            )
+            predictions = model.predicts(
+                func,
+                None,
+                None,
+                where_conditions,
+                runtime_config,
+                groups=None,
+                filter_dbest=None,
+            )
+
+        if runtime_config["b_print_to_screen"]:
+            # print(predictions.to_csv(sep=',', index=False))  # sep='\t'
+            print(predictions.to_string(index=False))  # max_rows=5
+
+        if runtime_config["result2file"]:
+            predictions.to_csv(runtime_config["result2file"],header=False, sep=',', index=False, quoting=csv.QUOTE_NONE, quotechar="",  escapechar=" ")
+            # print(predictions.to_csv(sep=',', index=False))  # sep='\t'
+            # with open(runtime_config["result2file"],'w') as f:
+            #     out = 
+            #     f.write(predictions.to_string(index=False))  # max_rows=5
+
+        if runtime_config["b_show_latency"]:
+            end_time = datetime.now()
+            time_cost = (end_time - start_time).total_seconds()
+            print("Time cost: %.4fs." % time_cost)
+        print("------------------------")
+        return predictions
+
     def set_table_counts(self, dic):
         self.n_total_records = dic
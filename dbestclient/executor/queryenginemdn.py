@@ -5,21 +5,25 @@
 # Q.Ma.2@warwick.ac.uk
 
 import math
+import os
 from collections import Counter
 from datetime import datetime
 from multiprocessing import Pool as PoolCPU
-from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 
-import dill
 import numpy as np
 import pandas as pd
+from dbestclient.catalog.modelformat import save_model
+from dbestclient.executor.workerpool import WorkerPool
 # from dbestclient.io.sampling import DBEstSampling
 from dbestclient.ml.integral import (approx_avg, approx_count,
                                      approx_integrate, approx_sum,
+                                     prepare_density_cdf,
                                      prepare_reg_density_data, prepare_var)
-from dbestclient.ml.mdn import KdeMdn, RegMdnGroupBy
+from dbestclient.ml.mdn import (KdeMdn, RegMdnGroupBy, encode_groups,
+                                fit_encoder)
 from dbestclient.ml.modeltrainer import KdeModelTrainer
+from dbestclient.ml.trainingscheduler import TrainingScheduler
 from dbestclient.socket import app_client
 from dbestclient.tools.running_parameters import shrink_runtime_config
 from scipy import integrate
@@ -41,13 +45,58 @@ from torch.multiprocessing import Pool as PoolGPU
 #           "for more info.)")
 
 
+def predicts_with_worker_pool(model, n_jobs: int, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, group_chunks: list, filter_dbest=None) -> list:
+    """make predictions for the chunks of groups in parallel, using the worker pool owned by the executor.
+    If no worker pool is provided, a temporary one is used for this query.
+
+    Returns:
+        list: the predictions of each chunk.
+    """
+    runtime_config_process = shrink_runtime_config(runtime_config)
+    if runtime_config.get("worker_pool") is not None:
+        return runtime_config["worker_pool"].predicts(
+            n_jobs, model.mdl_name + runtime_config["model_suffix"], model, func, x_lb, x_ub,
+            x_categorical_conditions, runtime_config_process, group_chunks, filter_dbest)
+    worker_pool = WorkerPool()
+    try:
+        return worker_pool.predicts(
+            n_jobs, model.mdl_name + runtime_config["model_suffix"], model, func, x_lb, x_ub,
+            x_categorical_conditions, runtime_config_process, group_chunks, filter_dbest)
+    finally:
+        worker_pool.close()
+
+
+def fit_shared_encoder(config, gbs, xs, ys, usecols: dict, runtime_config: dict):
+    """fit the encoder of the groups once for a model, and encode the training groups once, for both
+    the density and the regression networks.
+
+    Args:
+        config (DbestConfig): the model configuration.
+        gbs (np.ndarray): the group by values.
+        xs (np.ndarray): the x points.
+        ys (np.ndarray): the y points.
+        usecols (dict): the columns.
+        runtime_config (dict): the runtime configuration.
+
+    Returns:
+        tuple: the encoder and the encoded groups, (None, None) if the model uses no encoder.
+    """
+    encoder = config.config["encoder"]
+    if encoder not in ["onehot", "binary", "embedding"]:
+        return None, None
+    if runtime_config['v']:
+        print("fitting the " + encoder + " encoder...")
+    enc = fit_encoder(config, gbs, xs, ys, usecols)
+    return enc, encode_groups(enc, encoder, gbs, b_sparse=True)
+
+
 class GenericQueryEngine:
     def __init__(self):
         self.mdl_name = None
 
     def serialize2warehouse(self, warehouse, runtime_config):
-        with open(warehouse + '/' + self.mdl_name + runtime_config["model_suffix"], 'wb') as f:
-            dill.dump(self, f)
+        save_model(self, os.path.join(
+            warehouse, self.mdl_name + runtime_config["model_suffix"]))
 
     def init_pickle_file_name(self, runtime_config):
         return self.mdl_name+runtime_config["model_suffix"]
@@ -197,17 +246,26 @@ class MdnQueryEngineRangeNoCategorical(GenericQueryEngine):
             raise ValueError("Method not implemented.")
         else:
             config = self.config.copy()
+            # one encoder of the groups, shared by the regression and the density.
+            enc, zs_encoded = fit_shared_encoder(config, gbs_data, xs_data, ys_data, usecols, runtime_config)
             if runtime_config['v']:
                 print("training regression...")
             self.reg = RegMdnGroupBy(config, b_store_training_data=False).fit(
-                gbs_data, xs_data, ys_data, runtime_config,usecols=usecols)
+                gbs_data, xs_data, ys_data, runtime_config, usecols=usecols, enc=enc, zs_encoded=zs_encoded)
 
             if runtime_config['v']:
                 print("training density...")
             self.kde = KdeMdn(config, b_store_training_data=False).fit(
-                gbs_data, xs_data, runtime_config)
+                gbs_data, xs_data, runtime_config, enc=enc, zs_encoded=zs_encoded)
         return self
 
+    def serialize2warehouse(self, warehouse, runtime_config):
+        # store the mixture parameters of all groups along with the model.
+        self.kde.cache_parameters(
+            [g.split(",") for g in self.groupby_values], runtime_config, b_skip_unknown=True)
+        save_model(self, os.path.join(
+            warehouse, self.mdl_name + runtime_config["model_suffix"]))
+
     def predicts(self, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, groups: list = None, filter_dbest=None):
         b_print_to_screen = runtime_config["b_print_to_screen"]
         result2file = runtime_config["result2file"]
@@ -281,22 +339,25 @@ class MdnQueryEngineRangeNoCategorical(GenericQueryEngine):
                 # print("self.n_total_point", self.n_total_point)
                 # print("groups", groups)
                 # exit()
-                pre_density, pre_reg, step = prepare_reg_density_data(
-                    self.kde, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
-                # print("pre_density, pre_reg", pre_density,)
-                # print(pre_reg)
-                # exit()
-
                 if func.lower() == "count":
-                    preds = approx_count(pre_density, step)
+                    # closed-form CDF of the mixtures, no mesh is needed.
+                    preds = prepare_density_cdf(
+                        self.kde, x_lb, x_ub, groups=groups, runtime_config=runtime_config)
                     preds = np.multiply(preds, scaling_factor)
-                elif func.lower() == "sum":
-                    preds = approx_sum(pre_density, pre_reg, step)
-                    preds = np.multiply(preds, scaling_factor)
-                elif func.lower() == "avg":  # avg
-                    preds = approx_avg(pre_density, pre_reg, step)
                 else:
-                    raise TypeError("wrong aggregate!")
+                    pre_density, pre_reg, step = prepare_reg_density_data(
+                        self.kde, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
+                    # print("pre_density, pre_reg", pre_density,)
+                    # print(pre_reg)
+                    # exit()
+
+                    if func.lower() == "sum":
+                        preds = approx_sum(pre_density, pre_reg, step)
+                        preds = np.multiply(preds, scaling_factor)
+                    elif func.lower() == "avg":  # avg
+                        preds = approx_avg(pre_density, pre_reg, step)
+                    else:
+                        raise TypeError("wrong aggregate!")
                 results = zip(groups, preds)
 
                 # print("results", preds)
@@ -474,8 +535,6 @@ class MdnQueryEngineNoRangeCategoricalOneModel(GenericQueryEngine):
 
 
 class MdnQueryEngine(GenericQueryEngine):
-    t_before_multiple_processing = None
-
     def __init__(self, kdeModelWrapper, config):
         super().__init__()
         # self.n_training_point = kdeModelWrapper.n_sample_point
@@ -632,11 +691,7 @@ class MdnQueryEngine(GenericQueryEngine):
     #                 f.write(key + "," + str(predictions[key]))
     #     return predictions, times
 
-    def predicts(self, func: str, x_lb: float = None, x_ub: float = None,  x_categorical_conditions=None, runtime_config=None, groups: list = None, filter_dbest=None, time2exclude_from_multiprocessing=None):
-        if time2exclude_from_multiprocessing is not None:
-            t_after_multiple_processing = datetime.now()
-            print("should reduce time {} from the query response time.".format(
-                (t_after_multiple_processing - time2exclude_from_multiprocessing).total_seconds()))
+    def predicts(self, func: str, x_lb: float = None, x_ub: float = None,  x_categorical_conditions=None, runtime_config=None, groups: list = None, filter_dbest=None):
         b_print_to_screen = runtime_config["b_print_to_screen"]
         # n_division = runtime_config["n_division"]
         result2file = runtime_config["result2file"]
@@ -739,22 +794,25 @@ class MdnQueryEngine(GenericQueryEngine):
                 # print("self.n_total_point", self.n_total_point)
                 # exit()
                 # print("groups", groups)
-                pre_density, pre_reg, step = prepare_reg_density_data(
-                    self.kde, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
-                # print("pre_density, pre_reg", pre_density,)
-                # print(pre_reg)
-                # exit()
-
                 if func.lower() == "count":
-                    preds = approx_count(pre_density, step)
+                    # closed-form CDF of the mixtures, no mesh is needed.
+                    preds = prepare_density_cdf(
+                        self.kde, x_lb, x_ub, groups=groups, runtime_config=runtime_config)
                     preds = np.multiply(preds, scaling_factor)
-                elif func.lower() == "sum":
-                    preds = approx_sum(pre_density, pre_reg, step)
-                    preds = np.multiply(preds, scaling_factor)
-                elif func.lower() == "avg":  # avg
-                    preds = approx_avg(pre_density, pre_reg, step)
                 else:
-                    raise TypeError("wrong aggregate!")
+                    pre_density, pre_reg, step = prepare_reg_density_data(
+                        self.kde, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
+                    # print("pre_density, pre_reg", pre_density,)
+                    # print(pre_reg)
+                    # exit()
+
+                    if func.lower() == "sum":
+                        preds = approx_sum(pre_density, pre_reg, step)
+                        preds = np.multiply(preds, scaling_factor)
+                    elif func.lower() == "avg":  # avg
+                        preds = approx_avg(pre_density, pre_reg, step)
+                    else:
+                        raise TypeError("wrong aggregate!")
                 # results = dict(zip(groups, preds))
                 results = zip(groups, preds)
                 # columns=[self.usecols['gb'] +[self.usecols['y'][0]]]
@@ -767,63 +825,17 @@ class MdnQueryEngine(GenericQueryEngine):
                     runtime_config)
                 # use multi-processing to achieve parallel
                 if runtime_config["slaves"].is_empty():
-                    instances = []
-                    results = {}
-                    # print("n_jobs,", n_jobs)
                     n_per_chunk = math.ceil(len(groups)/n_jobs)
                     group_chunks = [groups[i:i+n_per_chunk]
                                     for i in range(0, len(groups), n_per_chunk)]
-                    # print("create Pool...", datetime.now())
-                    if runtime_config["device"] == "cpu":
-                        pool = PoolCPU(processes=n_jobs)
-                    else:
-                        pool = PoolGPU(processes=n_jobs)
-                        # from torch.multiprocessing import Pool, set_start_method
-                        # try:
-                        #     set_start_method('spawn')
-                        # except RuntimeError:
-                        #     print("Fail to set start method as spawn for pytorch multiprocessing, " +
-                        #           "use default in advance. (see queryenginemdn "
-                        #           "for more info.)")
-
-                    # with Pool(processes=n_jobs) as pool:
-                    # print(self.group_keys_chunk)
-
-                    time2exclude_from_multiprocessing = datetime.now()
-
-                    for sub_group in group_chunks:
-
-                        i = pool.apply_async(
-                            self.predicts, (func, x_lb, x_ub, x_categorical_conditions, runtime_config_process, sub_group, filter_dbest, time2exclude_from_multiprocessing))
-                        instances.append(i)
-
-                    for i in instances:
-                        result = i.get()
-                        results.update(result)
+                    results = predicts_with_worker_pool(
+                        self, n_jobs, func, x_lb, x_ub, x_categorical_conditions, runtime_config, group_chunks, filter_dbest)
+                    return pd.concat(results, ignore_index=True)
                 else:  # slaves are used
-                    slaves = runtime_config["slaves"]
-                    instances = []
-                    results = {}
-                    n_jobs = slaves.size()
-                    n_per_chunk = math.ceil(len(groups)/n_jobs)
-                    group_chunks = [groups[i:i+n_per_chunk]
-                                    for i in range(0, len(groups), n_per_chunk)]
-
-                    pool = ThreadPool(processes=n_jobs)
-                    hosts = slaves.get()
-                    for sub_group, host in zip(group_chunks, hosts):
-                        # print("host", host)
-                        query = dict(func=func, x_lb=x_lb, x_ub=x_ub, x_categorical_conditions=x_categorical_conditions, runtime_config=runtime_config_process,
-                                     sub_group=sub_group, filter_dbest=filter_dbest, mdl_name=self.mdl_name+runtime_config["model_suffix"])
-                        i = pool.apply_async(
-                            app_client.run, (hosts[host].host, hosts[host].port, "select", query))
-                        instances.append(i)
-
-                    for i in instances:
-                        result = i.get()
-                        results.update(result)
-                        # result = app_client.run(
-                        #     host, slaves.get()[host], "select", query)
+                    # the chunks are sized by the coordinator, from the throughput of each slave.
+                    return app_client.client.scatter(
+                        runtime_config["slaves"], self.mdl_name+runtime_config["model_suffix"], func, x_lb, x_ub,
+                        x_categorical_conditions, runtime_config_process, groups, filter_dbest)
 
         elif func.lower() == "var":
             print("predict var")
@@ -845,8 +857,11 @@ class MdnQueryEngine(GenericQueryEngine):
         return results
 
     def serialize2warehouse(self, warehouse, runtime_config):
-        with open(warehouse + '/' + self.mdl_name + runtime_config["model_suffix"], 'wb') as f:
-            dill.dump(self, f)
+        # store the mixture parameters of all groups along with the model.
+        self.kde.cache_parameters(
+            [str(g).split(",") for g in self.groupby_values], runtime_config, b_skip_unknown=True)
+        save_model(self, os.path.join(
+            warehouse, self.mdl_name + runtime_config["model_suffix"]))
 
     def init_pickle_file_name(self, runtime_config):
         return self.mdl_name+runtime_config["model_suffix"]
@@ -995,6 +1010,9 @@ class MdnQueryEngineGoGs():
         # print(groups_chunk)
 
         # print(n_total_point)
+        # the networks of the chunks are independent, they are trained concurrently if n_jobs > 1.
+        scheduler = TrainingScheduler(runtime_config)
+        fit_runtime_config = scheduler.worker_runtime_config(len(self.group_keys_chunk))
         for index, [chunk_key, chunk_group] in enumerate(zip(self.group_keys_chunk, groups_chunk)):
             # print(index, chunk_key)
             # print("n_total_point", n_total_point)
@@ -1005,15 +1023,15 @@ class MdnQueryEngineGoGs():
             # print(n_total_point_chunk)#, chunk_group,chunk_group.dtypes)
             # print("n_total_point_chunk", n_total_point_chunk)
             # raise Exception()
-            print("Training network " + str(index) +
-                  " for group " + str(chunk_key))
             # print("n_total_point_chunk", n_total_point_chunk)
-            kdeModelWrapper = KdeModelTrainer(mdl, tbl, xheader, yheader, groupby_attribute=groupby_attribute,
-                                              groupby_values=chunk_key,
-                                              n_total_point=n_total_point_chunk,
-                                              x_min_value=-np.inf, x_max_value=np.inf, config=self.config).fit_from_df(
-                chunk_group, network_size="small", runtime_config=runtime_config)
-
+            trainer = KdeModelTrainer(mdl, tbl, xheader, yheader, groupby_attribute=groupby_attribute,
+                                      groupby_values=chunk_key,
+                                      n_total_point=n_total_point_chunk,
+                                      x_min_value=-np.inf, x_max_value=np.inf, config=self.config)
+            scheduler.submit("network " + str(index) + " for group " + str(chunk_key), trainer.fit_from_df,
+                             chunk_group, network_size="small", runtime_config=fit_runtime_config)
+
+        for index, kdeModelWrapper in enumerate(scheduler.run()):
             engine = MdnQueryEngine(
                 kdeModelWrapper, config=self.config.copy())
             self.enginesContainer[index] = engine
@@ -1067,8 +1085,8 @@ class MdnQueryEngineGoGs():
         if self.pickle_file_name is None:
             self.init_pickle_file_name(runtime_config)
 
-        with open(warehouse + '/' + self.init_pickle_file_name(runtime_config), 'wb') as f:
-            dill.dump(self, f)
+        save_model(self, os.path.join(
+            warehouse, self.init_pickle_file_name(runtime_config)))
 
 
 class MdnQueryEngineXCategorical(GenericQueryEngine):
@@ -1112,35 +1130,38 @@ class MdnQueryEngineXCategorical(GenericQueryEngine):
         encoding = self.config.get_config()["encoder"]
         b_grid_search = self.config.get_config()["b_grid_search"]
         # print("total_points", total_points)
-        idx = 0
-        for categorical_attributes in total_points:
-            print("start training  sub_model " +
-                  str(idx) + " for "+mdl_name+"...")
-            idx += 1
+        # the sub-models of the categorical values are independent, they are trained concurrently if n_jobs > 1.
+        scheduler = TrainingScheduler(runtime_config)
+        fit_runtime_config = scheduler.worker_runtime_config(len(total_points))
+        for idx, categorical_attributes in enumerate(total_points):
             # print("total_points", total_points)
             # print(list(total_points[categorical_attributes].keys()))
+            name = "sub_model " + str(idx) + " for " + mdl_name
             # GoG is not used, use kdeModelTrainer instead.
             if not self.config.get_config()["b_use_gg"]:
-                kdeModelWrapper = KdeModelTrainer(
+                trainer = KdeModelTrainer(
                     mdl_name, origin_table_name, usecols["x_continous"][0], usecols["y"],
                     groupby_attribute=usecols["gb"],
                     groupby_values=list(
                         total_points[categorical_attributes].keys()),
                     n_total_point=total_points[categorical_attributes],
                     x_min_value=-np.inf, x_max_value=np.inf,
-                    config=self.config).fit_from_df(
-                    # data[categorical_attributes]["data"], runtime_config=runtime_config, network_size="large",)
-                    data[categorical_attributes], runtime_config=runtime_config, network_size="large",)
-
-                qe_mdn = MdnQueryEngine(
-                    kdeModelWrapper, self.config.copy())
+                    config=self.config)
+                # data[categorical_attributes]["data"], runtime_config=runtime_config, network_size="large",)
+                scheduler.submit(name, trainer.fit_from_df, data[categorical_attributes],
+                                 runtime_config=fit_runtime_config, network_size="large")
             else:  # use GoGs
-                qe_mdn = MdnQueryEngineGoGs(
-                    config=self.config.copy()).fit(data[categorical_attributes], usecols["gb"],
-                                                   total_points[categorical_attributes], mdl_name, origin_table_name,
-                                                   usecols["x_continous"][0], usecols["y"],
-                                                   runtime_config)
+                scheduler.submit(name, MdnQueryEngineGoGs(config=self.config.copy()).fit,
+                                 data[categorical_attributes], usecols["gb"],
+                                 total_points[categorical_attributes], mdl_name, origin_table_name,
+                                 usecols["x_continous"][0], usecols["y"],
+                                 fit_runtime_config)
 
+        for categorical_attributes, fitted in zip(total_points, scheduler.run()):
+            if not self.config.get_config()["b_use_gg"]:
+                qe_mdn = MdnQueryEngine(fitted, self.config.copy())
+            else:
+                qe_mdn = fitted
             self.models[categorical_attributes] = qe_mdn
 
         # kdeModelWrapper.serialize2warehouse(
@@ -1230,8 +1251,8 @@ class MdnQueryEngineXCategorical(GenericQueryEngine):
         return predictions
 
     def serialize2warehouse(self, warehouse, runtime_config):
-        with open(warehouse + '/' + self.mdl_name + runtime_config["model_suffix"], 'wb') as f:
-            dill.dump(self, f)
+        save_model(self, os.path.join(
+            warehouse, self.mdl_name + runtime_config["model_suffix"]))
 
     def init_pickle_file_name(self, runtime_config):
         return self.mdl_name+runtime_config["model_suffix"]
@@ -1268,8 +1289,11 @@ class MdnQueryEngineXCategoricalOneModel(GenericQueryEngine):
         self.density_column = None
 
     def serialize2warehouse(self, warehouse, runtime_config):
-        with open(warehouse + '/' + self.mdl_name + runtime_config["model_suffix"], 'wb') as f:
-            dill.dump(self, f)
+        # store the mixture parameters of all groups along with the model.
+        self.density.cache_parameters(
+            [g.split(",") + key.split(",") for key in self.n_total_points for g in self.n_total_points[key]], runtime_config, b_skip_unknown=True)
+        save_model(self, os.path.join(
+            warehouse, self.mdl_name + runtime_config["model_suffix"]))
 
     def init_pickle_file_name(self, runtime_config):
         return self.mdl_name+runtime_config["model_suffix"]
@@ -1298,17 +1322,19 @@ class MdnQueryEngineXCategoricalOneModel(GenericQueryEngine):
             raise ValueError("Method not implemented.")
         else:
             config = self.config.copy()
+            # one encoder of the groups, shared by the density and the regression.
+            enc, zs_encoded = fit_shared_encoder(config, gbs, xs, ys, usecols, runtime_config)
 
             if runtime_config['v']:
                 print("training density...")
             # print("usecols", usecols)
             self.density = KdeMdn(config, b_store_training_data=False).fit(
-                gbs, xs, runtime_config)
+                gbs, xs, runtime_config, enc=enc, zs_encoded=zs_encoded)
 
             if runtime_config['v']:
                 print("training regression...")
             self.reg = RegMdnGroupBy(config, b_store_training_data=False).fit(
-                gbs, xs, ys, runtime_config,usecols=usecols)
+                gbs, xs, ys, runtime_config, usecols=usecols, enc=enc, zs_encoded=zs_encoded)
             # kdeModelWrapper = KdeModelTrainer(
             #     mdl_name, origin_table_name, usecols["x_continous"][0], usecols["y"],
             #     groupby_attribute=usecols["gb"],
@@ -1352,7 +1378,10 @@ class MdnQueryEngineXCategoricalOneModel(GenericQueryEngine):
         #         break
         # print("self.n_total_points", self.n_total_points)
 
-        groups_no_categorical = list(self.n_total_points[key].keys())
+        if groups is None:
+            groups_no_categorical = list(self.n_total_points[key].keys())
+        else:  # a chunk of the group by values, in parallel mode.
+            groups_no_categorical = groups
 
         groups = [[item]+x_categorical_conditions[1]
                   for item in groups_no_categorical]
@@ -1385,19 +1414,22 @@ class MdnQueryEngineXCategoricalOneModel(GenericQueryEngine):
             #     print(item, self.n_total_points[key][item])
             # print("scaling_factor",scaling_factor)
             # print("self.n_total_point", self.n_total_point)
-            pre_density, pre_reg, step = prepare_reg_density_data(
-                self.density, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
-            # print("pre_density, pre_reg",pre_density,)
-            # print(pre_reg)
-
             if func.lower() == "count":
-                preds = approx_count(pre_density, step)
+                # closed-form CDF of the mixtures, no mesh is needed.
+                preds = prepare_density_cdf(
+                    self.density, x_lb, x_ub, groups=groups, runtime_config=runtime_config)
                 preds = np.multiply(preds, scaling_factor)
-            elif func.lower() == "sum":
-                preds = approx_sum(pre_density, pre_reg, step)
-                preds = np.multiply(preds, scaling_factor)
-            else:  # avg
-                preds = approx_avg(pre_density, pre_reg, step)
+            else:
+                pre_density, pre_reg, step = prepare_reg_density_data(
+                    self.density, x_lb, x_ub, groups=groups, reg=self.reg, runtime_config=runtime_config)
+                # print("pre_density, pre_reg",pre_density,)
+                # print(pre_reg)
+
+                if func.lower() == "sum":
+                    preds = approx_sum(pre_density, pre_reg, step)
+                    preds = np.multiply(preds, scaling_factor)
+                else:  # avg
+                    preds = approx_avg(pre_density, pre_reg, step)
             # print("groups-------------", groups)
             # results = dict(zip(groups_no_categorical, preds))
             results = zip(groups, preds)
@@ -1409,63 +1441,18 @@ class MdnQueryEngineXCategoricalOneModel(GenericQueryEngine):
                 runtime_config)
             # use multi-processing to achieve parallel
             if runtime_config["slaves"].is_empty():
-                instances = []
-                results = {}
-                # print("n_jobs,", n_jobs)
-                n_per_chunk = math.ceil(len(groups)/n_jobs)
-                group_chunks = [groups[i:i+n_per_chunk]
-                                for i in range(0, len(groups), n_per_chunk)]
-                # print("create Pool...", datetime.now())
-                if runtime_config["device"] == "cpu":
-                    pool = PoolCPU(processes=n_jobs)
-                else:
-                    pool = PoolGPU(processes=n_jobs)
-                    # from torch.multiprocessing import Pool, set_start_method
-                    # try:
-                    #     set_start_method('spawn')
-                    # except RuntimeError:
-                    #     print("Fail to set start method as spawn for pytorch multiprocessing, " +
-                    #           "use default in advance. (see queryenginemdn "
-                    #           "for more info.)")
-
-                # with Pool(processes=n_jobs) as pool:
-                # print(self.group_keys_chunk)
-
-                time2exclude_from_multiprocessing = datetime.now()
-
-                for sub_group in group_chunks:
-
-                    i = pool.apply_async(
-                        self.predicts, (func, x_lb, x_ub, x_categorical_conditions, runtime_config_process, sub_group, filter_dbest, time2exclude_from_multiprocessing))
-                    instances.append(i)
-
-                for i in instances:
-                    result = i.get()
-                    results.update(result)
+                # the workers compose the full group keys themselves, so only the group by values are sent.
+                n_per_chunk = math.ceil(len(groups_no_categorical)/n_jobs)
+                group_chunks = [groups_no_categorical[i:i+n_per_chunk]
+                                for i in range(0, len(groups_no_categorical), n_per_chunk)]
+                results = predicts_with_worker_pool(
+                    self, n_jobs, func, x_lb, x_ub, x_categorical_conditions, runtime_config, group_chunks, filter_dbest)
+                return pd.concat(results, ignore_index=True)
             else:  # slaves are used
-                slaves = runtime_config["slaves"]
-                instances = []
-                results = {}
-                n_jobs = slaves.size()
-                n_per_chunk = math.ceil(len(groups)/n_jobs)
-                group_chunks = [groups[i:i+n_per_chunk]
-                                for i in range(0, len(groups), n_per_chunk)]
-
-                pool = ThreadPool(processes=n_jobs)
-                hosts = slaves.get()
-                for sub_group, host in zip(group_chunks, hosts):
-                    # print("host", host)
-                    query = dict(func=func, x_lb=x_lb, x_ub=x_ub, x_categorical_conditions=x_categorical_conditions, runtime_config=runtime_config_process,
-                                 sub_group=sub_group, filter_dbest=filter_dbest, mdl_name=self.mdl_name+runtime_config["model_suffix"])
-                    i = pool.apply_async(
-                        app_client.run, (hosts[host].host, hosts[host].port, "select", query))
-                    instances.append(i)
-
-                for i in instances:
-                    result = i.get()
-                    results.update(result)
-                    # result = app_client.run(
-                    #     host, slaves.get()[host], "select", query)
+                # as with the local workers, only the group by values are sent.
+                return app_client.client.scatter(
+                    runtime_config["slaves"], self.mdl_name+runtime_config["model_suffix"], func, x_lb, x_ub,
+                    x_categorical_conditions, runtime_config_process, groups_no_categorical, filter_dbest)
         runtime_config["b_print_to_screen"] = b_print_to_screen
         if runtime_config["b_print_to_screen"]:
             for key in results:
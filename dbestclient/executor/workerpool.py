@@ -0,0 +1,198 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import weakref
+from multiprocessing import Pool as PoolCPU
+
+import dill
+import torch
+from torch.multiprocessing import Pool as PoolGPU
+
+from dbestclient.catalog.modelformat import load_model
+
+# the models loaded in this worker process, as (version, model), with the model name as the key.
+worker_models = {}
+
+
+def init_worker():
+    """initialize a worker process."""
+    # the workers already run in parallel, avoid over-subscribing the cores.
+    torch.set_num_threads(1)
+
+
+def get_worker_model(mdl_name: str, version: int, source, resident: dict):
+    """get a model in this worker process, loading it on first use.
+
+    Args:
+        mdl_name (str): the model name.
+        version (int): the version of the model, which changes when the model is replaced.
+        source (str or bytes): the path of the model in the warehouse, or the serialized model.
+        resident (dict): the versions of the models resident in the parent process. The others are
+            dropped, as the parent evicted or replaced them.
+
+    Returns:
+        GenericQueryEngine: the model.
+    """
+    for name in list(worker_models):
+        if resident.get(name) != worker_models[name][0]:
+            worker_models.pop(name)
+    if mdl_name not in worker_models or worker_models[mdl_name][0] != version:
+        model = load_model(source) if isinstance(source, str) else dill.loads(source)
+        worker_models[mdl_name] = (version, model)
+    return worker_models[mdl_name][1]
+
+
+def predicts_in_worker(mdl_name: str, version: int, source, resident: dict, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, groups: list, filter_dbest):
+    """make predictions for a chunk of groups, using a model held by this worker process."""
+    model = get_worker_model(mdl_name, version, source, resident)
+    return model.predicts(func, x_lb, x_ub, x_categorical_conditions, runtime_config,
+                          groups=groups, filter_dbest=filter_dbest)
+
+
+class WorkerPool:
+    """A long-lived process pool for parallel predictions, safe to use from several threads.
+
+    The models are registered by the model catalog, with their path in the warehouse, and each worker
+    loads a model from the warehouse the first time it serves it, so a task only carries the query
+    and a chunk of group keys. The workers drop the models the catalog evicted or replaced. A model
+    which is not registered is sent along with each task. The workers are only restarted when n_jobs
+    or the device changes, once the requests in flight are done.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.n_jobs = None
+        self.device = None
+        # the registered models, as (weak reference to the model, version, path), with the model name as the key.
+        self.models = {}
+        self.n_versions = 0
+        self.n_in_flight = 0
+        self.condition = threading.Condition()
+
+    def __getstate__(self):
+        # models keep a reference to the runtime configuration, hence to the pool.
+        # the processes can not be pickled, so a pickled pool is an idle one.
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def register(self, mdl_name: str, model, path: str = None):
+        """make a model available to the workers. The pool does not keep the model alive.
+
+        Args:
+            mdl_name (str): the model name.
+            model (GenericQueryEngine): the model.
+            path (str, optional): the model file in the warehouse, for the workers to load it from.
+                Defaults to None, to send the model along with the tasks.
+        """
+        with self.condition:
+            entry = self.models.get(mdl_name)
+            if entry is None or entry[0]() is not model or entry[2] != path:
+                self.n_versions += 1
+                self.models[mdl_name] = (weakref.ref(model), self.n_versions, path)
+
+    def unregister(self, mdl_name: str):
+        """remove a model from the workers.
+
+        Args:
+            mdl_name (str): the model name.
+        """
+        with self.condition:
+            self.models.pop(mdl_name, None)
+
+    def get_pool(self, n_jobs: int, device: str):
+        """get the process pool, (re)starting the workers if needed. The caller holds the condition.
+
+        Args:
+            n_jobs (int): the number of workers.
+            device (str): the device, cpu or cuda.
+
+        Returns:
+            Pool: the process pool.
+        """
+        if self.pool is not None and n_jobs == self.n_jobs and device == self.device:
+            return self.pool
+        # the workers are not stopped while other requests use them.
+        while self.n_in_flight > 0:
+            self.condition.wait()
+        if self.pool is None or n_jobs != self.n_jobs or device != self.device:
+            self.terminate()
+            Pool = PoolCPU if device == "cpu" else PoolGPU
+            self.pool = Pool(processes=n_jobs, initializer=init_worker)
+            self.n_jobs = n_jobs
+            self.device = device
+        return self.pool
+
+    def predicts(self, n_jobs: int, mdl_name: str, model, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, group_chunks: list, filter_dbest=None) -> list:
+        """make predictions for each chunk of groups in parallel.
+
+        Args:
+            n_jobs (int): the number of workers.
+            mdl_name (str): the model name.
+            model (GenericQueryEngine): the model.
+            func (str): the aggregate function.
+            x_lb (float): lower bound
+            x_ub (float): upper bound
+            x_categorical_conditions (list): the categorical conditions.
+            runtime_config (dict): the runtime configuration for the workers.
+            group_chunks (list): the chunks of groups, one task per chunk.
+            filter_dbest (list, optional): the filter. Defaults to None.
+
+        Returns:
+            list: the predictions of each chunk.
+        """
+        with self.condition:
+            entry = self.models.get(mdl_name)
+            if entry is not None and entry[0]() is model and entry[2] is not None:
+                version, source = entry[1], entry[2]
+            else:
+                # not loadable by the workers, so it is sent with the tasks, under a version of its own.
+                self.n_versions += 1
+                version, source = self.n_versions, None
+            resident = {name: value[1] for name, value in self.models.items()}
+            resident[mdl_name] = version
+            pool = self.get_pool(n_jobs, runtime_config["device"])
+            self.n_in_flight += 1
+        try:
+            if source is None:
+                source = dill.dumps(model)
+            instances = [pool.apply_async(predicts_in_worker, (mdl_name, version, source, resident, func, x_lb, x_ub,
+                                                               x_categorical_conditions, runtime_config, sub_group,
+                                                               filter_dbest))
+                         for sub_group in group_chunks]
+            return [i.get() for i in instances]
+        finally:
+            with self.condition:
+                self.n_in_flight -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        """stop the workers, once the requests in flight are done."""
+        with self.condition:
+            while self.n_in_flight > 0:
+                self.condition.wait()
+            self.terminate()
+
+    def terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,213 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for Parquet and Arrow files.
+    pa = None
+
+# the formats of the data files, by extension. The other files are delimited text.
+SOURCE_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".npy": "npy",
+}
+# the number of rows read at a time.
+BATCH_SIZE = 1 << 16
+
+
+def get_source_format(file, source_format=None) -> str:
+    """get the format of a data file: the one set, or the one of its extension, csv by default.
+
+    Args:
+        file (str or list): the data file, or the partitions of the table.
+        source_format (str, optional): the format set with SET source_format. Defaults to None.
+
+    Returns:
+        str: csv, parquet, arrow or npy.
+    """
+    if source_format:
+        return source_format.lower()
+    if not isinstance(file, str):
+        file = file[0]
+    return SOURCE_FORMATS.get(os.path.splitext(file)[1].lower(), "csv")
+
+
+def is_columnar(file, source_format=None) -> bool:
+    return get_source_format(file, source_format) != "csv"
+
+
+class ColumnarSource:
+    """A Parquet, Arrow IPC or NPY data file, read by batches of the columns needed only.
+
+    The column names are lower-cased, as the header of the text files. An NPY file holds either a
+    structured array, whose field names are the columns, or a 2-D array, whose columns are named by
+    the given header.
+
+    Args:
+        file (str or list): the data file, or the partitions of the table, read one after the other.
+        source_format (str, optional): the format, see get_source_format(). Defaults to None.
+        header (list, optional): the column names of a 2-D NPY file. Defaults to None.
+
+    Raises:
+        ImportError: if the file is a Parquet or Arrow file, and pyarrow is not installed.
+    """
+
+    def __init__(self, file, source_format=None, header=None):
+        self.files = [file] if isinstance(file, str) else list(file)
+        self.source_format = get_source_format(self.files, source_format)
+        if self.source_format in ["parquet", "arrow"] and pa is None:
+            raise ImportError("pyarrow is needed to read " + self.files[0] + ", please install it.")
+        if self.source_format not in ["parquet", "arrow", "npy"]:
+            raise ValueError("Unsupported source format " + self.source_format)
+        self.header = header
+        # the column names in the files, by lower-cased name.
+        self.names = {name.lower(): name for name in self.read_names(self.files[0])}
+
+    def read_names(self, file) -> list:
+        if self.source_format == "parquet":
+            return pq.read_schema(file).names
+        if self.source_format == "arrow":
+            with pa.memory_map(file) as source:
+                return pa.ipc.open_file(source).schema.names
+        array = np.load(file, mmap_mode="r")
+        if array.dtype.names is not None:
+            return list(array.dtype.names)
+        if self.header is None or len(self.header) != array.shape[1]:
+            raise ValueError("The columns of " + file + " are not named, please set table_header.")
+        return list(self.header)
+
+    def columns(self) -> list:
+        return list(self.names)
+
+    def iter_batches(self, columns: list, categorical_columns=(), batch_size: int = BATCH_SIZE):
+        """read the columns, by batches of rows.
+
+        Args:
+            columns (list): the columns to read.
+            categorical_columns (list, optional): the columns read as strings, with "" for the null
+                values, as from a text file. The other columns are read as float64, with NaN for the
+                null values. Defaults to ().
+            batch_size (int, optional): the number of rows read at a time. Defaults to BATCH_SIZE.
+
+        Raises:
+            ValueError: if a column does not exist.
+
+        Yields:
+            dict: the arrays of the columns, by column name.
+        """
+        for col in columns:
+            if col not in self.names:
+                raise ValueError("Column " + col + " does not exist in " + self.files[0])
+        names = [self.names[col] for col in columns]
+        for file in self.files:
+            for batch in self.read_file(file, names, batch_size):
+                arrays = {}
+                for col, array in zip(columns, batch):
+                    arrays[col] = to_strings(array) if col in categorical_columns else to_floats(array)
+                yield arrays
+
+    def read_file(self, file, names, batch_size):
+        """yield the batches of a file, as lists of the columns."""
+        if self.source_format == "parquet":
+            for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_size, columns=names):
+                yield [batch.column(name) for name in names]
+        elif self.source_format == "arrow":
+            with pa.memory_map(file) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i).select(names)
+                    for start in range(0, batch.num_rows, batch_size):
+                        part = batch.slice(start, batch_size)
+                        yield [part.column(name) for name in names]
+        else:
+            array = np.load(file, mmap_mode="r")
+            for start in range(0, len(array), batch_size):
+                part = array[start:start + batch_size]
+                if array.dtype.names is not None:
+                    yield [np.asarray(part[name]) for name in names]
+                else:
+                    yield [np.asarray(part[:, self.header.index(name)]) for name in names]
+
+    def read_sample(self, columns: list, categorical_columns=(), R: int = None):
+        """make a uniform sample of R rows of the columns, keeping the R rows with the smallest
+        random keys, batch by batch, so the table is never held in memory.
+
+        Args:
+            columns (list): the columns to read.
+            categorical_columns (list, optional): see iter_batches(). Defaults to ().
+            R (int, optional): the sample size. Defaults to None, for all the rows.
+
+        Returns:
+            tuple: the sample, as a DataFrame, and the number of rows of the table.
+        """
+        parts = []
+        keys = np.empty(0)
+        n = 0
+        for arrays in self.iter_batches(columns, categorical_columns):
+            batch = pd.DataFrame(arrays, columns=columns)
+            n += len(batch)
+            if R is None:
+                parts.append(batch)
+                continue
+            batch_keys = np.random.random(len(batch))
+            if len(keys) >= R:
+                # only the rows with a key below the largest one kept may go into the sample.
+                selected = batch_keys < keys.max()
+                batch, batch_keys = batch[selected], batch_keys[selected]
+            parts.append(batch)
+            keys = np.concatenate([keys, batch_keys])
+            if len(keys) > R:
+                kept = np.argpartition(keys, R - 1)[:R]
+                parts = [pd.concat(parts, ignore_index=True).iloc[kept].reset_index(drop=True)]
+                keys = keys[kept]
+        sample = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        if R is not None:
+            sample = sample.iloc[np.random.permutation(len(sample))].reset_index(drop=True)
+        return sample, n
+
+
+def to_strings(array) -> np.ndarray:
+    """the values of a column as strings, with "" for the null values."""
+    if pa is not None and isinstance(array, (pa.Array, pa.ChunkedArray)):
+        if not pa.types.is_string(array.type):
+            array = pc.cast(array, pa.string())
+        return pc.fill_null(array, "").to_numpy(zero_copy_only=False).astype(object)
+    if array.dtype.kind in "iu":
+        return array.astype(str).astype(object)
+    strings = array.astype(str).astype(object)
+    if array.dtype.kind == "f":
+        strings[np.isnan(array)] = ""
+    return strings
+
+
+def to_floats(array) -> np.ndarray:
+    """the values of a column as float64, with NaN for the null values."""
+    if pa is not None and isinstance(array, (pa.Array, pa.ChunkedArray)):
+        array = array.to_numpy(zero_copy_only=False)
+    return pd.to_numeric(pd.Series(array), errors="coerce").to_numpy(dtype=np.float64)
@@ -0,0 +1,105 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import mmap
+import os
+
+import numpy as np
+
+from dbestclient.io.reservoir import BLOCK_SIZE
+
+
+class LineIndex:
+    """The byte offsets of the lines of a data file, kept in the warehouse next to the models.
+
+    It is built once, by scanning the file for newlines, so a uniform sample can then be read by
+    seeking to R random lines instead of reading the whole file, and the number of rows comes for
+    free. The offsets are stored delta-encoded and compressed. The index is rebuilt if the size
+    or the modification time of the file changes.
+    """
+
+    def __init__(self, file: str, warehouse: str):
+        self.file = file
+        key = hashlib.sha1(os.path.abspath(file).encode()).hexdigest()[:16]
+        self.path = os.path.join(warehouse, "line_index", os.path.basename(file) + "." + key + ".npz")
+        self.offsets = None  # the offset of the start of each line.
+        self.size = None
+
+    def n_lines(self) -> int:
+        return len(self.offsets)
+
+    def load_or_build(self):
+        """load the index from the warehouse, or build and save it if it is missing or stale.
+
+        Returns:
+            LineIndex: the index.
+        """
+        stat = os.stat(self.file)
+        if os.path.isfile(self.path):
+            with np.load(self.path) as stored:
+                if int(stored["size"]) == stat.st_size and int(stored["mtime_ns"]) == stat.st_mtime_ns:
+                    self.offsets = np.cumsum(stored["deltas"], dtype=np.uint64)
+                    self.size = stat.st_size
+                    return self
+        print("Building the line index of " + self.file + "...")
+        self.build()
+        self.save(stat.st_mtime_ns)
+        return self
+
+    def build(self):
+        """find the start of each line, with a scan of the file for newlines."""
+        self.size = os.path.getsize(self.file)
+        if self.size == 0:
+            self.offsets = np.zeros(0, dtype=np.uint64)
+            return
+        parts = [np.zeros(1, dtype=np.uint64)]
+        with open(self.file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = np.frombuffer(mm, dtype=np.uint8)
+            for start in range(0, self.size, BLOCK_SIZE):
+                newlines = np.flatnonzero(data[start:start + BLOCK_SIZE] == 10)
+                parts.append(newlines.astype(np.uint64) + np.uint64(start + 1))
+            del data  # release the buffer before the map is closed.
+        offsets = np.concatenate(parts)
+        if offsets[-1] == self.size:  # the file ends with a newline.
+            offsets = offsets[:-1]
+        self.offsets = offsets
+
+    def save(self, mtime_ns: int):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deltas = np.diff(self.offsets, prepend=np.uint64(0))
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, deltas=deltas, size=np.uint64(self.size), mtime_ns=np.int64(mtime_ns))
+        os.replace(tmp, self.path)
+
+    def read_lines(self, rows):
+        """read some lines of the file.
+
+        Args:
+            rows (list): the indexes of the lines, preferably sorted, so the file is read forwards.
+
+        Yields:
+            bytes: the lines, without the newline.
+        """
+        n = len(self.offsets)
+        with open(self.file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for row in rows:
+                start = int(self.offsets[row])
+                end = int(self.offsets[row + 1]) - 1 if row + 1 < n else self.size
+                yield mm[start:end].rstrip(b"\n")
@@ -11,15 +11,24 @@ http://erikerlandson.github.io/blog/2015/11/20/very-fast-reservoir-sampling/
 
 from __future__ import division, print_function, with_statement
 
-from math import log
-from random import random
-from sys import stderr, stdin
+import gzip
+import queue
+import sys
+import threading
+from contextlib import nullcontext
+from itertools import chain
+from math import exp, log, log1p
+from random import random, randrange, sample
 
 import numpy as np
 import pandas as pd
-from statsmodels.compat.pandas import frequencies
 
-from dbestclient.tools.variables import UseCols
+from dbestclient.io.columnar import ColumnarSource, is_columnar
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst files.
+    zstandard = None
 
 # try:
 #     range = xrange
@@ -27,6 +36,249 @@ from dbestclient.tools.variables import UseCols
 #     pass
 
 
+# the size of the blocks read from the data file, in bytes.
+BLOCK_SIZE = 1 << 24
+# the data file name standing for the standard input.
+STDIN = "-"
+
+
+def is_stream(file: str) -> bool:
+    """whether the data file is the standard input."""
+    return file == STDIN
+
+
+def is_seekable(file: str) -> bool:
+    """whether the data file is a plain file, which can be read again, or by byte ranges. Compressed
+    files and the standard input are read once, from the start."""
+    return not is_stream(file) and not file.endswith((".gz", ".zst"))
+
+
+def open_source(file: str):
+    """open a data file as bytes: .gz and .zst files are decompressed, and STDIN is the standard input.
+
+    Raises:
+        ImportError: if the file is a .zst file, and zstandard is not installed.
+    """
+    if is_stream(file):
+        return nullcontext(sys.stdin.buffer)  # not closed, it is not ours.
+    if file.endswith(".gz"):
+        return gzip.open(file, "rb")
+    if file.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("zstandard is needed to read " + file + ", please install it.")
+        return zstandard.ZstdDecompressor().stream_reader(open(file, "rb"), closefd=True)
+    return open(file, "rb")
+
+
+def read_header(file: str) -> str:
+    """read the first line of a data file, without consuming the standard input.
+
+    Raises:
+        ValueError: if the first line of the standard input is too long to be peeked at.
+    """
+    if is_stream(file):
+        head = sys.stdin.buffer.peek(1 << 16)
+        if b"\n" not in head:
+            raise ValueError("The header of the standard input is too long, please set table_header.")
+        return head[:head.index(b"\n")].decode().strip().lower()
+    with open_source(file) as f:
+        return f.readline().decode().strip().lower()
+
+
+def read_ahead(f, block_size: int, depth: int = 2):
+    """read the blocks of a stream in a background thread, so decompressing, or waiting on a pipe,
+    overlaps with parsing the blocks read before.
+
+    Args:
+        f (file): the stream.
+        block_size (int): the number of bytes to read at a time.
+        depth (int, optional): the number of blocks read ahead. Defaults to 2.
+
+    Yields:
+        bytes: the blocks.
+    """
+    blocks = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the blocks are not wanted any more.
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        try:
+            data = True
+            while data and not stop.is_set():
+                data = f.read(block_size)
+                put(data)
+        except BaseException as e:  # raised again in the reader.
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            data = blocks.get()
+            if isinstance(data, BaseException):
+                raise data
+            if not data:
+                return
+            yield data
+    finally:
+        stop.set()
+        thread.join()
+
+
+def read_line_blocks(file: str, block_size: int = BLOCK_SIZE, start: int = 0, end: int = None):
+    """read a file in blocks of whole lines, and locate the lines in each block.
+    The newlines are found with numpy, so lines which are not needed are never split or decoded.
+
+    Args:
+        file (str): the file, compressed or not, or STDIN, see open_source().
+        block_size (int, optional): the number of bytes to read at a time. Defaults to BLOCK_SIZE.
+        start (int, optional): read the lines starting at or after this offset. Defaults to 0.
+        end (int, optional): read the lines starting before this offset. Defaults to None, the end of the file.
+
+    Raises:
+        ValueError: if a byte range is asked for, and the file is not a plain file.
+
+    Yields:
+        tuple: the block, and the start and end offsets of the lines in it.
+    """
+    if not is_seekable(file) and (start > 0 or end is not None):
+        raise ValueError("Only plain files can be read by byte ranges, not " + file)
+    with open_source(file) as f:
+        # the line in progress at start belongs to the previous range, skip to the end of it.
+        b_skip = start > 0
+        position = 0  # the offset of the remainder in the file.
+        if is_seekable(file):
+            f.seek(start - 1 if b_skip else 0)
+            position = f.tell()
+            chunks = iter(lambda: f.read(block_size), b"")
+        else:
+            # the blocks are decompressed, or received, while the previous ones are parsed.
+            chunks = read_ahead(f, block_size)
+        remainder = b""
+        for data in chunks:
+            if end is not None and position >= end:
+                break
+            block = remainder + data
+            ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            if b_skip and len(ends) > 0:
+                first = ends[0] + 1
+                block = block[first:]
+                position += first
+                ends = ends[1:] - first
+                b_skip = False
+            if b_skip or len(ends) == 0:
+                remainder = b"" if b_skip else block
+                position += len(block) if b_skip else 0
+                continue
+            starts = np.empty_like(ends)
+            starts[0] = 0
+            starts[1:] = ends[:-1] + 1
+            remainder = block[ends[-1] + 1:]
+            if end is not None:
+                n = np.searchsorted(starts, end - position)
+                if n < len(starts):
+                    if n > 0:
+                        yield block, starts[:n], ends[:n]
+                    return
+            yield block, starts, ends
+            position += ends[-1] + 1
+        if remainder.strip() and not b_skip and (end is None or position < end):  # the last line, without a newline.
+            yield remainder, np.array([0]), np.array([len(remainder)])
+
+
+def to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def uniform_open() -> float:
+    """a random number in (0, 1)."""
+    u = random()
+    while u == 0.0:
+        u = random()
+    return u
+
+
+class UniformScanner:
+    """A uniform sample of R lines of a scan, fed one line at a time, with Algorithm L.
+
+    Args:
+        R (int): the sample size.
+    """
+
+    def __init__(self, R: int):
+        self.R = R
+        self.lines = []
+        self.n = 0  # the number of lines fed so far.
+        self.w = exp(log(uniform_open()) / R)
+        # the index of the next line to go into the reservoir.
+        self.next_row = R + int(log(uniform_open()) / log1p(-self.w))
+
+    def feed(self, line: bytes):
+        if len(self.lines) < self.R:
+            self.lines.append(line)
+        elif self.n == self.next_row:
+            self.lines[randrange(self.R)] = line
+            self.w *= exp(log(uniform_open()) / self.R)
+            self.next_row += int(log(uniform_open()) / log1p(-self.w)) + 1
+        self.n += 1
+
+
+def sample_lines(file: str, R: int, b_skip_first_row: bool = False) -> tuple:
+    """a uniform sample of R lines of the file.
+
+    Args:
+        file (str): the file.
+        R (int): the sample size.
+        b_skip_first_row (bool, optional): skip the first line, the header. Defaults to False.
+
+    Returns:
+        tuple: the sampled lines, as bytes, and the number of lines in the file.
+    """
+    scanner = UniformScanner(R)
+    for block, starts, ends in read_line_blocks(file):
+        for line_start, line_end in zip(starts.tolist(), ends.tolist()):
+            if b_skip_first_row:
+                b_skip_first_row = False
+                continue
+            scanner.feed(block[line_start:line_end])
+    return scanner.lines, scanner.n
+
+
+def merge_lines(a: tuple, b: tuple, R: int) -> tuple:
+    """merge the uniform samples of two files into a uniform sample of both. The number of lines
+    taken from the first sample follows the hypergeometric distribution of drawing R lines out of
+    the lines of both files.
+
+    Args:
+        a (tuple): the sampled lines and the number of lines of the first file, see sample_lines().
+        b (tuple): the sampled lines and the number of lines of the second file.
+        R (int): the sample size.
+
+    Returns:
+        tuple: the sampled lines and the number of lines of both files.
+    """
+    lines_a, n_a = a
+    lines_b, n_b = b
+    if len(lines_a) + len(lines_b) <= R:
+        return lines_a + lines_b, n_a + n_b
+    if n_a + n_b < 10 ** 9:
+        k_a = int(np.random.hypergeometric(n_a, n_b, R))
+    else:  # beyond the range of numpy, the binomial approximation is close enough.
+        k_a = min(max(int(np.random.binomial(R, n_a / (n_a + n_b))), R - len(lines_b)), len(lines_a))
+    return sample(lines_a, k_a) + sample(lines_b, R - k_a), n_a + n_b
+
+
 class ReservoirSampling:
     def __init__(self, headers):
         self.header = headers
@@ -34,231 +286,228 @@ class ReservoirSampling:
         self.sampledf = None
         self.sampledfmean = None
         self.usecols = None
-        self.origin_sample = None
 
     def build_reservoir(
         self,
         file,
         R,
-        threshold=None,
-        verbose=False,
         split_char=",",
         save2file=None,
         n_total_point=None,
         usecols=None,
+        source_format=None,
     ):
+        """make a uniform sample of R rows in a single pass over the file, with Algorithm L
+        (Li, "Reservoir-sampling algorithms of time complexity O(n(1+log(N/n)))", 1994).
+        The number of rows is counted along the way, and only the columns in usecols are parsed,
+        the continuous ones straight to float. Columnar files are read by build_from_columns().
+
+        Args:
+            file (str or list): the data file, or the partitions of a columnar table.
+            R (int): the sample size. If None, or a str, the whole file is used as the sample.
+            split_char (str, optional): the delimiter. Defaults to ",".
+            save2file (str, optional): the file to save the sample to. Defaults to None.
+            n_total_point (dict, optional): the number of rows in the table, as {"total": n}. Defaults to None,
+                in which case the rows of the file are counted.
+            usecols (dict, optional): the columns to use. Defaults to None, in which case all the columns
+                are kept as strings.
+            source_format (str, optional): the format of the file, see get_source_format(). Defaults to None.
+        """
         self.usecols = usecols
-        f = open(file, "r")
-        self.n_total_point = (
-            n_total_point["total"]
-            if n_total_point is not None
-            else sum(1 for _ in f) - 1
-        )
-        f.close()
+        if isinstance(R, str):
+            R = None
+        if is_columnar(file, source_format):
+            self.build_from_columns(ColumnarSource(file, source_format, self.header), R, save2file,
+                                    n_total_point, usecols)
+            return
 
         print("Reading data file...")
-        with open(file, "r") as data:
-            if verbose:
-
-                def p(s, *args):
-                    print(s.format(*args), file=stderr)
-
-            else:
-
-                def p(*_):
-                    pass
-
-            # check if the size R (number of rows in the sample) is passed, if not, return the file as a sample.
-            if R is None:
-                R = self.n_total_point
-            if isinstance(R, str):
-                R = self.n_total_point
-
-            if threshold is None:
-                threshold = 4 * R
-            res = []
-
-            iterator = iter(data)
-            if self.header is None:
-                # skip the first header row
-                first_row = next(iterator)
-                self.header = first_row.replace("\n", "").lower().split(split_char)
-            try:
-                j = 0
-                # iterator = iter(data)
-                while True:
-                    j += 1
-                    item = next(iterator)
-                    if len(res) < R:
-                        item = item.replace("\n", "").split(split_char)
-                        p("> Adding element nb {0}: {1!r}", len(res), item)
-                        res.append(item)
-
-                    elif j < threshold:
-                        k = int(random() * j)
-                        if k < R:
-                            p(
-                                "> [p={0}/{1:>9}] Swap element nb {2:>5}: {3!r} replaces {4!r}",
-                                R,
-                                j,
-                                k,
-                                item,
-                                res[k],
-                            )
-                            item = item.replace("\n", "").split(split_char)
-                            res[k] = item
+        blocks = read_line_blocks(file)
+        if self.header is None:
+            # the first row is the header.
+            for block, starts, ends in blocks:
+                self.header = block[starts[0]:ends[0]].decode().strip().lower().split(split_char)
+                blocks = chain([(block, starts[1:], ends[1:])], blocks)
+                break
+
+        usecols_list, converters, parse = self.get_line_parser(usecols, split_char)
+
+        res = []
+        n = 0  # the number of rows read so far.
+        if R is not None and R > 0:
+            w = exp(log(uniform_open()) / R)
+            # the index of the next row to go into the reservoir.
+            next_row = R + int(log(uniform_open()) / log1p(-w))
+        for block, starts, ends in blocks:
+            i = 0
+            m = len(ends)
+            while i < m and (R is None or len(res) < R):
+                res.append(parse(block[starts[i]:ends[i]]))
+                i += 1
+                n += 1
+            if R is None or R <= 0:
+                continue
+            # the rows in between are skipped without being parsed.
+            while next_row - n + i < m:
+                i = next_row - n + i
+                n = next_row
+                res[randrange(R)] = parse(block[starts[i]:ends[i]])
+                i += 1
+                n += 1
+                w *= exp(log(uniform_open()) / R)
+                next_row += int(log(uniform_open()) / log1p(-w)) + 1
+            n += m - i
+
+        self.n_total_point = n_total_point["total"] if n_total_point is not None else n
+        self.make_sampledf(res, usecols_list, converters, save2file)
+
+    def build_from_index(
+        self,
+        file,
+        R,
+        line_index,
+        split_char=",",
+        save2file=None,
+        n_total_point=None,
+        usecols=None,
+    ):
+        """make a uniform sample of R rows by reading R random lines, located by a line index.
+        The cost is proportional to the sample size, not to the size of the file.
+
+        Args:
+            file (str): the data file.
+            R (int): the sample size.
+            line_index (LineIndex): the index of the lines of the file.
+            split_char (str, optional): the delimiter. Defaults to ",".
+            save2file (str, optional): the file to save the sample to. Defaults to None.
+            n_total_point (dict, optional): the number of rows in the table, as {"total": n}. Defaults to None,
+                in which case the number of lines in the index is used.
+            usecols (dict, optional): the columns to use. Defaults to None, in which case all the columns
+                are kept as strings.
+        """
+        first = 0
+        if self.header is None:
+            # the first row is the header.
+            for line in line_index.read_lines([0]):
+                self.header = line.decode().strip().lower().split(split_char)
+            first = 1
+        n = max(line_index.n_lines() - first, 0)
+
+        # the lines are read in the order of the file.
+        rows = sorted(sample(range(n), min(R, n)))
+        lines = line_index.read_lines(np.array(rows, dtype=np.int64) + first)
+        self.build_from_lines(lines, n, split_char, save2file, n_total_point, usecols)
+
+    def build_from_columns(self, source, R, save2file=None, n_total_point=None, usecols=None):
+        """make a uniform sample of R rows of a columnar data file, reading only the columns in usecols.
+
+        Args:
+            source (ColumnarSource): the data file.
+            R (int): the sample size, None for the whole file.
+            save2file (str, optional): the file to save the sample to. Defaults to None.
+            n_total_point (dict, optional): the number of rows in the table, as {"total": n}. Defaults to None,
+                in which case the rows of the file are counted.
+            usecols (dict, optional): the columns to use. Defaults to None, in which case all the columns
+                are kept as strings.
+        """
+        self.usecols = usecols
+        self.header = source.columns()
+        usecols_list, converters, _ = self.get_line_parser(usecols, ",")
+        categorical_columns = [col for col, convert in zip(usecols_list, converters) if convert is str]
+        sampledf, n = source.read_sample(usecols_list, categorical_columns, R)
+        self.n_total_point = n_total_point["total"] if n_total_point is not None else n
+        self.make_sampledf(sampledf, usecols_list, converters, save2file)
+
+    def build_from_lines(
+        self,
+        lines,
+        n_rows,
+        split_char=",",
+        save2file=None,
+        n_total_point=None,
+        usecols=None,
+    ):
+        """make the sample from lines already drawn uniformly from the file, by an index or a shared scan.
+
+        Args:
+            lines (iterable): the lines of the sample, as bytes.
+            n_rows (int): the number of rows in the file.
+            split_char (str, optional): the delimiter. Defaults to ",".
+            save2file (str, optional): the file to save the sample to. Defaults to None.
+            n_total_point (dict, optional): the number of rows in the table, as {"total": n}. Defaults to None,
+                in which case n_rows is used.
+            usecols (dict, optional): the columns to use. Defaults to None, in which case all the columns
+                are kept as strings.
+        """
+        self.usecols = usecols
+        usecols_list, converters, parse = self.get_line_parser(usecols, split_char)
+        res = [parse(line) for line in lines]
+        self.n_total_point = n_total_point["total"] if n_total_point is not None else n_rows
+        self.make_sampledf(res, usecols_list, converters, save2file)
+
+    def get_line_parser(self, usecols, split_char):
+        """get the columns to keep, their converters, and a function parsing a line into them.
+
+        Args:
+            usecols (dict): the columns to use, None for all of them.
+            split_char (str): the delimiter.
+
+        Returns:
+            tuple: the columns, the converters, and the parse function.
+        """
+        if usecols is not None:
+            columns_continous = [usecols["y"][0]]
+            if usecols["x_continous"]:
+                columns_continous = columns_continous + usecols["x_continous"]
+            columns_categorial = []
+            if usecols["x_categorical"]:
+                columns_categorial = columns_categorial + usecols["x_categorical"]
+            if usecols["gb"]:
+                for col in usecols["gb"]:
+                    if col not in columns_continous + columns_categorial:
+                        columns_categorial.append(col)
                     else:
-                        gap = int(log(random()) / log(1 - R / j))
-                        j += gap
-                        for _ in range(gap):
-                            item = next(iterator)
-                        k = int(random() * R)
-                        p(
-                            "> After skipping {0:>9} lines, swap element nb {1:>5}: {2!r} replaces {3!r}",
-                            gap,
-                            k,
-                            item,
-                            res[k],
-                        )
-                        item = next(iterator).replace("\n", "").split(split_char)
-                        res[k] = item
-
-            except KeyboardInterrupt:
-                print("\n! User interrupted the process, stopping now\n", file=stderr)
-            except StopIteration:
-                pass
-
-            # save the sample as pandas dataframe
-            self.origin_sample = pd.DataFrame(res, columns=self.header)
-            if usecols is not None:
-                # print("self.origin_sample", self.origin_sample)
-                # print("use_columns,", usecols)
-                columns_as_continous, columns_as_categorical, _ = UseCols(
-                    usecols
-                ).get_continous_and_categorical_cols()
-
-                for col in columns_as_categorical:
-                    self.origin_sample[col] = self.origin_sample[col].astype(str)
-
-                for col in columns_as_continous:
-                    self.origin_sample[col] = self.origin_sample[col].apply(
-                        pd.to_numeric, errors="coerce"
-                    )
-
-                self.origin_sample = self.origin_sample[
-                    columns_as_continous + columns_as_categorical
-                ].dropna(subset=columns_as_continous)
-                # print("self.origin_sample",)
-                # print(self.origin_sample)
-                # raise Exception
-
-            self.sampledf = pd.DataFrame(res, columns=self.header)
-            # print(self.sampledf)
-            if usecols is not None:
-                # # firstlt check whether y is categorical, if so, convert the categorical attributes to real values.
-                # if usecols['y'][1] == "categorical":
-                #     print("usecols['y'][1] is categorical")
-                #     raise Exception
-
-                # process the usecols from dic to list
-                columns_continous = [usecols["y"][0]]
-
-                if usecols["x_continous"]:
-                    columns_continous = columns_continous + usecols["x_continous"]
-
-                columns_categorial = []
-                if usecols["x_categorical"]:
-                    # columns = columns + usecols['x_categorical']
-                    columns_categorial = columns_categorial + usecols["x_categorical"]
-                if usecols["gb"]:
-                    for col in usecols["gb"]:
-                        if col not in columns_continous + columns_categorial:
-                            columns_categorial.append(col)
-                        else:
-                            print(
-                                "SQL meets the condition where Group By attributes and X attributes have common attributes: "
-                                + col
-                            )
-
-                            # columns = columns + usecols['gb']
-                    # gb_cols = ["gb_"+i for i in usecols['gb']]
-                    # columns_categorial = columns_categorial + gb_cols
-                usecols_list = columns_continous + columns_categorial
-
-                # print(self.sampledf)
-                # print(self.sampledf["tenantid"])
-                # print(usecols)
-                # print("usecols_list", usecols_list)
-
-                self.sampledf = self.sampledf[usecols_list]
-                # print(self.sampledf)
-                # print(columns_continous)
-                # print(columns_categorial)
-                # print(self.sampledf)
-
-                # convert continuous X attributes to float, execept for those that repeated in the GROUP BY clause.
-                # print(usecols)
-                # print(usecols['x_continous'])
-                if usecols["gb"] is not None:
-                    columns_to_float = [
-                        item
-                        for item in usecols["x_continous"]
-                        if item not in usecols["gb"]
-                    ]
-                else:
-                    columns_to_float = [item for item in usecols["x_continous"]]
-                # print("columns_to_float", columns_to_float)
-                for col in columns_to_float:
-                    self.sampledf[col] = self.sampledf[col].apply(
-                        pd.to_numeric, errors="coerce"
-                    )
-                # self.sampledf[columns_continous] = self.sampledf[columns_continous].apply(
-                #     pd.to_numeric, errors='coerce')
-                # self.sampledf.dropna()
-                # print(self.sampledf)
-                # for col in columns_continous:  # [0:-1]:
-                #     print("col,", col)
-                #     print("df column " + str(col))
-                #     print(self.sampledf[col])
-
-                #     self.sampledf[col] = pd.to_numeric(
-                #         self.sampledf[col], errors='coerce')
-                #     print(self.sampledf)
-                #     print("*"*80)
-                # convert the group by column to string
-
-                for col in columns_categorial:
-                    self.sampledf[col] = self.sampledf[col].astype(str)
-
-                # if col in both X and Group BY, convert it to float
-                if usecols["gb"] is not None:
-                    columns_common = [
-                        item for item in usecols["x_continous"] if item in usecols["gb"]
-                    ]
-
-                    for col in columns_common:
-                        self.sampledf[col] = self.sampledf[col].apply(
-                            pd.to_numeric, errors="coerce"
+                        print(
+                            "SQL meets the condition where Group By attributes and X attributes have common attributes: "
+                            + col
                         )
+            usecols_list = columns_continous + columns_categorial
+            b_categorical_y = usecols["y"][1] == "categorical"
+            converters = [str if (col in columns_categorial or (b_categorical_y and col == usecols["y"][0]))
+                          else to_float for col in usecols_list]
+            self.columns_categorical = columns_categorial
+            self.column_continous = columns_continous
+        else:
+            usecols_list = list(self.header)
+            converters = [str] * len(usecols_list)
+        indexes = [self.header.index(col) for col in usecols_list]
+        max_index = max(indexes)
+
+        def parse(line: bytes) -> tuple:
+            fields = line.decode().rstrip("\r").split(split_char, max_index + 1)
+            # the missing fields are empty, an empty categorical value is a group of its own.
+            if len(fields) <= max_index:
+                fields += [""] * (max_index + 1 - len(fields))
+            return tuple(convert(fields[index]) for index, convert in zip(indexes, converters))
+
+        return usecols_list, converters, parse
+
+    def make_sampledf(self, res, usecols_list, converters, save2file=None):
+        """build the sample, one typed column per used column, from the parsed rows, or from the
+        columns read from a columnar file, as a DataFrame."""
+        if isinstance(res, pd.DataFrame):
+            self.sampledf = res
+        else:
+            self.sampledf = pd.DataFrame.from_records(res, columns=usecols_list)
+        if self.usecols is not None:
+            columns_continous = [col for col, convert in zip(usecols_list, converters) if convert is to_float]
+            for col in columns_continous:
+                self.sampledf[col] = self.sampledf[col].astype(float)
+            # only the rows with a value which is not a number are dropped.
+            self.sampledf = self.sampledf.dropna(subset=columns_continous)
 
-                if usecols["y"][1] == "categorical":
-                    self.sampledf[usecols["y"][0]] = self.sampledf[
-                        usecols["y"][0]
-                    ].astype(str)
-                else:
-                    self.sampledf[usecols["y"][0]] = self.sampledf[
-                        usecols["y"][0]
-                    ].apply(pd.to_numeric, errors="coerce")
-                # print("usecols", usecols)
-                self.sampledf = self.sampledf.dropna(subset=usecols_list)
-                # print("self.sampledf", self.sampledf)
-                # print("type is ", self.sampledf.dtypes)
-                # raise Exception
-                self.columns_categorical = columns_categorial
-                self.column_continous = columns_continous
-
-            if save2file is not None:
-                self.sampledf.to_csv(save2file, index=False)
+        if save2file is not None:
+            self.sampledf.to_csv(save2file, index=False)
 
     def getyx(self, y, x, dropna=True, b_return_mean=False, groupby=None):
         # drop non-numerical values.
@@ -484,14 +733,14 @@ class ReservoirSampling:
 
     def get_columns_from_original_sample(self, gb, x, y):
         return (
-            self.origin_sample[gb].values,
-            self.origin_sample[x].values.reshape(1, -1)[0],
-            self.origin_sample[y].values.reshape(1, -1)[0],
+            self.sampledf[gb].values,
+            self.sampledf[x].values.reshape(1, -1)[0],
+            self.sampledf[y].values.reshape(1, -1)[0],
         )
 
     def get_frequency_of_categorical_columns_for_gbs(self, gbs, categoricals):
         frequencies = {}
-        gb = self.origin_sample.groupby(categoricals)
+        gb = self.sampledf.groupby(categoricals)
         for grp, values in gb:
             # print(grp, type(grp))
 
@@ -0,0 +1,147 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import json
+import os
+import threading
+
+import dill
+
+from dbestclient.io.reservoir import is_stream
+
+REFS_FILE = "refs.json"
+
+
+class SampleStore:
+    """The samples kept in the warehouse, shared by the models built from them.
+
+    A sample is stored under a hash of what it is drawn from: the data file, its size and modification
+    time, the header, the columns, the sampling method and size, and the delimiter. So the models over
+    the same columns of the same file share one sample, whatever their names. The store counts the
+    models using each sample, and a sample is removed when the last of them is dropped.
+    """
+
+    lock = threading.Lock()  # guards the references file, shared by the stores of this process.
+
+    def __init__(self, warehouse: str):
+        self.path = os.path.join(warehouse, "samples")
+
+    def key(self, file, header, usecols, method: str, ratio, split_char: str, n_total_point=None) -> str:
+        """get the key of a sample.
+
+        Args:
+            file (str or list): the data file, or the partitions of the table.
+            header (list): the header of the file, None if it is the first line.
+            usecols (dict): the columns to use.
+            method (str): the sampling method.
+            ratio (int, float or str): the sample size.
+            split_char (str): the delimiter.
+            n_total_point (dict, optional): the number of rows given for the table. Defaults to None.
+
+        Returns:
+            str: the key, None if the file is the standard input, whose samples are not kept.
+        """
+        if isinstance(file, str) and is_stream(file):
+            return None
+        files = []
+        for name in [file] if isinstance(file, str) else file:
+            stat = os.stat(name)
+            files.append([os.path.abspath(name), stat.st_size, stat.st_mtime_ns])
+        description = [files, header, usecols, method.lower(), str(ratio), split_char, n_total_point]
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def sample_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".sample")
+
+    def load(self, key: str):
+        """load a sample.
+
+        Args:
+            key (str): the key of the sample.
+
+        Returns:
+            object: the sample, None if it is not in the store.
+        """
+        if key is None:
+            return None
+        try:
+            with open(self.sample_path(key), "rb") as f:
+                return dill.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, sample):
+        """save a sample, atomically."""
+        if key is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.sample_path(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            dill.dump(sample, f)
+        os.replace(tmp, self.sample_path(key))
+
+    def read_refs(self) -> dict:
+        try:
+            with open(os.path.join(self.path, REFS_FILE), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write_refs(self, refs: dict):
+        os.makedirs(self.path, exist_ok=True)
+        refs_file = os.path.join(self.path, REFS_FILE)
+        with open(refs_file + ".tmp", "w") as f:
+            json.dump(refs, f, indent=1)
+        os.replace(refs_file + ".tmp", refs_file)
+
+    def acquire(self, key: str, mdl_name: str):
+        """record that a model uses a sample."""
+        if key is None:
+            return
+        with self.lock:
+            refs = self.read_refs()
+            if mdl_name not in refs.setdefault(key, []):
+                refs[key].append(mdl_name)
+                self.write_refs(refs)
+
+    def release(self, mdl_name: str) -> int:
+        """record that a model is dropped, and remove the samples no other model uses.
+
+        Args:
+            mdl_name (str): the model name.
+
+        Returns:
+            int: the number of samples removed.
+        """
+        with self.lock:
+            refs = self.read_refs()
+            keys = [key for key in refs if mdl_name in refs[key]]
+            if not keys:
+                return 0
+            removed = []
+            for key in keys:
+                refs[key].remove(mdl_name)
+                if not refs[key]:
+                    refs.pop(key)
+                    removed.append(key)
+            self.write_refs(refs)
+            for key in removed:
+                if os.path.exists(self.sample_path(key)):
+                    os.remove(self.sample_path(key))
+            return len(removed)
@@ -3,10 +3,36 @@
 # Department of Computer Science
 # the University of Warwick
 # Q.Ma.2@warwick.ac.uk
+import glob
+import os
+from multiprocessing import Pool as PoolCPU
+
 import pandas as pd
 
-from dbestclient.io.reservoir import ReservoirSampling
-from dbestclient.io.stratifiedreservoir import StratifiedReservoir
+from dbestclient.io.columnar import is_columnar
+from dbestclient.io.lineindex import LineIndex
+from dbestclient.io.reservoir import (ReservoirSampling, UniformScanner,
+                                      is_seekable, merge_lines, read_header,
+                                      read_line_blocks, sample_lines)
+from dbestclient.io.samplestore import SampleStore
+from dbestclient.io.stratifiedreservoir import StratifiedReservoir, reseed
+
+
+def is_partitioned(file: str) -> bool:
+    """whether the table is given as a pattern of its partition files, like 'dir/*.dat'."""
+    return glob.has_magic(file)
+
+
+def list_partitions(file: str) -> list:
+    """list the partition files of a partitioned table.
+
+    Raises:
+        ValueError: if no file matches the pattern.
+    """
+    partitions = sorted(name for name in glob.glob(file) if os.path.isfile(name))
+    if not partitions:
+        raise ValueError("No file matches " + file)
+    return partitions
 
 
 class DBEstSampling:
@@ -23,6 +49,47 @@ class DBEstSampling:
         self.n_jobs = n_jobs
         self.mdl_name = mdl_name
         self.warehouse=warehouse
+        self.scanner = None  # fed by a scan shared with other samplers, see shared_scan().
+        self.store = SampleStore(warehouse)
+
+    def prepare_shared_scan(self, file, ratio, method="uniform", split_char=",", num_total_records=None,
+                            source_format=None):
+        """prepare the scanner of make_sample(), if the sample can be made by a scan of the file shared
+        with other samplers. make_sample() then uses what the scanner is fed with.
+
+        Args:
+            file (str): the data file.
+            ratio (int or str): the sample size, as in make_sample().
+            method (str, optional): the sampling method. Defaults to "uniform".
+            split_char (str, optional): the delimiter. Defaults to ",".
+            num_total_records (dict, optional): as in make_sample(). Defaults to None.
+            source_format (str, optional): as in make_sample(). Defaults to None.
+
+        Returns:
+            bool: True if the scanner is ready, False if the sample is made by make_sample() alone.
+        """
+        method = method.lower()
+        # the partitions are sampled one by one, and columnar files are read by columns, see make_sample().
+        if is_partitioned(file) or is_columnar(file, source_format):
+            return False
+        key = self.store.key(file, self.headers, self.usecols, method, ratio, split_char, num_total_records)
+        if key is not None and os.path.exists(self.store.sample_path(key)):
+            return False
+        if method == "uniform":
+            # samples of the whole file are not shared.
+            if isinstance(ratio, str) or float(ratio) <= 1:
+                return False
+            self.scanner = UniformScanner(int(ratio))
+        elif method == "stratified":
+            if int(ratio) < 10:
+                return False
+            self.sample = StratifiedReservoir(
+                file, file_header=self.headers, n_jobs=1, capacity=int(ratio), mdl_name=self.mdl_name, warehouse=self.warehouse
+            )
+            # the sample is kept in the store, instead of under the model name.
+            self.sample.save_sample = False
+            self.scanner = self.sample.plan_scan(self.usecols, split_char=split_char)
+        return self.scanner is not None
 
     def make_sample(
         self,
@@ -32,35 +99,100 @@ class DBEstSampling:
         split_char=",",
         file2save=None,
         num_total_records=None,
+        b_line_index=False,
+        source_format=None,
     ):
         self.method = method.lower()
+        partitions = None
+        source = file
+        if is_partitioned(file):
+            # each partition is sampled on its own and the samples are merged, but the partitions of
+            # a columnar table are read one after the other, as a single file.
+            partitions = list_partitions(file)
+            if is_columnar(partitions, source_format):
+                source, partitions = partitions, None
+            elif self.method == "uniform" and (isinstance(ratio, str) or float(ratio) <= 1):
+                raise ValueError("A partitioned table needs a sample size, not a sampling rate.")
+        # the sample is shared by the models drawn from the same columns of the same file.
+        key = self.store.key(partitions or source, self.headers, self.usecols, method, ratio, split_char,
+                             num_total_records)
+        cached = self.store.load(key)
+        if cached is not None:
+            print("sample exists in warehouse, use it directly.")
+            self.scanner = None
+            if file2save is not None and self.method == "uniform":
+                cached.sampledf.to_csv(file2save, index=False)
         if method == "uniform":
             # # if  ratio is provided, then make samples using the ratio (or size)
             # if ratio is not None:
             if isinstance(ratio, str):
                 print("The given table is treated as a uniform sample")
-                self.sample = ReservoirSampling(headers=self.headers)
-                self.sample.build_reservoir(
-                    file,
-                    None,
-                    split_char=split_char,
-                    save2file=file2save,
-                    n_total_point=num_total_records,
-                    usecols=self.usecols,
-                )
+                self.sample = cached
+                if cached is None:
+                    self.sample = ReservoirSampling(headers=self.headers)
+                    self.sample.build_reservoir(
+                        source,
+                        None,
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                        source_format=source_format,
+                    )
+                    self.store.save(key, self.sample)
+                self.store.acquire(key, self.mdl_name)
                 return
             if float(ratio) > 1:  # here the ratio is the number of tuples in the sample
                 ratio = int(ratio)
                 self.n_sample_point = ratio
                 self.sample = ReservoirSampling(headers=self.headers)
-                self.sample.build_reservoir(
-                    file,
-                    ratio,
-                    split_char=split_char,
-                    save2file=file2save,
-                    n_total_point=num_total_records,
-                    usecols=self.usecols,
-                )
+                if cached is not None:
+                    self.sample = cached
+                elif partitions is not None:
+                    lines, n_rows = self.sample_partitions(partitions, ratio, split_char)
+                    self.sample.build_from_lines(
+                        lines,
+                        n_rows,
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                    )
+                elif self.scanner is not None:
+                    # the lines were drawn by a shared scan.
+                    self.sample.build_from_lines(
+                        self.scanner.lines,
+                        self.scanner.n,
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                    )
+                    self.scanner = None
+                elif b_line_index and is_seekable(file) and not is_columnar(file, source_format):
+                    # read only the sampled lines, located by the index kept in the warehouse.
+                    self.sample.build_from_index(
+                        file,
+                        ratio,
+                        LineIndex(file, self.warehouse).load_or_build(),
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                    )
+                else:
+                    self.sample.build_reservoir(
+                        source,
+                        ratio,
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                        source_format=source_format,
+                    )
+                if cached is None:
+                    self.store.save(key, self.sample)
+                self.store.acquire(key, self.mdl_name)
                 self.n_total_point = self.sample.n_total_point
                 # print("total point", self.n_total_point)
                 # print("sample point",self.n_sample_point)
@@ -72,15 +204,20 @@ class DBEstSampling:
                     "The given table is treated as a uniform sample, and it is obtained with sampling rate "
                     + str(ratio)
                 )
-                self.sample = ReservoirSampling(headers=self.headers)
-                self.sample.build_reservoir(
-                    file,
-                    None,
-                    split_char=split_char,
-                    save2file=file2save,
-                    n_total_point=num_total_records,
-                    usecols=self.usecols,
-                )
+                self.sample = cached
+                if cached is None:
+                    self.sample = ReservoirSampling(headers=self.headers)
+                    self.sample.build_reservoir(
+                        source,
+                        None,
+                        split_char=split_char,
+                        save2file=file2save,
+                        n_total_point=num_total_records,
+                        usecols=self.usecols,
+                        source_format=source_format,
+                    )
+                    self.store.save(key, self.sample)
+                self.store.acquire(key, self.mdl_name)
                 self.n_total_point = self.sample.n_total_point / float(ratio)
                 self.scaling_factor = 1 / float(ratio)
                 # return self.sample, 1/float(ratio)
@@ -99,15 +236,75 @@ class DBEstSampling:
                 print("The maximum number of tuples per group is too small")
                 return
 
-            self.sample = StratifiedReservoir(
-                file, file_header=self.headers, n_jobs=self.n_jobs, capacity=ratio,mdl_name=self.mdl_name,warehouse=self.warehouse
-            )
-            self.sample.make_sample_for_sql_condition(
-                usecols=self.usecols, split_char=split_char
-            )
+            if cached is not None:
+                self.sample = cached
+            else:
+                if self.scanner is None:
+                    self.sample = StratifiedReservoir(
+                        partitions[0] if partitions else source, file_header=self.headers, n_jobs=self.n_jobs,
+                        capacity=ratio,mdl_name=self.mdl_name,warehouse=self.warehouse
+                    )
+                    self.sample.source_format = source_format
+                self.scanner = None
+                # the sample is kept in the store, instead of under the model name.
+                self.sample.save_sample = False
+                if partitions is not None:
+                    partition_keys = self.get_partition_keys(partitions, ratio, split_char)
+                    self.sample.partitions = {part: self.store.load(partition_key)
+                                              for part, partition_key in partition_keys.items()}
+                self.sample.make_sample_for_sql_condition(
+                    usecols=self.usecols, split_char=split_char
+                )
+                if partitions is not None:
+                    self.save_partitions(partition_keys, self.sample.partitions)
+                    self.sample.partitions = None
+                self.store.save(key, self.sample)
+            self.store.acquire(key, self.mdl_name)
         else:
             print("other sampling methods are not implemented, abort.")
 
+    def get_partition_keys(self, partitions, ratio, split_char):
+        """get the keys of the samples of the partitions in the store, by partition."""
+        return {part: self.store.key(part, self.headers, self.usecols, self.method + "-partition", ratio, split_char)
+                for part in partitions}
+
+    def save_partitions(self, partition_keys, summaries):
+        """keep the samples of the partitions in the store, so a partition added to the table later is
+        the only one to sample, and record that the model uses them."""
+        for part, partition_key in partition_keys.items():
+            if not os.path.exists(self.store.sample_path(partition_key)):
+                self.store.save(partition_key, summaries[part])
+            self.store.acquire(partition_key, self.mdl_name)
+
+    def sample_partitions(self, partitions, ratio, split_char=","):
+        """make a uniform sample of a partitioned table, from the uniform samples of the partitions,
+        in parallel, merged by merge_lines(). The samples of the partitions are reused from the store.
+
+        Args:
+            partitions (list): the partition files.
+            ratio (int): the sample size.
+            split_char (str, optional): the delimiter. Defaults to ",".
+
+        Returns:
+            tuple: the sampled lines, and the number of lines of the table.
+        """
+        # the header is the first line of each partition, if it is not given.
+        b_skip_first_row = self.headers is None
+        partition_keys = self.get_partition_keys(partitions, ratio, split_char)
+        summaries = {part: self.store.load(partition_key) for part, partition_key in partition_keys.items()}
+        missing = [part for part, summary in summaries.items() if summary is None]
+        if missing:
+            with PoolCPU(processes=max(1, min(self.n_jobs, len(missing))), initializer=reseed) as pool:
+                summaries.update(zip(missing, pool.starmap(
+                    sample_lines, [(part, ratio, b_skip_first_row) for part in missing])))
+        self.save_partitions(partition_keys, summaries)
+        if b_skip_first_row:
+            self.sample.header = read_header(partitions[0]).split(split_char)
+        merged = summaries[partitions[0]]
+        for part in partitions[1:]:
+            merged = merge_lines(merged, summaries[part], ratio)
+        return merged
+
     def getyx(self, y, x, dropna=True, b_return_mean=False, groupby=None):
         if self.method == "uniform":
             return self.sample.getyx(
@@ -127,6 +324,46 @@ class DBEstSampling:
             raise TypeError("Unexpected method for sampling.")
 
 
+def shared_scan(file, samplers, split_char=",", b_skip_first_row=False):
+    """read the file once, and feed each line to the scanners of the samplers, prepared by
+    DBEstSampling.prepare_shared_scan(). The lines are split once, up to the last column needed.
+
+    Args:
+        file (str): the data file.
+        samplers (list): the samplers.
+        split_char (str, optional): the delimiter. Defaults to ",".
+        b_skip_first_row (bool, optional): the first line is the header. Defaults to False.
+
+    Returns:
+        list: the header read from the file, None if b_skip_first_row is False.
+    """
+    uniform = [sampler.scanner for sampler in samplers if isinstance(sampler.scanner, UniformScanner)]
+    stratified = [sampler.scanner for sampler in samplers if not isinstance(sampler.scanner, UniformScanner)]
+    max_idx = max([scanner.max_idx for scanner in stratified] + [0])
+    header = None
+    cnt = 0
+    for block, starts, ends in read_line_blocks(file):
+        for line_start, line_end in zip(starts.tolist(), ends.tolist()):
+            line = block[line_start:line_end]
+            if b_skip_first_row:
+                b_skip_first_row = False
+                header = line.decode().strip().lower().split(split_char)
+                continue
+            cnt += 1
+            if cnt % 1000000 == 0:
+                print(f"processed {cnt/1000000:5.0f} million records.")
+            for scanner in uniform:
+                scanner.feed(line)
+            if stratified:
+                splits = line.decode().split(split_char, max_idx + 1)
+                for scanner in stratified:
+                    scanner.feed(splits)
+    for sampler in samplers:
+        if header is not None and isinstance(sampler.scanner, UniformScanner):
+            sampler.headers = header
+    return header
+
+
 # if __name__ == '__main__':
 #     files = '../../resources/pm25.csv'
 #     sampler = DBEstSampling()
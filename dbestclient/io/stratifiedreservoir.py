@@ -5,16 +5,23 @@
 # Q.Ma.2@warwick.ac.uk
 
 
+import copy
 import os
-import subprocess
+import random
 from datetime import datetime
-from os.path import split
-from random import randint, shuffle
+from math import exp, log, log1p
+from operator import itemgetter
+from multiprocessing import Pool as PoolCPU
 import os.path
 
 import dill
 import numpy as np
+import pandas as pd
 
+from dbestclient.io.columnar import ColumnarSource, is_columnar, to_floats
+from dbestclient.io.reservoir import (is_seekable, read_header,
+                                      read_line_blocks, to_float,
+                                      uniform_open)
 from dbestclient.parser.parser import (
     parse_usecols_check_shared_attributes_exist,
     parse_y_check_need_ft_only,
@@ -37,6 +44,11 @@ class StratifiedReservoir:
         self.data_features = {}
         self.data_labels = {}
         self.sample = {}
+        self.dictionaries = []  # the values of the codes of the categorical label, if any.
+        self.scanner = None  # fed by a scan shared with other samples, see plan_scan().
+        # the partitions of the table, if it is partitioned, and their samples, None until they are made.
+        self.partitions = None
+        self.source_format = None  # the format of the file, see get_source_format().
         self.n_jobs = n_jobs
         self.capacity = capacity
         self.warehouse=warehouse
@@ -48,20 +60,19 @@ class StratifiedReservoir:
 
         self.save_sample=True
 
-        if n_jobs == 1 and file_header is not None:
-            self.b_skip_first_row = False
-        else:
-            self.b_skip_first_row = True
+        # the first row is the header, if it is not given.
+        self.b_skip_first_row = file_header is None
 
     def make_sample_for_sql_condition(
         self,
         usecols,
         split_char=",",
-        b_fast=False,
+        b_fast=True,
         b_return_sample=False,
     ):
-        # check is sample already exist
-        if os.path.isfile(self.warehouse +"/"+self.mdl_name+ ".sample"):
+        # check is sample already exist. The samples kept in the sample store are not looked up by model
+        # name, as the name may have been used for a sample of another file or of other columns.
+        if self.save_sample and os.path.isfile(self.warehouse +"/"+self.mdl_name+ ".sample"):
             print("sample exists in warehouse, use it directly.")
             with open(self.warehouse +"/"+ self.mdl_name+ ".sample", "rb") as f:
                 model = dill.load(f)
@@ -113,368 +124,87 @@ class StratifiedReservoir:
         feature_cols: list,
         label_cols: list,
         split_char=",",
-        b_fast=False,
+        b_fast=True,
         b_return_sample=False,
     ):
         print("Start making a sample as requested...")
         t1 = datetime.now()
-        # pre-process the file header
-        if self.file_header is None:
-            with open(self.file_name, "r") as f:
-                file_header_from_file = f.readline().replace("\n", "").lower()
-                headers = file_header_from_file.split(split_char)
-        elif isinstance(self.file_header, list):
-            headers = self.file_header
-        else:
-
-            headers = self.file_header.split(split_char)
-
-        gb_cols_idx = [headers.index(item) for item in gb_cols]
-        if equality_cols is not None:
-            equality_cols_idx = [headers.index(item) for item in equality_cols]
-        categorical_cols = (
-            gb_cols + equality_cols if equality_cols is not None else gb_cols
+        (
+            gb_cols_idx,
+            equality_cols_idx,
+            value_cols_idx,
+            code_cols_idx,
+        ) = self.get_cols_idx(gb_cols, equality_cols, feature_cols, label_cols, split_char)
+        categorical_cols_idx = gb_cols_idx + (equality_cols_idx or [])
+        feature_cols_idx = value_cols_idx[: len(feature_cols)] if feature_cols is not None else []
+        b_real_label = label_cols[1] == "real"
+
+        self.sample_file(
+            gb_cols_idx,
+            equality_cols_idx,
+            value_cols_idx,
+            code_cols_idx,
+            split_char,
+            b_fast,
+            b_ft_only=False,
         )
-        categorical_cols_idx = [headers.index(item) for item in categorical_cols]
-        if feature_cols is not None:
-            feature_cols_idx = [headers.index(item) for item in feature_cols]
-        label_cols_idx = [headers.index(item) for item in [label_cols[0]]]
-
-        if feature_cols is not None:
-            self.relevant_header_idx = (
-                categorical_cols_idx + feature_cols_idx + label_cols_idx
-            )
-        else:
-            self.relevant_header_idx = categorical_cols_idx + label_cols_idx
-
-        if self.n_jobs == 1:
-            cnt = 0
-
-            # the structure of the ft is a 2-depth dict.
-            if equality_cols:  # is not None:
-                with open(self.file_name, "r") as f:
-                    for line in f:
-                        if self.b_skip_first_row:  # self.file_header is None:
-                            # self.file_header = file_header
-                            self.b_skip_first_row = False
-                            continue
-                        cnt += 1
-                        if cnt % 1000000 == 0:
-                            print(f"processed {cnt/1000000:5.0f} million records.")
-                        splits = line.split(split_char)
-                        splits[len(splits) - 1] = splits[len(splits) - 1].replace(
-                            "\n", ""
-                        )
-                        gbs = [splits[i] for i in gb_cols_idx]
-                        equals = [splits[i] for i in equality_cols_idx]
-                        # categoricals = [splits[i]
-                        #                 for i in categorical_cols_idx]
-                        if feature_cols is not None:
-                            features = [splits[i] for i in feature_cols_idx]
-                        labels = [splits[i] for i in label_cols_idx]
-                        key_gb = list2key(gbs)
-                        key_equal = list2key(equals)
-                        if key_equal in self.sample:
-                            if key_gb in self.ft_table[key_equal]:
-                                self.ft_table[key_equal][key_gb] += 1
-                            else:
-                                self.ft_table[key_equal][key_gb] = 1
-                                self.sample[key_equal][key_gb] = []
-                            if len(self.sample[key_equal][key_gb]) < self.capacity:
-                                self.sample[key_equal][key_gb].append(
-                                    gbs + equals + features + labels
-                                    if feature_cols is not None
-                                    else gbs + equals + labels
-                                )
-                            else:
-                                if not b_fast:  # naive simple algorithm
-                                    j = randint(0, cnt)
-                                    if j < self.capacity:
-                                        self.sample[key_equal][key_gb][j] = (
-                                            gbs + equals + features + labels
-                                            if feature_cols is not None
-                                            else gbs + equals + labels
-                                        )
-                                else:  # fast algorithm
-                                    # need to provide an extra ft to store the frequency.
-                                    pass
-
-                        else:
-                            self.ft_table[key_equal] = {}
-                            self.ft_table[key_equal][key_gb] = 1
-                            self.sample[key_equal] = {}
-                            self.sample[key_equal][key_gb] = (
-                                [gbs + equals + features + labels]
-                                if feature_cols is not None
-                                else [gbs + equals + labels]
-                            )
-            else:  # no equality condition, thus the structure of the ft is just 1-depth dictionary
-                with open(self.file_name, "r") as f:
-                    for line in f:
-                        if self.b_skip_first_row:  # self.file_header is None:
-                            # self.file_header = file_header
-                            self.b_skip_first_row = False
-                            continue
-                        cnt += 1
-                        if cnt % 1000000 == 0:
-                            print(f"processed {cnt/1000000:5.0f} million records.")
-                        splits = line.split(split_char)
-                        splits[len(splits) - 1] = splits[len(splits) - 1].replace(
-                            "\n", ""
-                        )
-                        gbs = [splits[i] for i in gb_cols_idx]
-                        # categoricals = [splits[i]
-                        #                 for i in categorical_cols_idx]
-                        if feature_cols is not None:
-                            features = [splits[i] for i in feature_cols_idx]
-                        labels = [splits[i] for i in label_cols_idx]
-                        key_gb = list2key(gbs)
-                        if key_gb in self.sample:
-                            self.ft_table[key_gb] += 1
-                            if len(self.sample[key_gb]) < self.capacity:
-                                self.sample[key_gb].append(
-                                    gbs + features + labels
-                                    if feature_cols is not None
-                                    else gbs + labels
-                                )
-                            else:
-                                if not b_fast:  # naive simple algorithm
-                                    j = randint(0, cnt)
-                                    if j < self.capacity:
-                                        self.sample[key_gb][j] = (
-                                            gbs + features + labels
-                                            if feature_cols is not None
-                                            else gbs + labels
-                                        )
-                                else:  # fast algorithm
-                                    # need to provide an extra ft to store the frequency.
-                                    pass
-
-                        else:
-                            self.ft_table[key_gb] = 1
-                            self.sample[key_gb] = (
-                                [gbs + features + labels]
-                                if feature_cols is not None
-                                else [gbs + labels]
-                            )
-
-            if self.file_header is None:
-                self.file_header = file_header_from_file
-            if b_return_sample:
-                return self.sample, self.ft_table
-
-        else:
-            from multiprocessing import Pool as PoolCPU
-
-            print("parallel sampling is only available in linux.")
-            line_num = int(
-                subprocess.check_output(["wc", "-l", self.file_name]).split()[0]
-            )
-            n_per_file = int(line_num / self.n_jobs) + 1
-
-            split_command = (
-                f"split -l {n_per_file} --numeric-suffixes {self.file_name} tmp_split_"
-            )
-            process = subprocess.Popen(split_command.split(), stdout=subprocess.PIPE)
-            output, error = process.communicate()
-
-            files = []
-            for i in range(self.n_jobs):
-                files.append(
-                    "tmp_split_" + str(i) if i >= 10 else "tmp_split_0" + str(i)
-                )
-
-            pool = PoolCPU(processes=self.n_jobs)
-            results = []
-            fts = []
-            instances = []
-            for idx, file in enumerate(files):
-                if idx == 0:
-                    i = pool.apply_async(
-                        StratifiedReservoir(
-                            file,
-                            file_header=self.file_header,
-                            n_jobs=1,
-                            capacity=self.capacity,
-                        ).make_sample_no_distinct,
-                        (
-                            gb_cols,
-                            equality_cols,
-                            feature_cols,
-                            label_cols,
-                            split_char,
-                            b_fast,
-                            True,
-                        ),
-                    )
-                else:
-                    fh = (
-                        self.file_header
-                        if self.file_header is not None
-                        else file_header_from_file
-                    )
-                    i = pool.apply_async(
-                        StratifiedReservoir(
-                            file, file_header=fh, n_jobs=1, capacity=self.capacity
-                        ).make_sample_no_distinct,
-                        (
-                            gb_cols,
-                            equality_cols,
-                            feature_cols,
-                            label_cols,
-                            split_char,
-                            b_fast,
-                            True,
-                        ),
-                    )
-                instances.append(i)
-
-            for i in instances:
-                result, ft = i.get()
-                results.append(result)
-                fts.append(ft)
-
-            self.sample = results[0]
-            self.ft_table = fts[0]
-            if equality_cols:  # contains predicator with equality, 2 depth dict
-                for result, ft in zip(results[1:], fts[1:]):
-                    for key_equal in result:
-                        if key_equal not in self.sample:
-                            self.sample[key_equal] = result[key_equal]
-                            self.ft_table[key_equal] = ft[key_equal]
-                        else:
-                            for key_gb in ft[key_equal]:
-                                if key_gb not in self.sample[key_equal]:
-                                    self.sample[key_equal][key_gb] = result[key_equal][
-                                        key_gb
-                                    ]
-                                    self.ft_table[key_equal][key_gb] = ft[key_equal][
-                                        key_gb
-                                    ]
-                                else:
-                                    self.sample[key_equal][key_gb] = (
-                                        self.sample[key_equal][key_gb]
-                                        + result[key_equal][key_gb]
-                                    )
-                                    self.ft_table[key_equal][key_gb] += ft[key_equal][
-                                        key_gb
-                                    ]
-                                    if (
-                                        len(self.sample[key_equal][key_gb])
-                                        > self.capacity
-                                    ):
-                                        self.sample[key_equal][key_gb] = self.sample[
-                                            key_equal
-                                        ][key_gb][: self.capacity]
-                                        shuffle(self.sample[key_equal][key_gb])
-
-            else:  # does not contains predicator with equality, 1 depth dict
-                # print("does not contains equality")
-                for result, ft in zip(results[1:], fts[1:]):
-                    for key_gb in result:
-                        # print("key_gb", key_gb)
-
-                        if key_gb not in self.sample:
-                            self.sample[key_gb] = result[key_gb]
-                            self.ft_table[key_gb] = ft[key_gb]
-                        else:
-                            self.sample[key_gb] = self.sample[key_gb] + result[key_gb]
-                            self.ft_table[key_gb] += ft[key_gb]
-                            if len(self.sample[key_gb]) > self.capacity:
-                                shuffle(self.sample[key_gb])
-                                self.sample[key_gb] = self.sample[key_gb][
-                                    : self.capacity
-                                ]
-
-            # delete temporary files
-            for file in files:
-                os.remove(file)
+        if b_return_sample:
+            return self.sample, self.ft_table
 
         # post-process the sample into 3 parts: categoricals, features and labels.
-        s = []
         if not equality_cols:
-            for key in self.sample:
-                s += self.sample[key]
-        else:
-            for key_equal in self.sample:
-                for key_gb in self.sample[key_equal]:
-                    s += self.sample[key_equal][key_gb]
-        s = np.array(s)
-
-        # shuffle
-        np.random.shuffle(s)
-        # print("sample is", s)
-
-        # remove null values for continuous attributes
-        if feature_cols is not None:
-            cols_idx = range(
-                len(categorical_cols_idx),
-                len(categorical_cols_idx) + len(feature_cols_idx) + len(label_cols_idx),
-            )
+            strata = list(self.sample.values())
         else:
-            cols_idx = range(
-                len(categorical_cols_idx),
-                len(categorical_cols_idx) + len(label_cols_idx),
-            )
-        # print("idx is ", cols_idx)
-        s_continuous_cols = s[:, cols_idx]
-        # print("s_continuous_cols", s_continuous_cols)
-        s = s[~np.any(s_continuous_cols == "", axis=1)]
+            strata = [
+                reservoir
+                for key_equal in self.sample
+                for reservoir in self.sample[key_equal].values()
+            ]
 
-        # fix bug: if a whole group is removed due to null values, then this group should be removed from frequency table.
-        # currently only check the NULL group.split
+        # the rows with null values are not sampled, so a group with no sampled row has only null values,
+        # and it is removed from the frequency table.
         # the structure of the ft is a 1-depth dict.
         if not equality_cols:
-            keys_in_ft = list(self.ft_table.keys())
-            # print("self.ft_table", keys_in_ft)
-
-            data_categoricals = s[:, : len(categorical_cols_idx)]
-            if len(data_categoricals[0]) == 1:
-                data_remove_null = set(data_categoricals.reshape(1, -1)[0])
-            else:
-                data_remove_null = set([",".join(i) for i in data_categoricals])
-
-            # print("data_categoricals", data_categoricals)
-
-            # print("data_remove_null", data_remove_null)
-            for k in keys_in_ft:
-                if k not in data_remove_null:
+            for k in list(self.ft_table.keys()):
+                if k not in self.sample:
                     Warning(
                         k
                         + " group is removed from the frequency table, so this group will not be reported in the query result."
                     )
                     del self.ft_table[k]
 
-            # print("S", s)
-            # exit()
+        # the categorical columns are the key of the stratum, so they are repeated for its rows.
+        sizes = [reservoir.size for reservoir in strata]
+        data_categoricals = np.repeat(
+            np.array([reservoir.categoricals for reservoir in strata], dtype=str).reshape(
+                len(strata), len(categorical_cols_idx)
+            ),
+            sizes,
+            axis=0,
+        )
+        values = np.concatenate(
+            [reservoir.values[: reservoir.size] for reservoir in strata]
+            + [np.empty((0, len(value_cols_idx)))]
+        )
+        codes = np.concatenate(
+            [reservoir.codes[: reservoir.size] for reservoir in strata]
+            + [np.empty((0, len(code_cols_idx)), dtype=np.int32)]
+        )
 
-        self.data_categoricals = s[:, : len(categorical_cols_idx)]
+        # shuffle
+        order = np.random.permutation(len(data_categoricals))
+        self.data_categoricals = data_categoricals[order]
+        values = values[order]
         if feature_cols is not None:
-            self.data_features = s[
-                :,
-                len(categorical_cols_idx) : len(categorical_cols_idx)
-                + len(feature_cols_idx),
-            ]
-            self.data_labels = s[
-                :,
-                len(categorical_cols_idx)
-                + len(feature_cols_idx) : len(categorical_cols_idx)
-                + len(feature_cols_idx)
-                + len(label_cols_idx),
-            ]
+            self.data_features = values[:, : len(feature_cols_idx)]
         else:
             self.data_features = None
-            self.data_labels = s[
-                :,
-                len(categorical_cols_idx) : len(categorical_cols_idx)
-                + len(label_cols_idx),
-            ]
-        # print(self.data_features)
-        # print(self.data_labels)
-        self.data_features = self.data_features.astype(float)
-        # print("label_cols", label_cols)
-        if label_cols[1] == "real":
-            self.data_labels = self.data_labels.astype(float).reshape(1, -1)[0]
+        if b_real_label:
+            self.data_labels = values[:, -1]
+        else:
+            self.data_labels = np.array(self.dictionaries[0], dtype=str)[
+                codes[order, 0]
+            ].reshape(-1, 1)
 
         # # print sample
         # if not equality_cols:
@@ -511,282 +241,24 @@ class StratifiedReservoir:
         feature_cols: list,
         label_cols: list,
         split_char=",",
-        b_fast=False,
+        b_fast=True,
         b_return_sample=False,
     ):
         print("Start making a sample as requested...")
         t1 = datetime.now()
-        # pre-process the file header
-        if self.file_header is None:
-            with open(self.file_name, "r") as f:
-                file_header_from_file = f.readline().replace("\n", "").lower()
-                headers = file_header_from_file.split(split_char)
-        elif isinstance(self.file_header, list):
-            headers = self.file_header
-        else:
-
-            headers = self.file_header.split(split_char)
-
-        gb_cols_idx = [headers.index(item) for item in gb_cols]
-        if equality_cols is not None:
-            equality_cols_idx = [headers.index(item) for item in equality_cols]
-        categorical_cols = (
-            gb_cols + equality_cols if equality_cols is not None else gb_cols
+        gb_cols_idx, equality_cols_idx, _, _ = self.get_cols_idx(
+            gb_cols, equality_cols, feature_cols, label_cols, split_char
         )
-        categorical_cols_idx = [headers.index(item) for item in categorical_cols]
-        if feature_cols is not None:
-            feature_cols_idx = [headers.index(item) for item in feature_cols]
-        label_cols_idx = [headers.index(item) for item in [label_cols[0]]]
-
-        if feature_cols is not None:
-            self.relevant_header_idx = (
-                categorical_cols_idx + feature_cols_idx + label_cols_idx
-            )
-        else:
-            self.relevant_header_idx = categorical_cols_idx + label_cols_idx
-
-        if self.n_jobs == 1:
-            cnt = 0
-
-            # the structure of the ft is a 2-depth dict.
-            if equality_cols:  # is not None:
-                with open(self.file_name, "r") as f:
-                    for line in f:
-                        if self.b_skip_first_row:  # self.file_header is None:
-                            # self.file_header = file_header
-                            self.b_skip_first_row = False
-                            continue
-                        cnt += 1
-                        if cnt % 1000000 == 0:
-                            print(f"processed {cnt/1000000:5.0f} million records.")
-                        splits = line.split(split_char)
-                        splits[len(splits) - 1] = splits[len(splits) - 1].replace(
-                            "\n", ""
-                        )
-                        gbs = [splits[i] for i in gb_cols_idx]
-                        equals = [splits[i] for i in equality_cols_idx]
-                        # categoricals = [splits[i]
-                        #                 for i in categorical_cols_idx]
-                        if feature_cols is not None:
-                            features = [splits[i] for i in feature_cols_idx]
-                        labels = [splits[i] for i in label_cols_idx]
-                        key_gb = list2key(gbs)
-                        key_equal = list2key(equals)
-                        if key_equal in self.ft_table:
-                            if key_gb in self.ft_table[key_equal]:
-                                self.ft_table[key_equal][key_gb] += 1
-                            else:
-                                self.ft_table[key_equal][key_gb] = 1
-                            #     self.sample[key_equal][key_gb] = []
-                            # if len(self.sample[key_equal][key_gb]) < self.capacity:
-                            #     self.sample[key_equal][key_gb].append(
-                            #         gbs + equals + features + labels
-                            #         if feature_cols is not None
-                            #         else gbs + equals + labels
-                            #     )
-                            # else:
-                            #     if not b_fast:  # naive simple algorithm
-                            #         j = randint(0, cnt)
-                            #         if j < self.capacity:
-                            #             self.sample[key_equal][key_gb][j] = (
-                            #                 gbs + equals + features + labels
-                            #                 if feature_cols is not None
-                            #                 else gbs + equals + labels
-                            #             )
-                            #     else:  # fast algorithm
-                            #         # need to provide an extra ft to store the frequency.
-                            #         pass
-
-                        else:
-                            self.ft_table[key_equal] = {}
-                            self.ft_table[key_equal][key_gb] = 1
-                            # self.sample[key_equal] = {}
-                            # self.sample[key_equal][key_gb] = (
-                            #     [gbs + equals + features + labels]
-                            #     if feature_cols is not None
-                            #     else [gbs + equals + labels]
-                            # )
-            else:  # no equality condition, thus the structure of the ft is just 1-depth dictionary
-                with open(self.file_name, "r") as f:
-                    for line in f:
-                        if self.b_skip_first_row:  # self.file_header is None:
-                            # self.file_header = file_header
-                            self.b_skip_first_row = False
-                            continue
-                        cnt += 1
-                        if cnt % 1000000 == 0:
-                            print(f"processed {cnt/1000000:5.0f} million records.")
-                        splits = line.split(split_char)
-                        splits[len(splits) - 1] = splits[len(splits) - 1].replace(
-                            "\n", ""
-                        )
-                        gbs = [splits[i] for i in gb_cols_idx]
-                        # categoricals = [splits[i]
-                        #                 for i in categorical_cols_idx]
-                        if feature_cols is not None:
-                            features = [splits[i] for i in feature_cols_idx]
-                        labels = [splits[i] for i in label_cols_idx]
-                        key_gb = list2key(gbs)
-                        if key_gb in self.ft_table:
-                            self.ft_table[key_gb] += 1
-                            # if len(self.sample[key_gb]) < self.capacity:
-                            #     self.sample[key_gb].append(
-                            #         gbs + features + labels
-                            #         if feature_cols is not None
-                            #         else gbs + labels
-                            #     )
-                            # else:
-                            #     if not b_fast:  # naive simple algorithm
-                            #         j = randint(0, cnt)
-                            #         if j < self.capacity:
-                            #             self.sample[key_gb][j] = (
-                            #                 gbs + features + labels
-                            #                 if feature_cols is not None
-                            #                 else gbs + labels
-                            #             )
-                            #     else:  # fast algorithm
-                            #         # need to provide an extra ft to store the frequency.
-                            #         pass
-
-                        else:
-                            self.ft_table[key_gb] = 1
-                            # self.sample[key_gb] = (
-                            #     [gbs + features + labels]
-                            #     if feature_cols is not None
-                            #     else [gbs + labels]
-                            # )
-
-            if self.file_header is None:
-                self.file_header = file_header_from_file
-            # if b_return_sample:
-            #     return self.sample, self.ft_table
 
-        else:
-            from multiprocessing import Pool as PoolCPU
-
-            print("parallel sampling is only available in linux.")
-            line_num = int(
-                subprocess.check_output(["wc", "-l", self.file_name]).split()[0]
-            )
-            n_per_file = int(line_num / self.n_jobs) + 1
-
-            split_command = (
-                f"split -l {n_per_file} --numeric-suffixes {self.file_name} tmp_split_"
-            )
-            process = subprocess.Popen(split_command.split(), stdout=subprocess.PIPE)
-            output, error = process.communicate()
-
-            files = []
-            for i in range(self.n_jobs):
-                files.append(
-                    "tmp_split_" + str(i) if i >= 10 else "tmp_split_0" + str(i)
-                )
-
-            pool = PoolCPU(processes=self.n_jobs)
-            results = []
-            fts = []
-            instances = []
-            for idx, file in enumerate(files):
-                if idx == 0:
-                    i = pool.apply_async(
-                        StratifiedReservoir(
-                            file,
-                            file_header=self.file_header,
-                            n_jobs=1,
-                            capacity=self.capacity,
-                        ).make_sample_no_distinct_ft_only,
-                        (
-                            gb_cols,
-                            equality_cols,
-                            feature_cols,
-                            label_cols,
-                            split_char,
-                            b_fast,
-                            True,
-                        ),
-                    )
-                else:
-                    fh = (
-                        self.file_header
-                        if self.file_header is not None
-                        else file_header_from_file
-                    )
-                    i = pool.apply_async(
-                        StratifiedReservoir(
-                            file, file_header=fh, n_jobs=1, capacity=self.capacity
-                        ).make_sample_no_distinct_ft_only,
-                        (
-                            gb_cols,
-                            equality_cols,
-                            feature_cols,
-                            label_cols,
-                            split_char,
-                            b_fast,
-                            True,
-                        ),
-                    )
-                instances.append(i)
-
-            for i in instances:
-                result, ft = i.get()
-                results.append(result)
-                fts.append(ft)
-
-            # self.sample = results[0]
-            self.ft_table = fts[0]
-            if equality_cols:  # contains predicator with equality, 2 depth dict
-                for result, ft in zip(results[1:], fts[1:]):
-                    for key_equal in result:
-                        if key_equal not in self.ft_table:
-                            # self.sample[key_equal] = result[key_equal]
-                            self.ft_table[key_equal] = ft[key_equal]
-                        else:
-                            for key_gb in ft[key_equal]:
-                                if key_gb not in self.ft_table[key_equal]:
-                                    # self.sample[key_equal][key_gb] = result[key_equal][
-                                    #     key_gb
-                                    # ]
-                                    self.ft_table[key_equal][key_gb] = ft[key_equal][
-                                        key_gb
-                                    ]
-                                else:
-                                    # self.sample[key_equal][key_gb] = (
-                                    #     self.sample[key_equal][key_gb]
-                                    #     + result[key_equal][key_gb]
-                                    # )
-                                    self.ft_table[key_equal][key_gb] += ft[key_equal][
-                                        key_gb
-                                    ]
-                                    # if (
-                                    #     len(self.sample[key_equal][key_gb])
-                                    #     > self.capacity
-                                    # ):
-                                    #     self.sample[key_equal][key_gb] = self.sample[
-                                    #         key_equal
-                                    #     ][key_gb][: self.capacity]
-                                    #     shuffle(self.sample[key_equal][key_gb])
-
-            else:  # does not contains predicator with equality, 1 depth dict
-                # print("does not contains equality")
-                for result, ft in zip(results[1:], fts[1:]):
-                    for key_gb in result:
-                        # print("key_gb", key_gb)
-
-                        if key_gb not in self.ft_table:
-                            # self.sample[key_gb] = result[key_gb]
-                            self.ft_table[key_gb] = ft[key_gb]
-                        else:
-                            # self.sample[key_gb] = self.sample[key_gb] + result[key_gb]
-                            self.ft_table[key_gb] += ft[key_gb]
-                            # if len(self.sample[key_gb]) > self.capacity:
-                            #     shuffle(self.sample[key_gb])
-                            #     self.sample[key_gb] = self.sample[key_gb][
-                            #         : self.capacity
-                            #     ]
-
-            # delete temporary files
-            for file in files:
-                os.remove(file)
+        self.sample_file(
+            gb_cols_idx,
+            equality_cols_idx,
+            [],
+            [],
+            split_char,
+            b_fast,
+            b_ft_only=True,
+        )
 
         # # print sample
         # if not equality_cols:
@@ -813,6 +285,156 @@ class StratifiedReservoir:
         )
         return self.ft_table
 
+    def plan_scan(self, usecols, split_char=",", b_fast=True):
+        """prepare the scanner of make_sample_for_sql_condition(), for a scan of the file shared with
+        other samples. make_sample_for_sql_condition() then uses what the scanner is fed with.
+
+        Args:
+            usecols (dict): the columns to use.
+            split_char (str, optional): the delimiter. Defaults to ",".
+            b_fast (bool, optional): see StratifiedScanner. Defaults to True.
+
+        Returns:
+            StratifiedScanner: the scanner, None if the sample exists in the warehouse under the model name.
+        """
+        if self.save_sample and os.path.isfile(self.warehouse + "/" + self.mdl_name + ".sample"):
+            return None
+        _, usecols = parse_usecols_check_shared_attributes_exist(usecols)
+        gb_cols_idx, equality_cols_idx, value_cols_idx, code_cols_idx = self.get_cols_idx(
+            usecols["gb"], usecols["x_categorical"], usecols["x_continous"], usecols["y"], split_char
+        )
+        if parse_y_check_need_ft_only(usecols):
+            value_cols_idx, code_cols_idx = [], []
+        self.scanner = StratifiedScanner(
+            gb_cols_idx,
+            equality_cols_idx,
+            value_cols_idx,
+            code_cols_idx,
+            self.capacity,
+            b_fast,
+            parse_y_check_need_ft_only(usecols),
+        )
+        return self.scanner
+
+    def get_cols_idx(
+        self,
+        gb_cols: list,
+        equality_cols: list,
+        feature_cols: list,
+        label_cols: list,
+        split_char=",",
+    ):
+        """locate the columns in the file. The header is read from the file if it is not given.
+
+        Returns:
+            tuple: the indexes of the group by columns, of the equality columns (None if there is no
+            equality condition), of the continuous columns kept as float64, the features then a real
+            label, and of the categorical label, kept as codes.
+        """
+        if is_columnar(self.file_name, self.source_format):
+            # the columns are named in the file, or by the header given for a 2-D NPY file.
+            self.file_header = ColumnarSource(self.file_name, self.source_format, self.file_header).columns()
+        elif self.file_header is None:
+            self.file_header = read_header(self.file_name)
+        if isinstance(self.file_header, list):
+            headers = self.file_header
+        else:
+            headers = self.file_header.split(split_char)
+
+        gb_cols_idx = [headers.index(item) for item in gb_cols]
+        equality_cols_idx = None
+        if equality_cols:
+            equality_cols_idx = [headers.index(item) for item in equality_cols]
+        feature_cols_idx = []
+        if feature_cols is not None:
+            feature_cols_idx = [headers.index(item) for item in feature_cols]
+        label_cols_idx = [headers.index(item) for item in [label_cols[0]]]
+        self.relevant_header_idx = (
+            gb_cols_idx + (equality_cols_idx or []) + feature_cols_idx + label_cols_idx
+        )
+
+        # the continuous columns are kept as float64, and a categorical label as int32 codes.
+        if label_cols[1] == "real":
+            return gb_cols_idx, equality_cols_idx, feature_cols_idx + label_cols_idx, []
+        return gb_cols_idx, equality_cols_idx, feature_cols_idx, label_cols_idx
+
+    def sample_file(
+        self,
+        gb_cols_idx: list,
+        equality_cols_idx: list,
+        value_cols_idx: list,
+        code_cols_idx: list,
+        split_char=",",
+        b_fast=True,
+        b_ft_only=False,
+    ):
+        """make the per-stratum samples and the frequency table of the file.
+
+        With n_jobs > 1, the file is cut into n_jobs byte ranges, sampled in place by the workers,
+        and the partial samples are merged pairwise, as a tree. If the table is partitioned, the
+        partitions are sampled instead of the ranges, skipping those sampled already, see partitions.
+
+        Args:
+            gb_cols_idx (list): the indexes of the group by columns.
+            equality_cols_idx (list): the indexes of the equality columns, None if there is no equality condition.
+            value_cols_idx (list): the indexes of the continuous columns kept in the sample.
+            code_cols_idx (list): the indexes of the other categorical columns kept in the sample.
+            split_char (str, optional): the delimiter. Defaults to ",".
+            b_fast (bool, optional): replace the rows of a full reservoir with skips (Algorithm L), instead of
+                drawing a random number per row (Algorithm R). Defaults to True.
+            b_ft_only (bool, optional): only make the frequency table. Defaults to False.
+        """
+        args = (
+            split_char,
+            gb_cols_idx,
+            equality_cols_idx,
+            value_cols_idx,
+            code_cols_idx,
+            self.capacity,
+            b_fast,
+            b_ft_only,
+        )
+        if self.scanner is not None:
+            # the file has been read by a shared scan.
+            self.sample, self.ft_table, self.dictionaries = self.scanner.result()
+            self.scanner = None
+            return
+        if is_columnar(self.file_name, self.source_format):
+            self.sample, self.ft_table, self.dictionaries = sample_columns(
+                ColumnarSource(self.file_name, self.source_format, self.file_header), self.file_header, *args[1:]
+            )
+            return
+        if self.partitions is not None:
+            missing = [part for part, summary in self.partitions.items() if summary is None]
+            tasks = [(part, 0, None, self.b_skip_first_row) + args for part in missing]
+            with PoolCPU(processes=max(1, min(self.n_jobs, len(self.partitions))), initializer=reseed) as pool:
+                self.partitions.update(zip(missing, pool.starmap(sample_byte_range, tasks)))
+                # the samples are merged in place, the partition samples are kept as they are.
+                results = reduce_samples(
+                    pool, [copy.deepcopy(summary) for summary in self.partitions.values()],
+                    self.capacity, equality_cols_idx is not None)
+            self.sample, self.ft_table, self.dictionaries = results
+            return
+        if self.n_jobs == 1 or not is_seekable(self.file_name):
+            # compressed files and streams are read from the start, in one go.
+            self.sample, self.ft_table, self.dictionaries = sample_byte_range(
+                self.file_name, 0, None, self.b_skip_first_row, *args
+            )
+            return
+
+        ranges = split_byte_ranges(self.file_name, self.n_jobs)
+        with PoolCPU(processes=self.n_jobs, initializer=reseed) as pool:
+            results = pool.starmap(
+                sample_byte_range,
+                [
+                    (self.file_name, start, end, self.b_skip_first_row and start == 0)
+                    + args
+                    for start, end in ranges
+                ],
+            )
+            results = reduce_samples(pool, results, self.capacity, equality_cols_idx is not None)
+        self.sample, self.ft_table, self.dictionaries = results
+
     def get_categorical_features_label(self):
         return np.array(self.data_categoricals), self.data_features, self.data_labels
 
@@ -855,3 +477,430 @@ class StratifiedReservoir:
 
 def list2key(lst: list) -> str:
     return ",".join(lst)
+
+
+def reseed():
+    """give each worker its own random state, instead of the one copied from the parent."""
+    random.seed()
+    np.random.seed()
+
+
+def split_byte_ranges(file: str, n_ranges: int) -> list:
+    """cut the file into byte ranges of about the same size. A line belongs to the range it starts in.
+
+    Args:
+        file (str): the file.
+        n_ranges (int): the number of ranges.
+
+    Returns:
+        list: the (start, end) of the ranges.
+    """
+    size = os.path.getsize(file)
+    bounds = [size * i // n_ranges for i in range(n_ranges + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+class StratumReservoir:
+    """The reservoir of a stratum, in typed buffers: the continuous columns as float64, and the
+    categorical ones, other than the key of the stratum, as int32 codes. The buffers grow
+    geometrically up to the capacity, so small strata stay small."""
+
+    __slots__ = ("categoricals", "values", "codes", "size", "n_seen", "w", "next_row")
+
+    def __init__(self, categoricals: list, n_values: int, n_codes: int, capacity: int):
+        self.categoricals = categoricals  # the values of the group by and equality columns.
+        initial = min(capacity, 4)
+        self.values = np.empty((initial, n_values))
+        self.codes = np.empty((initial, n_codes), dtype=np.int32)
+        self.size = 0
+        self.n_seen = 0  # the rows offered to the reservoir.
+        # Algorithm L: the largest of the random keys kept, and the row which replaces one next.
+        self.w = None
+        self.next_row = None
+
+    def append(self, values: list, codes: list):
+        if self.size == len(self.values):
+            grown = 2 * self.size
+            self.values = np.resize(self.values, (grown, self.values.shape[1]))
+            self.codes = np.resize(self.codes, (grown, self.codes.shape[1]))
+        self.replace(self.size, values, codes)
+        self.size += 1
+
+    def replace(self, i: int, values: list, codes: list):
+        self.values[i] = values
+        self.codes[i] = codes
+
+    def skip(self, capacity: int):
+        """draw the next row to go into the full reservoir (Li, "Reservoir-sampling algorithms
+        of time complexity O(n(1+log(N/n)))", 1994), so the rows in between are only counted."""
+        if self.w is None:
+            self.w = exp(log(uniform_open()) / capacity)
+            self.next_row = self.n_seen
+        else:
+            self.w *= exp(log(uniform_open()) / capacity)
+        self.next_row += int(log(uniform_open()) / log1p(-self.w)) + 1
+
+    def trim(self, capacity: int):
+        """drop the spare room of the buffers."""
+        self.values = self.values[: min(self.size, capacity)].copy()
+        self.codes = self.codes[: min(self.size, capacity)].copy()
+
+
+class StratifiedScanner:
+    """The per-stratum reservoirs and the frequency table of the rows of a scan, fed one row at a time.
+    The rows with a null value in the sampled columns are counted, but not sampled.
+
+    Args:
+        gb_cols_idx (list): the indexes of the group by columns.
+        equality_cols_idx (list): the indexes of the equality columns, None if there is no equality condition.
+        value_cols_idx (list): the indexes of the continuous columns kept in the sample.
+        code_cols_idx (list): the indexes of the other categorical columns kept in the sample.
+        capacity (int): the size of the reservoir of each stratum.
+        b_fast (bool, optional): replace the rows of a full reservoir with skips (Algorithm L), instead of
+            drawing a random number per row (Algorithm R). Defaults to True.
+        b_ft_only (bool, optional): only count the rows. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        gb_cols_idx: list,
+        equality_cols_idx: list,
+        value_cols_idx: list,
+        code_cols_idx: list,
+        capacity: int,
+        b_fast=True,
+        b_ft_only=False,
+    ):
+        self.gb_cols_idx = gb_cols_idx
+        self.equality_cols_idx = equality_cols_idx
+        self.value_cols_idx = value_cols_idx
+        self.code_cols_idx = code_cols_idx
+        self.capacity = capacity
+        self.b_fast = b_fast
+        self.b_ft_only = b_ft_only
+        self.sample = {}
+        self.ft_table = {}
+        self.dictionaries = [{} for _ in code_cols_idx]
+        # the columns after the last one needed are not split.
+        self.max_idx = max(gb_cols_idx + (equality_cols_idx or []) + value_cols_idx + code_cols_idx)
+        sampled_cols_idx = value_cols_idx + code_cols_idx
+        if len(sampled_cols_idx) > 1:
+            self.get_sampled_cols = itemgetter(*sampled_cols_idx)
+        else:
+            self.get_sampled_cols = lambda splits: [splits[i] for i in sampled_cols_idx]
+
+    def feed(self, splits: list):
+        """count and sample a row.
+
+        Args:
+            splits (list): the values of the row, split up to max_idx at least.
+        """
+        gbs = [splits[i] for i in self.gb_cols_idx]
+        key_gb = list2key(gbs)
+        if self.equality_cols_idx is not None:
+            equals = [splits[i] for i in self.equality_cols_idx]
+            key_equal = list2key(equals)
+            if key_equal not in self.ft_table:
+                self.ft_table[key_equal] = {}
+                self.sample[key_equal] = {}
+            stratum_ft = self.ft_table[key_equal]
+            stratum_sample = self.sample[key_equal]
+        else:
+            equals = []
+            stratum_ft = self.ft_table
+            stratum_sample = self.sample
+
+        stratum_ft[key_gb] = stratum_ft.get(key_gb, 0) + 1
+        if self.b_ft_only:
+            return
+
+        # skip the rows with null values.
+        if "" in self.get_sampled_cols(splits):
+            return
+        capacity = self.capacity
+        reservoir = stratum_sample.get(key_gb)
+        if reservoir is None:
+            reservoir = StratumReservoir(
+                gbs + equals, len(self.value_cols_idx), len(self.code_cols_idx), capacity
+            )
+            stratum_sample[key_gb] = reservoir
+        reservoir.n_seen += 1
+        if reservoir.size < capacity:
+            j = reservoir.size
+        elif self.b_fast:
+            if reservoir.n_seen < reservoir.next_row:
+                return
+            j = random.randrange(capacity)
+        else:
+            j = random.randrange(reservoir.n_seen)
+            if j >= capacity:
+                return
+
+        values = [to_float(splits[i]) for i in self.value_cols_idx]
+        if any(v != v for v in values):  # not a number.
+            reservoir.n_seen -= 1
+            return
+        codes = encode(self.dictionaries, [splits[i] for i in self.code_cols_idx])
+        if reservoir.size < capacity:
+            reservoir.append(values, codes)
+            if self.b_fast and reservoir.size == capacity:
+                reservoir.skip(capacity)
+        else:
+            reservoir.replace(j, values, codes)
+            if self.b_fast:
+                reservoir.skip(capacity)
+
+    def result(self) -> tuple:
+        """the reservoirs and the frequency table, keyed by the equality values, if any, then by the
+        group by values, and the values of the codes of each column in code_cols_idx."""
+        for reservoir in iter_reservoirs(self.sample, self.equality_cols_idx is not None):
+            reservoir.trim(self.capacity)
+        return self.sample, self.ft_table, [list(dictionary) for dictionary in self.dictionaries]
+
+
+def sample_byte_range(
+    file: str,
+    start: int,
+    end: int,
+    b_skip_first_row: bool,
+    split_char: str,
+    *args,
+) -> tuple:
+    """sample the lines starting in a byte range of the file, with a reservoir per stratum.
+
+    Args:
+        file (str): the file.
+        start (int): the start of the range.
+        end (int): the end of the range, None for the end of the file.
+        b_skip_first_row (bool): skip the first line, the header.
+        split_char (str): the delimiter.
+        args: the arguments of StratifiedScanner.
+
+    Returns:
+        tuple: see StratifiedScanner.result().
+    """
+    scanner = StratifiedScanner(*args)
+    cnt = 0
+    for block, starts, ends in read_line_blocks(file, start=start, end=end):
+        for line_start, line_end in zip(starts.tolist(), ends.tolist()):
+            if b_skip_first_row:
+                b_skip_first_row = False
+                continue
+            cnt += 1
+            if cnt % 1000000 == 0:
+                print(f"processed {cnt/1000000:5.0f} million records.")
+            scanner.feed(block[line_start:line_end].decode().split(split_char, scanner.max_idx + 1))
+    return scanner.result()
+
+
+def reduce_samples(pool, results: list, capacity: int, b_nested: bool) -> tuple:
+    """merge the samples of the parts of a table, as a tree: each round merges pairs of samples in
+    parallel, see merge_samples().
+
+    Args:
+        pool (Pool): the workers.
+        results (list): the samples of the parts.
+        capacity (int): the size of the reservoir of each stratum.
+        b_nested (bool): whether the tables are keyed by the equality values first.
+
+    Returns:
+        tuple: the merged reservoirs, frequency table and dictionaries.
+    """
+    while len(results) > 1:
+        merged = pool.starmap(
+            merge_samples,
+            [(results[i], results[i + 1], capacity, b_nested) for i in range(0, len(results) - 1, 2)],
+        )
+        if len(results) % 2 == 1:
+            merged.append(results[-1])
+        results = merged
+    return results[0]
+
+
+def sample_columns(
+    source,
+    header: list,
+    gb_cols_idx: list,
+    equality_cols_idx: list,
+    value_cols_idx: list,
+    code_cols_idx: list,
+    capacity: int,
+    b_fast=True,
+    b_ft_only=False,
+) -> tuple:
+    """sample a columnar data file, with a reservoir per stratum, reading only the columns needed.
+    Each batch of rows is sampled stratum by stratum at once, and merged into the sample of the
+    batches before it, see merge_samples().
+
+    Args:
+        source (ColumnarSource): the data file.
+        header (list): the columns of the file.
+        args: the other arguments are those of StratifiedScanner, b_fast is not used.
+
+    Returns:
+        tuple: see StratifiedScanner.result().
+    """
+    gb_cols = [header[i] for i in gb_cols_idx]
+    equality_cols = [header[i] for i in equality_cols_idx or []]
+    value_cols = [header[i] for i in value_cols_idx]
+    code_cols = [header[i] for i in code_cols_idx]
+    categorical_cols = gb_cols + equality_cols + code_cols
+    columns = list(dict.fromkeys(categorical_cols + value_cols))
+    b_nested = equality_cols_idx is not None
+    result = ({}, {}, [[] for _ in code_cols])
+    for arrays in source.iter_batches(columns, categorical_cols):
+        batch = sample_batch(arrays, gb_cols, equality_cols, value_cols, code_cols, capacity, b_nested, b_ft_only)
+        result = merge_samples(result, batch, capacity, b_nested)
+    return result
+
+
+def sample_batch(
+    arrays: dict,
+    gb_cols: list,
+    equality_cols: list,
+    value_cols: list,
+    code_cols: list,
+    capacity: int,
+    b_nested: bool,
+    b_ft_only=False,
+) -> tuple:
+    """sample a batch of rows read from a columnar file, as StratifiedScanner does for the lines of
+    a text file: all the rows are counted, and the rows with null values are not sampled.
+
+    Returns:
+        tuple: see StratifiedScanner.result().
+    """
+    def join(cols):
+        keys = pd.Series(arrays[cols[0]], dtype=object)
+        if len(cols) > 1:
+            keys = keys.str.cat([pd.Series(arrays[col], dtype=object) for col in cols[1:]], sep=",")
+        return keys.to_numpy()
+
+    frame = pd.DataFrame({"gb": join(gb_cols)})
+    keys = ["gb"]
+    if b_nested:
+        frame["equal"] = join(equality_cols)
+        keys = ["equal", "gb"]
+    ft_table = {}
+    for key, count in frame.groupby(keys, sort=False).size().items():
+        if b_nested:
+            ft_table.setdefault(key[0], {})[key[1]] = int(count)
+        else:
+            ft_table[key[0] if isinstance(key, tuple) else key] = int(count)
+    sample = {key_equal: {} for key_equal in ft_table} if b_nested else {}
+    if b_ft_only:
+        return sample, ft_table, []
+
+    n = len(frame)
+    values = np.column_stack([to_floats(arrays[col]) for col in value_cols] + [np.empty((n, 0))])
+    codes = np.empty((n, len(code_cols)), dtype=np.int32)
+    dictionaries = []
+    for i, col in enumerate(code_cols):
+        codes[:, i], uniques = pd.factorize(arrays[col])
+        dictionaries.append(list(uniques))
+    valid = ~np.isnan(values).any(axis=1)
+    for col in code_cols:
+        valid &= arrays[col] != ""
+    rows_valid = np.flatnonzero(valid)
+    categorical_cols = gb_cols + equality_cols
+    for key, positions in frame.iloc[rows_valid].groupby(keys, sort=False).indices.items():
+        rows = rows_valid[positions]
+        n_seen = len(rows)
+        if n_seen > capacity:
+            rows = np.random.choice(rows, capacity, replace=False)
+        reservoir = StratumReservoir(
+            [arrays[col][rows[0]] for col in categorical_cols], len(value_cols), len(code_cols), capacity
+        )
+        reservoir.values = values[rows]
+        reservoir.codes = codes[rows]
+        reservoir.size = len(rows)
+        reservoir.n_seen = n_seen
+        if b_nested:
+            sample[key[0]][key[1]] = reservoir
+        else:
+            sample[key[0] if isinstance(key, tuple) else key] = reservoir
+    return sample, ft_table, dictionaries
+
+
+def encode(dictionaries: list, labels: list) -> list:
+    """the codes of the values of the categorical columns, adding the new values to the dictionaries."""
+    return [dictionary.setdefault(label, len(dictionary)) for dictionary, label in zip(dictionaries, labels)]
+
+
+def iter_reservoirs(sample: dict, b_nested: bool):
+    if not b_nested:
+        return iter(sample.values())
+    return (reservoir for stratum in sample.values() for reservoir in stratum.values())
+
+
+def merge_samples(a: tuple, b: tuple, capacity: int, b_nested: bool) -> tuple:
+    """merge the samples and frequency tables of two parts of a file.
+
+    Args:
+        a (tuple): the reservoirs, frequency table and dictionaries of the first part, updated in place.
+        b (tuple): the reservoirs, frequency table and dictionaries of the second part.
+        capacity (int): the size of the reservoir of each stratum.
+        b_nested (bool): whether the tables are keyed by the equality values first.
+
+    Returns:
+        tuple: the merged reservoirs, frequency table and dictionaries.
+    """
+    sample_a, ft_a, dictionaries_a = a
+    sample_b, ft_b, dictionaries_b = b
+
+    # translate the codes of the second part into the dictionaries of the first part.
+    mappings = []
+    for values_a, values_b in zip(dictionaries_a, dictionaries_b):
+        index = {value: code for code, value in enumerate(values_a)}
+        for value in values_b:
+            if value not in index:
+                index[value] = len(values_a)
+                values_a.append(value)
+        mappings.append(np.array([index[value] for value in values_b], dtype=np.int32))
+    if mappings:
+        for reservoir in iter_reservoirs(sample_b, b_nested):
+            for column, mapping in enumerate(mappings):
+                reservoir.codes[:, column] = mapping[reservoir.codes[:, column]]
+
+    if not b_nested:
+        merge_strata(sample_a, ft_a, sample_b, ft_b, capacity)
+        return sample_a, ft_a, dictionaries_a
+    for key_equal in ft_b:
+        if key_equal not in ft_a:
+            ft_a[key_equal] = ft_b[key_equal]
+            sample_a[key_equal] = sample_b.get(key_equal, {})
+        else:
+            merge_strata(sample_a[key_equal], ft_a[key_equal], sample_b.get(key_equal, {}), ft_b[key_equal], capacity)
+    return sample_a, ft_a, dictionaries_a
+
+
+def merge_strata(sample_a: dict, ft_a: dict, sample_b: dict, ft_b: dict, capacity: int):
+    """merge the reservoirs of two parts, stratum by stratum, into sample_a and ft_a.
+
+    A reservoir of a stratum with n_a rows in the first part and n_b in the second is a uniform
+    sample of the union if the number of rows taken from the first part follows the
+    hypergeometric distribution of drawing capacity rows out of n_a + n_b.
+    """
+    for key, n in ft_b.items():
+        ft_a[key] = ft_a.get(key, 0) + n
+    for key, reservoir_b in sample_b.items():
+        reservoir_a = sample_a.get(key)
+        if reservoir_a is None:
+            sample_a[key] = reservoir_b
+            continue
+        n_a = reservoir_a.n_seen
+        n_b = reservoir_b.n_seen
+        reservoir_a.n_seen = n_a + n_b
+        if reservoir_a.size + reservoir_b.size <= capacity:
+            rows_a = np.arange(reservoir_a.size)
+            rows_b = np.arange(reservoir_b.size)
+        else:
+            if n_a + n_b < 10 ** 9:
+                k_a = np.random.hypergeometric(n_a, n_b, capacity)
+            else:  # beyond the range of numpy, the binomial approximation is close enough.
+                k_a = min(max(np.random.binomial(capacity, n_a / (n_a + n_b)), capacity - reservoir_b.size), reservoir_a.size)
+            rows_a = np.random.choice(reservoir_a.size, k_a, replace=False)
+            rows_b = np.random.choice(reservoir_b.size, capacity - k_a, replace=False)
+        reservoir_a.values = np.concatenate([reservoir_a.values[rows_a], reservoir_b.values[rows_b]])
+        reservoir_a.codes = np.concatenate([reservoir_a.codes[rows_a], reservoir_b.codes[rows_b]])
+        reservoir_a.size = len(reservoir_a.values)
@@ -28,13 +28,22 @@ import numpy as np
 
 from gensim.models import Word2Vec
 
+from dbestclient.ml.wordembedding import build_embedding_table, lookup_embeddings
+
 
 class WordEmbedding:
     def __init__(self):
         self.embedding = None
         self.dim = None
+        self.tables = None  # per position in the key, the values and the (vocab, dim) matrix of vectors.
+        self.indexes = None
         print("start training embedding")
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["indexes"] = None  # rebuilt on first use.
+        return state
+
     # def describing(self, Indata):
     # describe = {}
     # for j in range(0, len(Indata.columns.values)):
@@ -101,46 +110,27 @@ class WordEmbedding:
 
         return results
 
-    def predicts(self, keys):
-        print("start embedding inference")
-
-        results = []
-
-        # print("keys are ")
-        # print(self.embedding.keys())
-        # print("size is ", len(self.embedding))
-        # exit()
-
-        for key in keys:
-            # print("predict key")
-            # print(key)
-            # print(type(key))
-            # print(len(key))
-            if len(key) >= 2:
-                ttt = list(self.embedding[key[0] + "_" + str(0)])
-
-                for i in range(1, len(key)):
-                    ttt1 = list(self.embedding[key[i] + "_" + str(i)])
-
-                    ttt = ttt + ttt1
+    def build_tables(self, n_positions: int):
+        """build the lookup table of each position in the group key from the trained vectors.
 
-                results.append(ttt)
-                # print(len(ttt))
-            else:
+        Args:
+            n_positions (int): the number of group by attributes.
+        """
+        self.tables = [build_embedding_table(self.embedding, suffix="_" + str(i))
+                       for i in range(n_positions)]
+        self.indexes = [pd.Index(values) for values, _ in self.tables]
 
-                ttt = list(self.embedding[key[0] + "_" + str(0)])
-
-                # for i in range(1,len(key)):
-                #    ttt1=list(self.embedding[key[i]])
-                #    ttt=ttt+ttt1
-
-                results.append(ttt)
-
-        results = np.reshape(results, (-1, self.dim))
-
-        print("end embedding inference")
-
-        return results
+    def predicts(self, keys):
+        keys = np.asarray(keys, dtype=str).reshape(len(keys), -1)
+        if getattr(self, "tables", None) is None or len(self.tables) < keys.shape[1]:
+            self.build_tables(keys.shape[1])
+        elif getattr(self, "indexes", None) is None:
+            self.indexes = [pd.Index(values) for values, _ in self.tables]
+
+        predictions = [lookup_embeddings(self.indexes[i], self.tables[i][1], keys[:, i], suffix="_" + str(i))
+                       for i in range(keys.shape[1])]
+        results = np.concatenate(predictions, axis=1)
+        return np.reshape(results, (-1, self.dim))
 
 
 def dataframe2sentences(df: pd.DataFrame, gbs: list):
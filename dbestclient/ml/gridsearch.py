@@ -0,0 +1,160 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import hashlib
+import itertools as it
+import json
+import math
+import os
+
+import numpy as np
+
+from dbestclient.ml.trainingscheduler import TrainingScheduler
+
+# the candidates kept after each round of successive halving are 1/ETA of them.
+ETA = 3
+# the candidates are never trained on fewer rows than this, unless the sample is smaller.
+MIN_SEARCH_ROWS = 2000
+
+
+def fingerprint(*arrays) -> str:
+    """get a hash of the training data.
+
+    Args:
+        arrays (np.ndarray or list): the columns of the training data, None for the missing ones.
+
+    Returns:
+        str: the hash.
+    """
+    h = hashlib.sha1()
+    for array in arrays:
+        if array is None:
+            h.update(b"none")
+            continue
+        array = np.asarray(array)
+        if array.dtype.kind == "O":
+            array = array.astype(str)
+        h.update(str((array.dtype.str, array.shape)).encode())
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def fit_and_score(model, args: tuple, kwargs: dict, runtime_config: dict) -> float:
+    """fit a candidate model, with fit(*args, runtime_config, **kwargs), and score it on its training
+    data. Lower is better."""
+    return model.fit(*args, runtime_config, **kwargs).score(runtime_config)
+
+
+def take(array, rows: np.ndarray):
+    """get the rows of a column of the training data, keeping lists as lists."""
+    if array is None:
+        return None
+    if isinstance(array, np.ndarray):
+        return array[rows]
+    return [array[i] for i in rows]
+
+
+def get_combinations(param_grid: dict) -> list:
+    """get all the combinations of the hyper parameters, as dicts."""
+    return [dict(zip(param_grid, combination))
+            for combination in it.product(*(param_grid[name] for name in param_grid))]
+
+
+class GridSearch:
+    """Searches the hyper parameters of a MDN model, by successive halving.
+
+    All the candidates are first trained on a small subsample of the data for a few epochs, in
+    parallel, see TrainingScheduler. The best 1/ETA of them go on to the next round, with ETA times
+    more rows and epochs, until a single candidate is left. The best parameters are kept in the
+    warehouse under a hash of the training data and of the configuration, so creating the model
+    again does not search again.
+
+    Args:
+        config (DbestConfig): the model configuration.
+        runtime_config (dict): the runtime configuration, whose n_jobs is the number of workers.
+    """
+
+    def __init__(self, config, runtime_config: dict):
+        self.config = config
+        self.runtime_config = runtime_config
+        self.path = os.path.join(config.config["warehousedir"], "grid_search")
+
+    def key(self, name: str, param_grid: dict, data_fingerprint: str) -> str:
+        config = dict(self.config.config)
+        config.pop("warehousedir", None)
+        description = [name, data_fingerprint, config, param_grid]
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load(self, key: str):
+        try:
+            with open(os.path.join(self.path, key + ".json"), "r") as f:
+                return json.load(f)["params"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, params: dict):
+        os.makedirs(self.path, exist_ok=True)
+        file = os.path.join(self.path, key + ".json")
+        with open(file + ".tmp", "w") as f:
+            json.dump({"params": params}, f, indent=1)
+        os.replace(file + ".tmp", file)
+
+    def search(self, name: str, param_grid: dict, data: tuple, make_candidate) -> dict:
+        """find the best combination of the hyper parameters.
+
+        Args:
+            name (str): the kind of model, for the cache and the progress report.
+            param_grid (dict): the values of each hyper parameter. "epoch" is the number of epochs
+                of the candidates in the last round.
+            data (tuple): the columns of the training data, of the same length.
+            make_candidate (callable): given a combination, the indexes of the rows and the number of
+                epochs, returns the (model, fit args, fit kwargs) of the candidate, see fit_and_score().
+
+        Returns:
+            dict: the best combination.
+        """
+        combs = get_combinations(param_grid)
+        key = self.key(name, param_grid, fingerprint(*data))
+        params = self.load(key)
+        if params is not None:
+            print("Using the parameters found by an earlier search", params)
+            return params
+        if len(combs) == 1:
+            return combs[0]
+
+        n_rows = len(data[0])
+        n_rounds = math.ceil(math.log(len(combs)) / math.log(ETA))
+        permutation = np.random.permutation(n_rows)
+        scheduler = TrainingScheduler(self.runtime_config)
+        for i in range(n_rounds):
+            # the last round uses 1/ETA of the rows, the whole sample is for the final model.
+            n_sample = min(n_rows, max(MIN_SEARCH_ROWS, int(n_rows * ETA ** (i - n_rounds))))
+            rows = np.sort(permutation[:n_sample])
+            fit_runtime_config = scheduler.worker_runtime_config(len(combs))
+            for comb in combs:
+                n_epoch = max(1, round(comb["epoch"] * ETA ** (i + 1 - n_rounds)))
+                model, args, kwargs = make_candidate(comb, rows, n_epoch)
+                scheduler.submit(name + " " + str(comb) + " on " + str(n_sample) + " rows for " + str(n_epoch) + " epochs",
+                                 fit_and_score, model, args, kwargs, fit_runtime_config)
+            errors = scheduler.run()
+            print("errors for grid search round " + str(i), errors)
+            order = np.argsort(errors, kind="stable")
+            combs = [combs[j] for j in order[:max(1, math.ceil(len(combs) / ETA))]]
+        params = combs[0]
+        self.save(key, params)
+        return params
@@ -18,6 +18,7 @@
 #
 
 import numpy as np
+from scipy.special import ndtr
 
 # from dbestclient.ml.mdn import KdeMdn, RegMdnGroupBy
 
@@ -92,13 +93,40 @@ def prepare_reg_density_data(density, x_lb: float, x_ub: float, groups: list, re
     pre_density = density.predict(
         density_g_points, density_x_points, runtime_config, b_plot=False)
 
-    pre_reg = None if reg is None else reg.predict(
-        reg_g_points, reg_x_points, runtime_config)
+    pre_reg = None
+    if reg is not None:
+        # encode each group once, instead of once per x point.
+        zs_encoded = reg.encode(density_g_points)
+        if zs_encoded is not None:
+            zs_encoded = np.repeat(zs_encoded, n_division, axis=0)
+        pre_reg = reg.predict(
+            reg_g_points, reg_x_points, runtime_config, zs_encoded=zs_encoded)
     if pre_reg is not None:
         pre_reg = np.array(pre_reg).reshape(len(groups), n_division)
 
     return pre_density, pre_reg, step
 
+def prepare_density_cdf(density, x_lb: float, x_ub: float, groups: list, runtime_config):
+    """provide the probability mass within [x_lb, x_ub] for all groups, in one call to the MDN.
+
+    Args:
+        density (KdeMdn): the density model.
+        x_lb (float): lower bound
+        x_ub (float): upper bound
+        groups (list): the groups, either as "g1,g2" strings or as lists of values.
+        runtime_config (dict): the runtime configuration.
+
+    Returns:
+        np.ndarray: the probability mass of each group.
+    """
+    try:  # group key is [g1-g2]
+        density_g_points = [i.split(",") for i in groups]
+    except AttributeError:  # group key is [g1,g2]
+        density_g_points = [list(i) for i in groups]
+
+    return density.predict_cdf(density_g_points, x_lb, x_ub, runtime_config)
+
+
 def prepare_var(density, groups, runtime_config):
     print("groups", groups)
 
@@ -114,6 +142,23 @@ def approx_count(pred_density, step: float):
     return result*step
 
 
+def gm_cdf(pis, mus, sigmas, x_lb: float, x_ub: float):
+    """ the probability mass of gaussian mixtures within [x_lb, x_ub], in closed form.
+
+    Args:
+        pis (np.ndarray): the weights, of shape (n_groups, n_gaussians).
+        mus (np.ndarray): the means, of shape (n_groups, n_gaussians).
+        sigmas (np.ndarray): the standard deviations, of shape (n_groups, n_gaussians).
+        x_lb (float): lower bound
+        x_ub (float): upper bound
+
+    Returns:
+        np.ndarray: the probability mass of each group.
+    """
+    mass = ndtr((x_ub - mus) / sigmas) - ndtr((x_lb - mus) / sigmas)
+    return np.sum(np.multiply(pis, mass), axis=1)
+
+
 def approx_sum(pred_density, pre_reg, step: float):
     multi = np.multiply(pred_density, pre_reg)
     # result = np.sum(multi[:, :-1], axis=1)
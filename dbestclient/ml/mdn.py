@@ -9,6 +9,8 @@ import itertools as it
 import math
 import random
 import sys
+import threading
+import time
 from concurrent import futures
 from copy import deepcopy
 from os import remove
@@ -20,6 +22,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
+from scipy import sparse
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -31,10 +34,19 @@ from torch.distributions import Categorical
 from torch.multiprocessing import Pool
 
 from dbestclient.ml.embedding import WordEmbedding, columns2sentences
-from dbestclient.ml.integral import approx_count, prepare_reg_density_data
+from dbestclient.ml.gridsearch import GridSearch, take
+from dbestclient.ml.integral import (approx_count, gm_cdf,
+                                     prepare_reg_density_data)
 from dbestclient.ml.wordembedding import SkipGram
 
 USE_SKIP_GRAM = True
+# an epoch takes at most this many minibatches, larger samples get larger minibatches.
+MAX_BATCHES_PER_EPOCH = 1000
+DEFAULT_MAX_BATCH_BYTES = 1 << 26
+# early stopping is used only if at least this many rows are held out.
+MIN_VALIDATION_ROWS = 100
+# the parameter cache of a density model starts with room for so many groups, and doubles when full.
+MIN_PARAMETER_CACHE_SIZE = 64
 
 # https://www.katnoria.com/mdn/
 # https://github.com/sagelywizard/pytorch-mdn
@@ -135,6 +147,316 @@ def sample(pi, sigma, mu):
     return sample
 
 
+def batch_forward(model, inputs, device, batch_size: int):
+    """run the network over the inputs in chunks, without tracking gradients.
+
+    Args:
+        model (nn.Module): the network, ending with a MDN layer.
+        inputs (np.ndarray): the input features, one row per point.
+        device (str): the device to run the network on.
+        batch_size (int): the number of rows fed to the network at a time.
+
+    Returns:
+        tuple: (pis, sigmas, mus) as np.ndarray, each of shape (len(inputs), n_gaussians).
+    """
+    tensor_inputs = torch.from_numpy(np.ascontiguousarray(inputs, dtype=np.float32))
+    pis, sigmas, mus = [], [], []
+    with torch.inference_mode():
+        for start in range(0, max(len(tensor_inputs), 1), batch_size):
+            pi, sigma, mu = model(tensor_inputs[start:start + batch_size].to(device))
+            pis.append(pi.cpu().numpy())
+            sigmas.append(sigma.cpu().numpy().reshape(len(pi), -1))
+            mus.append(mu.cpu().numpy().reshape(len(pi), -1))
+    return np.concatenate(pis), np.concatenate(sigmas), np.concatenate(mus)
+
+
+def extend_parameter_cache(cache, keys: list, pis, mus, sigmas):
+    """append the mixture parameters of new groups to a parameter cache.
+
+    The parameters are kept in buffers with room for more groups, which double when full, so adding
+    groups does not copy the cache each time. The rows of the new groups are written before their
+    keys are added to the index, so a reader holding the cache never sees a key without its row. The
+    buffers and the index are replaced, not modified, when the buffers grow.
+
+    Args:
+        cache (tuple): (group index, pis, mus, sigmas), or None for an empty cache.
+        keys (list): the keys of the new groups, not in the cache.
+        pis, mus, sigmas (np.ndarray): the parameters of the new groups.
+
+    Returns:
+        tuple: the cache, with the new groups.
+    """
+    if cache is None:
+        index, buffers = {}, [np.empty((0,) + a.shape[1:], dtype=a.dtype) for a in (pis, mus, sigmas)]
+    else:
+        index, buffers = cache[0], list(cache[1:])
+    n_cached = len(index)
+    n_total = n_cached + len(keys)
+    if n_total > len(buffers[0]):
+        size = max(n_total, 2 * len(buffers[0]), MIN_PARAMETER_CACHE_SIZE)
+        grown = []
+        for buffer, array in zip(buffers, (pis, mus, sigmas)):
+            grown.append(np.empty((size,) + array.shape[1:], dtype=np.result_type(buffer, array)))
+            grown[-1][:n_cached] = buffer[:n_cached]
+        buffers = grown
+        index = dict(index)
+    for buffer, array in zip(buffers, (pis, mus, sigmas)):
+        buffer[n_cached:n_total] = array
+    for i, key in enumerate(keys):
+        index[key] = n_cached + i
+    return (index, *buffers)
+
+
+def get_batch_size(n_rows: int, row_width: int, config) -> int:
+    """get the minibatch size: the configured one, grown with the data so an epoch takes at most
+    MAX_BATCHES_PER_EPOCH steps, as long as a minibatch fits in config "max_batch_bytes".
+
+    Args:
+        n_rows (int): the number of training rows.
+        row_width (int): the number of float32 values per row, features and label.
+        config (DbestConfig): the model configuration.
+
+    Returns:
+        int: the number of rows per minibatch.
+    """
+    batch_size = config.config["batch_size"]
+    max_rows = config.config.get("max_batch_bytes", DEFAULT_MAX_BATCH_BYTES) // (4 * row_width)
+    grown = min(math.ceil(n_rows / MAX_BATCHES_PER_EPOCH), max_rows)
+    return max(1, batch_size, grown)
+
+
+def take_rows(inputs, rows):
+    """get some rows of the input features, a tensor or a scipy sparse matrix, in the same format."""
+    if sparse.issparse(inputs):
+        return inputs[rows.cpu().numpy() if torch.is_tensor(rows) else rows]
+    return inputs[rows]
+
+
+def to_minibatch(inputs, device):
+    """get rows of the input features as a tensor on the device. A scipy sparse matrix becomes a sparse
+    COO tensor, which the first linear layer multiplies without making it dense."""
+    if not sparse.issparse(inputs):
+        return inputs
+    coo = inputs.tocoo()
+    indices = torch.from_numpy(np.vstack((coo.row, coo.col)).astype(np.int64))
+    values = torch.from_numpy(coo.data.astype(np.float32, copy=False))
+    return torch.sparse_coo_tensor(indices, values, coo.shape, device=device)
+
+
+def validation_nll(model, inputs, labels, device, batch_size: int) -> float:
+    """the mean negative log likelihood of the held-out rows."""
+    model.eval()
+    total = 0.0
+    n_rows = inputs.shape[0]
+    with torch.no_grad():
+        for start in range(0, n_rows, batch_size):
+            pi, sigma, mu = model(to_minibatch(inputs[start:start + batch_size], device))
+            loss = mdn_loss(pi, sigma, mu, labels[start:start + batch_size], device)
+            total += loss.item() * len(pi)
+    model.train()
+    return total / n_rows
+
+
+def train_mdn(model, inputs, labels, config, runtime_config, lr: float = 0.001, b_shuffle: bool = True):
+    """train a MDN network on tensors held in memory.
+
+    Each epoch permutes the row indices and feeds the network slices of them, instead of collating
+    the minibatches one row at a time. Sparse inputs, such as one-hot encoded groups, stay sparse: each
+    minibatch is fed to the network as a sparse tensor. If config "early_stopping_patience" is set, a share of the rows,
+    config "validation_ratio", is held out, and the training stops once the negative log likelihood of
+    these rows has not improved for so many epochs; the best network is kept. The training also stops when
+    config "train_time_budget" seconds have passed, if set. n_epoch is the maximum number of epochs.
+
+    Args:
+        model (nn.Module): the network, ending with a MDN layer, on the device.
+        inputs (torch.Tensor or scipy.sparse.csr_matrix): the input features, one row per point, on the
+            device if a tensor.
+        labels (torch.Tensor): the targets, of shape (len(inputs), 1), on the device.
+        config (DbestConfig): the model configuration.
+        runtime_config (dict): the runtime configuration.
+        lr (float, optional): the learning rate. Defaults to 0.001.
+        b_shuffle (bool, optional): feed the rows in a random order in each epoch. Defaults to True.
+
+    Returns:
+        nn.Module: the trained network, in eval mode.
+    """
+    device = runtime_config["device"]
+    n_epoch = config.config["n_epoch"]
+    patience = config.config.get("early_stopping_patience")
+    time_budget = config.config.get("train_time_budget")
+    t_start = time.monotonic()
+
+    # hold out the validation rows, if there are enough of them.
+    n_valid = int(inputs.shape[0] * config.config.get("validation_ratio", 0)) if patience else 0
+    if n_valid >= MIN_VALIDATION_ROWS and n_valid < inputs.shape[0]:
+        permutation = torch.randperm(inputs.shape[0], device=labels.device)
+        valid_idx = permutation[:n_valid]
+        train_idx = permutation[n_valid:]
+        if not b_shuffle:
+            train_idx = train_idx.sort().values
+        valid_inputs, valid_labels = take_rows(inputs, valid_idx), labels[valid_idx]
+        inputs, labels = take_rows(inputs, train_idx), labels[train_idx]
+    else:
+        n_valid = 0
+    n_rows = inputs.shape[0]
+    if sparse.issparse(inputs):
+        # a value of a sparse minibatch takes 5 times the memory of a float32, with its indices.
+        row_width = 5 * math.ceil(inputs.nnz / max(n_rows, 1)) + labels.shape[1]
+    else:
+        row_width = inputs.shape[1] + labels.shape[1]
+    batch_size = get_batch_size(n_rows, row_width, config)
+
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer=optimizer, gamma=0.96)
+    best_nll = math.inf
+    best_state = None
+    n_no_improvement = 0
+    model.train()
+    for epoch in range(n_epoch):
+        if runtime_config["v"]:
+            print("< Epoch {}".format(epoch))
+        order = torch.randperm(n_rows, device=labels.device) if b_shuffle else None
+        b_out_of_time = False
+        for start in range(0, n_rows, batch_size):
+            if order is None:
+                minibatch = inputs[start:start + batch_size]
+                minibatch_labels = labels[start:start + batch_size]
+            else:
+                idx = order[start:start + batch_size]
+                minibatch = take_rows(inputs, idx)
+                minibatch_labels = labels[idx]
+            model.zero_grad()
+            pi, sigma, mu = model(to_minibatch(minibatch, device))
+            loss = mdn_loss(pi, sigma, mu, minibatch_labels, device)
+            loss.backward()
+            optimizer.step()
+            if time_budget is not None and time.monotonic() - t_start > time_budget:
+                b_out_of_time = True
+                break
+        lr_scheduler.step()
+
+        if n_valid > 0:
+            nll = validation_nll(model, valid_inputs, valid_labels, device, batch_size)
+            if nll < best_nll:
+                best_nll = nll
+                best_state = deepcopy(model.state_dict())
+                n_no_improvement = 0
+            else:
+                n_no_improvement += 1
+                if n_no_improvement >= patience:
+                    print("early stopping after epoch " + str(epoch) +
+                          ", the validation loss is " + str(best_nll))
+                    break
+        if b_out_of_time:
+            print("the training time budget of " + str(time_budget) + " seconds is used up after epoch " + str(epoch))
+            break
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    model.eval()
+    return model
+
+
+def concatenate_features(x_points, zs_encoded):
+    """assemble the x points and the encoded groups into a single float32 array, with x in the first column.
+
+    Args:
+        x_points (np.ndarray): the x points.
+        zs_encoded (np.ndarray or scipy.sparse.csr_matrix): the encoded group by values, one row per point.
+
+    Returns:
+        np.ndarray or scipy.sparse.csr_matrix: the input features, sparse if zs_encoded is.
+    """
+    if sparse.issparse(zs_encoded):
+        xs = sparse.csr_matrix(np.asarray(x_points, dtype=np.float32).reshape(-1, 1))
+        return sparse.hstack((xs, zs_encoded), format="csr", dtype=np.float32)
+    zs_encoded = np.asarray(zs_encoded, dtype=np.float32).reshape(len(x_points), -1)
+    xzs = np.empty((len(x_points), zs_encoded.shape[1] + 1), dtype=np.float32)
+    xzs[:, 0] = x_points
+    xzs[:, 1:] = zs_encoded
+    return xzs
+
+
+def groups_to_float(zs) -> np.ndarray:
+    """convert the group by values to floats, for the models without an encoder. Empty values are 0.
+
+    Args:
+        zs (list or np.ndarray): the group by values, one group by attribute.
+
+    Raises:
+        ValueError: if a value is not a number.
+
+    Returns:
+        np.ndarray: the (len(zs), 1) float64 values.
+    """
+    values = np.asarray(zs).reshape(len(zs), -1)[:, 0]
+    if values.dtype.kind in "fiub":
+        return values.astype(np.float64)[:, np.newaxis]
+    values = values.astype(str)
+    values[values == ""] = "0"
+    try:
+        return values.astype(np.float64)[:, np.newaxis]
+    except ValueError:
+        raise ValueError("The group by values are not numbers, please set an encoder.")
+
+
+def fit_encoder(config, zs, xs=None, ys=None, usecols=None):
+    """fit the encoder of the group by values, once per model, to be shared by the density and the
+    regression networks.
+
+    Args:
+        config (DbestConfig): the model configuration, whose "encoder" is onehot, binary or embedding.
+        zs (np.ndarray): the group by values.
+        xs (np.ndarray, optional): the x points, used as context by the embedding. Defaults to None.
+        ys (np.ndarray, optional): the y points, used as context by the embedding. Defaults to None.
+        usecols (dict, optional): the columns, which name the words of the embedding. Defaults to None.
+
+    Raises:
+        ValueError: if the encoder is not onehot, binary or embedding.
+
+    Returns:
+        object: the fitted encoder.
+    """
+    encoder = config.config["encoder"]
+    if encoder == "onehot":
+        return OneHotEncoder(handle_unknown="ignore", dtype=np.float32).fit(zs)
+    if encoder == "binary":
+        return ce.BinaryEncoder(cols=list(range(len(zs[0])))).fit(zs)
+    if encoder == "embedding":
+        if USE_SKIP_GRAM:
+            return SkipGram().fit(zs, xs, ys, usecols=usecols, b_reg=ys is not None,
+                                  dim=config.config["n_embedding_dim"], NG=len(zs[0]))
+        enc = WordEmbedding()
+        enc.fit(columns2sentences(zs, xs, ys), gbs=["gb"],
+                dim=config.config["n_embedding_dim"], NG=len(zs[0]))
+        return enc
+    raise ValueError("Encoding should be binary, onehot or embedding")
+
+
+def encode_groups(enc, encoder: str, zs, b_sparse: bool = False):
+    """encode the group by values with a fitted encoder.
+
+    Args:
+        enc (object): the encoder, see fit_encoder().
+        encoder (str): onehot, binary or embedding.
+        zs (np.ndarray): the group by values.
+        b_sparse (bool, optional): keep the one-hot encodings sparse, for the training. Defaults to False.
+
+    Returns:
+        np.ndarray or scipy.sparse.csr_matrix: the encoded values as a contiguous float32 array, one row
+            per group, or as a float32 sparse matrix for the one-hot encoder if b_sparse.
+    """
+    if encoder == "onehot":
+        encoded = enc.transform(zs)
+        if b_sparse:
+            return sparse.csr_matrix(encoded, dtype=np.float32)
+        encoded = encoded.toarray()
+    elif encoder == "binary":
+        encoded = enc.transform(zs).to_numpy()
+    else:
+        encoded = enc.predicts(zs)
+    return np.ascontiguousarray(encoded, dtype=np.float32)
+
+
 def gaussion_predict(weights: list, mus: list, sigmas: list, xs: list, n_jobs=1):
     if n_jobs == 1:
         result = np.array(
@@ -288,7 +610,7 @@ class GenericMdn:
 class RegMdnGroupBy:
     """This class implements the regression using mixture density network for group by queries."""
 
-    def __init__(self, config, b_normalize_data=True):
+    def __init__(self, config, b_store_training_data=False, b_normalize_data=True):
         # if b_store_training_data:
         self.x_points = None  # query range
         self.y_points = None  # aggregate value
@@ -307,7 +629,7 @@ class RegMdnGroupBy:
         self.last_sigma = None
         self.config = config
         self.b_normalize_data = b_normalize_data
-        self.b_store_training_data=False
+        self.b_store_training_data = b_store_training_data
         self.enc = None
 
     def fit(
@@ -319,6 +641,8 @@ class RegMdnGroupBy:
         lr: float = 0.001,
         n_workers=0,
         usecols=None,
+        enc=None,
+        zs_encoded=None,
     ):
         """fit the MDN regression model.
 
@@ -331,6 +655,9 @@ class RegMdnGroupBy:
             n_hidden_layer (int, optional): the number of hidden layers. Defaults to 1.
             n_mdn_layer_node (int, optional): the node number in the hidden layer. Defaults to 10.
             lr (float, optional): the learning rate of the MDN network for training. Defaults to 0.001.
+            enc (object, optional): the encoder fitted for the model, see fit_encoder(). Defaults to None,
+                to fit one.
+            zs_encoded (np.ndarray, optional): the group by values encoded by enc. Defaults to None.
 
         Raises:
             ValueError: The hidden layer should be 1 or 2.
@@ -345,56 +672,16 @@ class RegMdnGroupBy:
         b_grid_search = self.config.config["b_grid_search"]
         encoder = self.config.config["encoder"]
         device = runtime_config["device"]
-        self.b_store_training_data = runtime_config["plot"]
+        self.b_store_training_data = self.b_store_training_data or runtime_config["plot"]
 
         if not b_grid_search:
-            if encoder == "onehot":
-                self.enc = OneHotEncoder(handle_unknown="ignore")
-                zs_encoded = z_group
-                zs_encoded = self.enc.fit_transform(zs_encoded).toarray()
-            elif encoder == "binary":
-                # print(z_group)
-                # prepare column names for binary encoding
-                columns = list(range(len(z_group[0])))
-                self.enc = ce.BinaryEncoder(cols=columns)
-                zs_encoded = self.enc.fit_transform(z_group).to_numpy()
-            elif encoder == "embedding":
-                # from datetime import datetime
-                # print("start the columns2sentences process")
-
-                if USE_SKIP_GRAM:
-                    self.enc = SkipGram().fit(
-                        z_group, x_points, y_points, usecols=usecols,dim=self.config.config["n_embedding_dim"],NG=len(z_group[0]),
-                    )
-                else:
-                    sentences = columns2sentences(z_group, x_points, y_points)
-                    # print(sentences, len(sentences))
-                    print("start embedding process")
-                    # t1 = datetime.now()
-                    self.enc = WordEmbedding()
-                    # print(len(z_group[0]))
-                    self.enc.fit(
-                        sentences,
-                        gbs=["gb"],
-                        dim=self.config.config["n_embedding_dim"],
-                        NG=len(z_group[0]),
-                    )
-                # t2 = datetime.now()
-                # print("Embedding time is ", (t2-t1).total_seconds())
-
-                # gbs_data = z_group.reshape(1,-1)[0]
-                # print("gbs_data    ",len(z_group), "some samples: ",z_group[0:10])
-                # print("zgroup")
-                # print(z_group)
-                # print(type(z_group))
-                # exit()
-                print("embedding inference...")
-                zs_encoded = self.enc.predicts(z_group)
-                # print("zs_encoded")
-                # print(zs_encoded)
-                # print(type(zs_encoded))
-                # exit()
-                # raise TypeError("embedding is not supported yet.")
+            if encoder in ["onehot", "binary", "embedding"]:
+                # the encoder may be fitted once for the model, and shared with the density network.
+                self.enc = enc if enc is not None else fit_encoder(
+                    self.config, z_group, x_points, y_points, usecols)
+                if zs_encoded is None:
+                    print("encoding the groups...")
+                    zs_encoded = encode_groups(self.enc, encoder, z_group, b_sparse=True)
 
             print("start normalizing data...")
             if self.b_normalize_data:
@@ -405,12 +692,8 @@ class RegMdnGroupBy:
                 self.widthy = np.max(y_points) - np.min(y_points)
 
                 if x_points is not None:
-                    x_points = np.array(
-                        [normalize(i, self.meanx, self.widthx) for i in x_points]
-                    )
-                y_points = np.array(
-                    [normalize(i, self.meany, self.widthy) for i in y_points]
-                )
+                    x_points = normalize(np.asarray(x_points, dtype=np.float64), self.meanx, self.widthx)
+                y_points = normalize(np.asarray(y_points, dtype=np.float64), self.meany, self.widthy)
             if self.b_store_training_data:
                 print("xpoints are saved.")
                 if x_points is not None:
@@ -425,33 +708,17 @@ class RegMdnGroupBy:
                 self.z_points = None
             
             print("transform data from MDN training...")
-            if encoder in ["onehot", "binary", "embedding"]:
-                if x_points is not None:
-                    xs_encoded = x_points[:, np.newaxis]
-                    xzs_encoded = np.concatenate(
-                        [xs_encoded, zs_encoded], axis=1
-                    )#.tolist()
-                else:
-                    # print(zs_encoded)
-                    xzs_encoded = zs_encoded#.tolist()
-                    # print(xzs_encoded[:10])
-                #tensor_xzs = torch.stack([torch.Tensor(i) for i in xzs_encoded])
-                tensor_xzs = torch.from_numpy(xzs_encoded.astype(np.float32))
-                # print("tensor_xzs", len(tensor_xzs))
-                # print(tensor_xzs)
-
+            if encoder not in ["onehot", "binary", "embedding"]:
+                zs_encoded = groups_to_float(z_group)
+            if x_points is not None:
+                xzs_encoded = concatenate_features(x_points, zs_encoded)
+            elif sparse.issparse(zs_encoded):
+                xzs_encoded = sparse.csr_matrix(zs_encoded, dtype=np.float32)
             else:
-                xzs = [
-                    [x_point, z_point] for x_point, z_point in zip(x_points, z_group)
-                ]
-                tensor_xzs = torch.stack(
-                    [torch.Tensor(i) for i in xzs]
-                )  # transform to torch tensors
-            # print("y_points", len(y_points))
-            # print(y_points[:10])
-            y_points = y_points[:, np.newaxis]
-            # tensor_ys = torch.stack([torch.Tensor(i) for i in y_points])
-            tensor_ys = torch.from_numpy(y_points.astype(np.float32))
+                xzs_encoded = np.ascontiguousarray(zs_encoded, dtype=np.float32)
+            # sparse features, the one-hot encoded groups, stay on the host, see train_mdn().
+            tensor_xzs = xzs_encoded if sparse.issparse(xzs_encoded) else torch.from_numpy(xzs_encoded)
+            tensor_ys = torch.from_numpy(np.ascontiguousarray(np.asarray(y_points)[:, np.newaxis], dtype=np.float32))
             # print("tensor_ys", len(tensor_ys))
             # print(tensor_ys)
             # exit()
@@ -459,7 +726,8 @@ class RegMdnGroupBy:
             print("finish transforming data from MDN training...")
 
             # move variables to cuda
-            tensor_xzs = tensor_xzs.to(device)
+            if torch.is_tensor(tensor_xzs):
+                tensor_xzs = tensor_xzs.to(device)
             tensor_ys = tensor_ys.to(device)
 
             # print("tensor_xzs")
@@ -467,36 +735,11 @@ class RegMdnGroupBy:
             # print("tensor_ys")
             # print(tensor_ys)
 
-            my_dataset = torch.utils.data.TensorDataset(
-                tensor_xzs, tensor_ys
-            )  # create your dataloader
-            # print("my_dataset")
-            # print(my_dataset)
-            my_dataloader = torch.utils.data.DataLoader(
-                my_dataset,
-                batch_size=self.config.config["batch_size"],
-                shuffle=True,
-                num_workers=n_workers,
-            )
-
+            if encoder not in ["onehot", "binary", "embedding"]:
+                raise ValueError("Encoding should be binary or onehot")
+            input_dim = np.shape(zs_encoded)[1]
             if x_points is not None:
-                if encoder == "onehot":
-                    input_dim = sum([len(i) for i in self.enc.categories_]) + 1
-                elif encoder == "binary":
-                    input_dim = len(self.enc.base_n_encoder.feature_names) + 1
-                elif encoder == "embedding":
-                    input_dim = self.enc.dim + 1
-                else:
-                    raise ValueError("Encoding should be binary or onehot")
-            else:
-                if encoder == "onehot":
-                    input_dim = sum([len(i) for i in self.enc.categories_])
-                elif encoder == "binary":
-                    input_dim = len(self.enc.base_n_encoder.feature_names)
-                elif encoder == "embedding":
-                    input_dim = self.enc.dim
-                else:
-                    raise ValueError("Encoding should be binary or onehot")
+                input_dim += 1
 
             # initialize the model
             if n_hidden_layer == 1:
@@ -523,33 +766,15 @@ class RegMdnGroupBy:
 
             self.model = self.model.to(device)
 
-            optimizer = optim.Adam(self.model.parameters(), lr=lr)
-            decay_rate = 0.96
-            my_lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(
-                optimizer=optimizer, gamma=decay_rate
-            )
-            for epoch in range(n_epoch):
-                if runtime_config["v"]:
-                    if epoch % 1 == 0:
-                        print("< Epoch {}".format(epoch))
-                # train the model
-                for minibatch, labels in my_dataloader:
-                    minibatch.to(device)
-                    labels.to(device)
-                    self.model.zero_grad()
-                    pi, sigma, mu = self.model(minibatch)
-                    loss = mdn_loss(pi, sigma, mu, labels, device)
-                    loss.backward()
-                    optimizer.step()
-                my_lr_scheduler.step()
-            self.model.eval()
+            train_mdn(self.model, tensor_xzs, tensor_ys, self.config, runtime_config, lr=lr)
             print("Finish regression training.")
             return self
         else:
-            return self.fit_grid_search(z_group, x_points, y_points, runtime_config)
+            return self.fit_grid_search(z_group, x_points, y_points, runtime_config,
+                                        usecols=usecols, enc=enc, zs_encoded=zs_encoded)
 
     def fit_grid_search(
-        self, z_group: list, x_points: list, y_points: list, runtime_config
+        self, z_group: list, x_points: list, y_points: list, runtime_config, usecols=None, enc=None, zs_encoded=None
     ):
         """use grid search to tune the hyper parameters.
 
@@ -557,10 +782,19 @@ class RegMdnGroupBy:
             z_group (list): group by values
             x_points (list): independent values
             y_points (list): dependent values
+            usecols (dict, optional): the columns. Defaults to None.
+            enc (object, optional): the encoder fitted for the model. Defaults to None, to fit one,
+                shared by all the candidate networks.
+            zs_encoded (np.ndarray, optional): the group by values encoded by enc. Defaults to None.
 
         Returns:
             RegMdnGroupBy: the fitted model
         """
+        if enc is None:
+            enc = fit_encoder(self.config, z_group, x_points, y_points, usecols)
+            zs_encoded = None
+        if zs_encoded is None:
+            zs_encoded = encode_groups(enc, self.config.config["encoder"], z_group, b_sparse=True)
         param_grid = {
             "epoch": [5],
             "lr": [0.001],
@@ -571,38 +805,20 @@ class RegMdnGroupBy:
         # param_grid = {'epoch': [5], 'lr': [0.001], 'node': [
         #     5], 'hidden': [1], 'gaussian': [3]}
 
-        errors = []
-        combinations = it.product(*(param_grid[Name] for Name in param_grid))
-        combinations = list(combinations)
-        combs = []
-        for combination in combinations:
-            idx = 0
-            comb = {}
-            # print(combination)
-            for key in param_grid:
-                comb[key] = combination[idx]
-                idx += 1
-            combs.append(comb)
-
-        self.b_store_training_data = True
-        for para in combs:
-            print("Grid search for parameter set :", para)
+        def make_candidate(para, rows, n_epoch):
             config = self.config.copy()
             config.config["n_gaussians_reg"] = para["gaussian_reg"]
             # config.config["n_gaussians_density"] = para['gaussian_density']
-            config.config["n_epoch"] = para["epoch"]
+            config.config["n_epoch"] = n_epoch
             config.config["n_hidden_layer"] = para["hidden"]
             config.config["n_mdn_layer_node_reg"] = para["node"]
             config.config["b_grid_search"] = False
+            args = (take(z_group, rows), take(x_points, rows), take(y_points, rows))
+            kwargs = {"lr": para["lr"], "enc": enc, "zs_encoded": zs_encoded[rows]}
+            return RegMdnGroupBy(config, b_store_training_data=True), args, kwargs
 
-            instance = RegMdnGroupBy(config, b_store_training_data=True).fit(
-                z_group, x_points, y_points, runtime_config, lr=para["lr"]
-            )
-            errors.append(instance.score(runtime_config))
-
-        print("errors for grid search ", errors)
-        index = errors.index(min(errors))
-        para = combs[index]
+        para = GridSearch(self.config, runtime_config).search(
+            "regression", param_grid, (z_group, x_points, y_points), make_candidate)
         print("Finding the best configuration for the network", para)
 
         self.b_store_training_data = False
@@ -623,25 +839,40 @@ class RegMdnGroupBy:
         config.config["b_grid_search"] = False
 
         instance = RegMdnGroupBy(config).fit(
-            z_group, x_points, y_points, runtime_config, lr=para["lr"]
+            z_group, x_points, y_points, runtime_config, lr=para["lr"], enc=enc, zs_encoded=zs_encoded
         )
         print("-" * 80)
         return instance
 
+    def encode(self, z_group: list):
+        """encode the group by values with the encoder of the model.
+
+        Args:
+            z_group (list): the group by values.
+
+        Returns:
+            np.ndarray: the encoded values, None if the model uses no encoder.
+        """
+        encoder = self.config.config["encoder"]
+        if encoder not in ["onehot", "binary", "embedding"]:
+            return None
+        return encode_groups(self.enc, encoder, np.array(z_group))
+
     def predict(
-        self, z_group: list, x_points: list, runtime_config) -> list:
+        self, z_group: list, x_points: list, runtime_config, zs_encoded=None) -> np.ndarray:
         """provide predictions for given groups and points.
 
         Args:
             z_group (list): the group by values
             x_points (list): the corresponding x points
+            zs_encoded (np.ndarray, optional): the group by values, already encoded by self.enc. Defaults to None.
             b_plot (bool, optional): to plot the data or not.. Defaults to False.
 
         Raises:
             Exception: [description]
 
         Returns:
-            list: the predictions.
+            np.ndarray: the predictions.
         """
         # torch.set_num_threads(4)
         # check input data type, and convert to np.array
@@ -654,70 +885,36 @@ class RegMdnGroupBy:
         device = runtime_config["device"]
 
         if encoder == "no":
-            convert2float = True
-            if convert2float:
-                try:
-                    zs_float = []
-                    for item in z_group:
-                        if item[0] == "":
-                            zs_float.append([0.0])
-                        else:
-                            zs_float.append([(float)(item[0])])
-                    z_group = zs_float
-                except:
-                    raise Exception
+            z_group = groups_to_float(z_group)
 
         if self.b_normalize_data and x_points is not None:
             x_points = normalize(x_points, self.meanx, self.widthx)
 
-        if encoder == "onehot":
-            # zs_encoded = z_group  # [:, np.newaxis]
-            zs_encoded = self.enc.transform(z_group).toarray()
-            if x_points is not None:
-                x_points = x_points[:, np.newaxis]
-                xzs_encoded = np.concatenate([x_points, zs_encoded], axis=1).tolist()
-            else:
-                xzs_encoded = zs_encoded
-            tensor_xzs = torch.stack([torch.Tensor(i) for i in xzs_encoded])
-        elif encoder == "binary":
-            zs_encoded = self.enc.transform(z_group).to_numpy()
-            if x_points is not None:
-                x_points = x_points[:, np.newaxis]
-                xzs_encoded = np.concatenate([x_points, zs_encoded], axis=1).tolist()
-            else:
-                xzs_encoded = zs_encoded
-            tensor_xzs = torch.stack([torch.Tensor(i) for i in xzs_encoded])
-        elif encoder == "embedding":
-            zs_encoded = self.enc.predicts(z_group)
-            if x_points is not None:
-                x_points = x_points[:, np.newaxis]
-                xzs_encoded = np.concatenate([x_points, zs_encoded], axis=1).tolist()
-            else:
-                xzs_encoded = zs_encoded
-            tensor_xzs = torch.stack([torch.Tensor(i) for i in xzs_encoded])
-
+        if zs_encoded is not None:
+            pass  # encoded by the caller, once per group.
+        elif encoder in ["onehot", "binary", "embedding"]:
+            zs_encoded = encode_groups(self.enc, encoder, z_group)
         else:
-            xzs = [[x_point, z_point] for x_point, z_point in zip(x_points, z_group)]
-            tensor_xzs = torch.stack([torch.Tensor(i) for i in xzs])
+            zs_encoded = z_group
+        if x_points is not None:
+            xzs_encoded = concatenate_features(x_points, zs_encoded)
+        else:
+            xzs_encoded = zs_encoded
 
-        tensor_xzs = tensor_xzs.to(device)
         self.model = self.model.to(device)
 
-        pis, sigmas, mus = self.model(tensor_xzs)
+        pis, sigmas, mus = batch_forward(
+            self.model, xzs_encoded, device, runtime_config["inference_batch_size"])
         if not b_plot:
-            pis = pis.cpu().detach().numpy()  # [0]
-            # sigmas = sigmas.detach().numpy().reshape(len(sigmas), -1)[0]
-            mus = mus.cpu().detach().numpy().reshape(len(z_group), -1)  # [0]
             predictions = np.sum(np.multiply(pis, mus), axis=1)
 
             if self.b_normalize_data:
-                predictions = [
-                    denormalize(pred, self.meany, self.widthy) for pred in predictions
-                ]
+                predictions = denormalize(predictions, self.meany, self.widthy)
             return predictions
         else:
             from mpl_toolkits.mplot3d import Axes3D
-            samples = sample(pis, sigmas, mus).data.numpy().reshape(-1)
+            samples = sample(torch.from_numpy(pis), torch.from_numpy(sigmas[:, :, np.newaxis]),
+                             torch.from_numpy(mus[:, :, np.newaxis])).data.numpy().reshape(-1)
             if self.b_normalize_data:
                 samples = [
                     denormalize(pred, self.meany, self.widthy) for pred in samples
@@ -1318,13 +1515,37 @@ class KdeMdn:
         self.widthx = None
         self.config = config
         self.b_normalize_data = b_normalize_data
-
-    def fit(self, zs: list, xs: list, runtime_config, lr=0.001, n_workers=0):
+        # (group index, pis, mus, sigmas), the mixture parameters of the groups seen so far.
+        self.parameter_cache = None
+        # serializes the updates of the parameter cache, by concurrent queries.
+        self.parameter_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("parameter_lock", None)
+        if state.get("parameter_cache") is not None:
+            with self.parameter_lock:
+                index, pis, mus, sigmas = self.parameter_cache
+                # the buffers are saved without their free room.
+                n_cached = len(index)
+                state["parameter_cache"] = (dict(index), pis[:n_cached], mus[:n_cached], sigmas[:n_cached])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # models serialized before the cache was introduced do not have the attribute.
+        self.__dict__.setdefault("parameter_cache", None)
+        self.parameter_lock = threading.Lock()
+
+    def fit(self, zs: list, xs: list, runtime_config, lr=0.001, n_workers=0, enc=None, zs_encoded=None):
         """fit the density for the data, to support group by queries.
 
         Args:
             zs (list): the group values
             xs (list): the independent variables.
+            enc (object, optional): the encoder fitted for the model, see fit_encoder(). Defaults to None,
+                to fit one.
+            zs_encoded (np.ndarray, optional): the group by values encoded by enc. Defaults to None.
             b_normalize (bool, optional): normalize the data before training the MDN network. Defaults to True.
             num_gaussians (int, optional): the number of gaussions in the MDN network. Defaults to 20.
             num_epoch (int, optional): number of epoches for training. Defaults to 20.
@@ -1348,6 +1569,7 @@ class KdeMdn:
         b_grid_search = self.config.config["b_grid_search"]
         encoder = self.config.config["encoder"]
         device = runtime_config["device"]
+        self.parameter_cache = None
 
         if not self.config.config["b_grid_search"]:
             if self.b_store_training_data:
@@ -1361,110 +1583,38 @@ class KdeMdn:
                 self.meanx = (np.max(xs) + np.min(xs)) / 2
                 self.widthx = np.max(xs) - np.min(xs)
 
-                xs = np.array([self.normalize(i, self.meanx, self.widthx) for i in xs])
+                xs = self.normalize(np.asarray(xs, dtype=np.float64), self.meanx, self.widthx)
                 # self.b_normalize_data = True
                 if encoder == "no":
-                    convert2float = True
-                    if convert2float:
-                        try:
-                            zs_float = []
-                            for item in zs:
-                                if item[0] == "":
-                                    zs_float.append([0.0])
-                                else:
-                                    zs_float.append([(float)(item[0])])
-                            zs = np.array(zs_float)
-                        except:
-                            raise Exception
-
+                    zs = groups_to_float(zs)
                     self.meanz = (np.max(zs) + np.min(zs)) / 2
                     self.widthz = np.max(zs) - np.min(zs)
+                    zs = self.normalize(zs, self.meanz, self.widthz)
 
-                    zs = np.array(
-                        [self.normalize(i, self.meanz, self.widthz) for i in zs]
-                    )
-
-            if encoder == "onehot":
-                self.enc = OneHotEncoder(handle_unknown="ignore")
-                zs_encoded = self.enc.fit_transform(zs).toarray()
-                # len(self.enc.categories_[0])
-                input_dim = sum([len(i) for i in self.enc.categories_]) + 0
-                tensor_zs = torch.stack(
-                    [torch.Tensor(i) for i in zs_encoded]
-                )  # transform to torch tensors
-            elif encoder == "binary":
-                columns = list(range(len(zs[0])))
-                self.enc = ce.BinaryEncoder(cols=columns)
-                zs_encoded = self.enc.fit_transform(zs).to_numpy()
-                input_dim = len(self.enc.base_n_encoder.feature_names) + 0
-                tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
-            elif encoder == "embedding":
-
-                # from datetime import datetime
-                if USE_SKIP_GRAM:
-                    self.enc = SkipGram().fit(zs, xs, None, usecols=None, b_reg=False,dim=self.config.config["n_embedding_dim"],NG=len(zs[0]),)
+            if encoder in ["onehot", "binary", "embedding"]:
+                # the encoder may be fitted once for the model, and shared with the regression network.
+                self.enc = enc if enc is not None else fit_encoder(self.config, zs, xs)
+                if zs_encoded is None:
+                    zs_encoded = encode_groups(self.enc, encoder, zs, b_sparse=True)
+                if sparse.issparse(zs_encoded):
+                    tensor_zs = sparse.csr_matrix(zs_encoded, dtype=np.float32)
                 else:
-                    sentences = columns2sentences(zs, xs, ys_data=None)
-                    self.enc = WordEmbedding()
-                    # print(zs)
-                    self.enc.fit(
-                        sentences,
-                        gbs=["gb"],
-                        dim=self.config.config["n_embedding_dim"],
-                        NG=len(zs[0]),
-                    )
-                # t1= datetime.now()
-                # self.enc = WordEmbedding()
-                # # print(zs)
-                # self.enc.fit(
-                #     sentences,
-                #     gbs=["gb"],
-                #     dim=self.config.config["n_embedding_dim"],
-                #     NG=len(zs[0]),
-                # )
-                # t2 = datetime.now()
-                # print("Embedding time cost is ", (t2-t1).total_seconds())
-
-                # gbs_data = zs.reshape(1,-1)[0]
-
-                # print("zgroup")
-                # print(zs)
-                # print(type(zs))
-                # # exit()
-                # zs_encoded = self.enc.predicts(zs)
-                # print("zs_encoded")
-                # print(zs_encoded)
-                # print(type(zs_encoded))
-                # # exit()
-
-                zs_encoded = self.enc.predicts(zs)
-                tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
-                input_dim = self.enc.dim
-                # raise TypeError("embedding is not supported yet.")
+                    tensor_zs = torch.from_numpy(np.ascontiguousarray(zs_encoded, dtype=np.float32))
+                input_dim = tensor_zs.shape[1]
             else:
                 input_dim = 1
-                tensor_zs = torch.stack([torch.Tensor(i) for i in zs])
-            xs = xs[:, np.newaxis]
-            tensor_xs = torch.stack([torch.Tensor(i) for i in xs])
+                tensor_zs = torch.from_numpy(np.ascontiguousarray(zs, dtype=np.float32).reshape(-1, 1))
+            tensor_xs = torch.from_numpy(np.ascontiguousarray(np.asarray(xs)[:, np.newaxis], dtype=np.float32))
 
             # move variables to device
             tensor_xs = tensor_xs.to(device)
-            tensor_zs = tensor_zs.to(device)
+            if torch.is_tensor(tensor_zs):
+                tensor_zs = tensor_zs.to(device)
 
             # print("zs_encoded", zs_encoded)
             # # print("gb_encoded", tensor_zs)
             # raise Exception
 
-            my_dataset = torch.utils.data.TensorDataset(
-                tensor_zs, tensor_xs
-            )  # create your dataloader
-            my_dataloader = torch.utils.data.DataLoader(
-                my_dataset,
-                batch_size=self.config.config["batch_size"],
-                shuffle=False,
-                num_workers=n_workers,
-            )
-
             # initialize the model
             if hidden == 1:
                 self.model = nn.Sequential(
@@ -1487,45 +1637,35 @@ class KdeMdn:
 
             self.model = self.model.to(device)
 
-            optimizer = optim.Adam(self.model.parameters(), lr=lr)
-            decayRate = 0.96
-            my_lr_scheduler = torch.optim.lr_scheduler.ExponentialLR(
-                optimizer=optimizer, gamma=decayRate
-            )
-            for epoch in range(num_epoch):
-                if runtime_config["v"]:
-                    if epoch % 1 == 0:
-                        print("< Epoch {}".format(epoch))
-                # train the model
-                for minibatch, labels in my_dataloader:
-                    self.model.zero_grad()
-                    # move variables to device
-                    minibatch.to(device)
-                    labels.to(device)
-                    pi, sigma, mu = self.model(minibatch)
-                    loss = mdn_loss(pi, sigma, mu, labels, device)
-                    loss.backward()
-                    optimizer.step()
-                my_lr_scheduler.step()
-            # turn the model to eval mode.
-            self.model.eval()
+            # the rows are fed in their order, as before.
+            train_mdn(self.model, tensor_zs, tensor_xs, self.config, runtime_config, lr=lr, b_shuffle=False)
             print("finish mdn training...")
             return self
         else:  # grid search
             # , b_normalize=b_normalize
-            return self.fit_grid_search(zs, xs, runtime_config)
+            return self.fit_grid_search(zs, xs, runtime_config, enc=enc, zs_encoded=zs_encoded)
 
-    def fit_grid_search(self, zs: list, xs: list, runtime_config):  # , b_normalize=True
+    def fit_grid_search(self, zs: list, xs: list, runtime_config, enc=None, zs_encoded=None):  # , b_normalize=True
         """use grid search to tune the hyper parameters.
 
         Args:
             zs (list): the group by values.
             xs (list): the independent variables.
             b_normalize (bool, optional): normalize the independent variables before training the MDN model. Defaults to True.
+            enc (object, optional): the encoder fitted for the model. Defaults to None, to fit one, shared by
+                all the candidate networks.
+            zs_encoded (np.ndarray, optional): the group by values encoded by enc. Defaults to None.
 
         Returns:
             KdeMdn: the fitted model.
         """
+        encoder = self.config.config["encoder"]
+        if encoder in ["onehot", "binary", "embedding"]:
+            if enc is None:
+                enc = fit_encoder(self.config, zs, xs)
+                zs_encoded = None
+            if zs_encoded is None:
+                zs_encoded = encode_groups(enc, encoder, zs, b_sparse=True)
 
         param_grid = {
             "epoch": [5],
@@ -1536,38 +1676,20 @@ class KdeMdn:
         }
         # param_grid = {'epoch': [2], 'lr': [0.001],
         #               'node': [4], 'hidden': [1], 'gaussian': [10]}
-        errors = []
-        combinations = it.product(*(param_grid[Name] for Name in param_grid))
-        combinations = list(combinations)
-        combs = []
-        for combination in combinations:
-            idx = 0
-            comb = {}
-            for key in param_grid:
-                comb[key] = combination[idx]
-                idx += 1
-            combs.append(comb)
 
-        self.b_store_training_data = True
-        for para in combs:
-            print("Grid search for parameter set :", para)
+        def make_candidate(para, rows, n_epoch):
             config = self.config.copy()
             config.config["n_gaussians_density"] = para["gaussian"]
-            config.config["n_epoch"] = para["epoch"]
+            config.config["n_epoch"] = n_epoch
             config.config["n_mdn_layer_node_density"] = para["node"]
             config.config["n_hidden_layer"] = para["hidden"]
             config.config["b_grid_search"] = False
-            instance = KdeMdn(
-                config,
-                b_store_training_data=True,
-                b_normalize_data=self.b_normalize_data,
-            ).fit(
-                zs, xs, runtime_config, lr=para["lr"]
-            )  # b_normalize=b_normalize,
-            errors.append(instance.score(runtime_config))
-
-        index = errors.index(min(errors))
-        para = combs[index]
+            args = (take(zs, rows), take(xs, rows))
+            kwargs = {"lr": para["lr"], "enc": enc,
+                      "zs_encoded": zs_encoded[rows] if zs_encoded is not None else None}
+            return KdeMdn(config, b_store_training_data=True, b_normalize_data=self.b_normalize_data), args, kwargs
+
+        para = GridSearch(self.config, runtime_config).search("density", param_grid, (zs, xs), make_candidate)
         print("Finding the best configuration for the network", para)
 
         self.b_store_training_data = False
@@ -1587,11 +1709,116 @@ class KdeMdn:
         instance = KdeMdn(
             config, b_store_training_data=False, b_normalize_data=self.b_normalize_data
         ).fit(
-            zs, xs, runtime_config, lr=para["lr"]
+            zs, xs, runtime_config, lr=para["lr"], enc=enc, zs_encoded=zs_encoded
         )  # b_normalize=b_normalize,
         print("-" * 80)
         return instance
 
+    def predict_parameters(self, zs: list, runtime_config):
+        """provide the parameters of the gaussian mixtures for the given groups.
+        Parameters are looked up in the parameter cache, and only groups not seen before go through the network.
+
+        Args:
+            zs (list): the group by values.
+            runtime_config (dict): the runtime configuration.
+
+        Returns:
+            tuple: (pis, mus, sigmas), each of shape (len(zs), n_gaussians), in the normalized domain.
+        """
+        keys = [",".join(str(i) for i in z) for z in zs]
+        # the cache may be extended by concurrent queries, so the lookups are all done in one snapshot.
+        cache = self.parameter_cache
+        index = {} if cache is None else cache[0]
+        idx = np.fromiter((index.get(key, -1) for key in keys),
+                          dtype=np.int64, count=len(keys))
+
+        missing = np.flatnonzero(idx < 0)
+        if len(missing) > 0:
+            cache = self.cache_parameters([zs[i] for i in missing], runtime_config)
+            index = cache[0]
+            idx[missing] = [index[keys[i]] for i in missing]
+
+        _, pis, mus, sigmas = cache
+        return pis[idx], mus[idx], sigmas[idx]
+
+    def cache_parameters(self, zs: list, runtime_config, b_skip_unknown=False):
+        """compute the mixture parameters for the given groups and add them to the parameter cache,
+        which is serialized along with the model.
+
+        Args:
+            zs (list): the group by values.
+            runtime_config (dict): the runtime configuration.
+            b_skip_unknown (bool, optional): skip the groups the encoder does not know, instead of raising KeyError. Defaults to False.
+
+        Returns:
+            tuple: the parameter cache, with the given groups.
+        """
+        cache = self.parameter_cache
+        index = {} if cache is None else cache[0]
+        keys = []
+        new_zs = []
+        for z in zs:
+            key = ",".join(str(i) for i in z)
+            if key not in index and key not in keys:
+                keys.append(key)
+                new_zs.append(z)
+        if not new_zs:
+            return cache
+
+        # the network runs outside of the lock, so queries on known groups are not held up.
+        try:
+            pis, mus, sigmas = self.predict_parameters_from_model(new_zs, runtime_config)
+        except KeyError:
+            if not b_skip_unknown:
+                raise
+            # bisect the groups, to find out the ones unknown to the encoder.
+            if len(new_zs) > 1:
+                half = len(new_zs) // 2
+                self.cache_parameters(new_zs[:half], runtime_config, b_skip_unknown=True)
+                return self.cache_parameters(new_zs[half:], runtime_config, b_skip_unknown=True)
+            return cache
+        with self.parameter_lock:
+            cache = self.parameter_cache
+            index = {} if cache is None else cache[0]
+            # the groups added by another query in the meantime are kept as they are.
+            new = [i for i, key in enumerate(keys) if key not in index]
+            if new:
+                cache = extend_parameter_cache(cache, [keys[i] for i in new], pis[new], mus[new], sigmas[new])
+                self.parameter_cache = cache
+        return cache
+
+    def predict_parameters_from_model(self, zs: list, runtime_config):
+        """run the network to get the parameters of the gaussian mixtures for the given groups.
+
+        Args:
+            zs (list): the group by values.
+            runtime_config (dict): the runtime configuration.
+
+        Raises:
+            ValueError: group values could not be converted to float when no encoder is used.
+
+        Returns:
+            tuple: (pis, mus, sigmas), each of shape (len(zs), n_gaussians), in the normalized domain.
+        """
+        encoder = self.config.config["encoder"]
+        device = runtime_config["device"]
+        # torch.set_num_threads(4)
+        # convert group zs from string to int
+        if encoder == "no":
+            zs = groups_to_float(zs)
+
+        zs = np.array(zs)  # [:, np.newaxis]
+
+        if encoder in ["onehot", "binary", "embedding"]:
+            zs_encoded = encode_groups(self.enc, encoder, zs)
+        else:
+            zs_encoded = zs
+        self.model = self.model.to(device)
+
+        pis, sigmas, mus = batch_forward(
+            self.model, zs_encoded, device, runtime_config["inference_batch_size"])
+        return pis, mus, sigmas
+
     def predict(
         self,
         zs: list,
@@ -1613,68 +1840,11 @@ class KdeMdn:
         Returns:
             list: the predictions.
         """
-        encoder = self.config.config["encoder"]
-        device = runtime_config["device"]
-        # torch.set_num_threads(4)
-        # convert group zs from string to int
-        if encoder == "no":
-            convert2float = True
-            if convert2float:
-                try:
-                    zs_float = []
-                    for item in zs:
-                        if item[0] == "":
-                            zs_float.append([0.0])
-                        else:
-                            zs_float.append([(float)(item[0])])
-                    zs = zs_float
-                except:
-                    raise Exception
-
         if self.b_normalize_data:
             # print(xs, self.meanx, self.widthx)
             xs = self.normalize(xs, self.meanx, self.widthx)
 
-        zs = np.array(zs)  # [:, np.newaxis]
-
-        if encoder == "onehot":
-            zs_encoded = self.enc.transform(zs).toarray()
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
-        elif encoder == "binary":
-            zs_encoded = self.enc.transform(zs).to_numpy()
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
-        elif encoder == "embedding":
-            zs_encoded = self.enc.predicts(zs)
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
-        else:
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs])
-        tensor_zs = tensor_zs.to(device)
-        self.model = self.model.to(device)
-
-        pis, sigmas, mus = self.model(tensor_zs)
-
-        pis = pis.cpu()
-        sigmas = sigmas.cpu()
-        mus = mus.cpu()
-
-        # print("mus,", mus)
-        # print("pis,", pis)
-        # print("sigmas,", sigmas)
-
-        mus = mus.detach().numpy().reshape(len(zs), -1)  # [0]
-        pis = pis.detach().numpy()  # [0]  # .reshape(-1,2)
-        sigmas = sigmas.detach().numpy().reshape(len(sigmas), -1)  # [0]
-        # print("mus,", mus)
-        # print("pis,", pis)
-        # print("sigmas,", sigmas)
-        # with open('/home/u1796377/Desktop/tmp/mus.pkl', 'wb') as f:
-        #     dill.dump(mus, f)
-        # with open('/home/u1796377/Desktop/tmp/pis.pkl', 'wb') as f:
-        #     dill.dump(pis, f)
-        # with open('/home/u1796377/Desktop/tmp/sigmas.pkl', 'wb') as f:
-        #     dill.dump(sigmas, f)
-        # with open('/home/u1796377/Desktop/tmp/xs.pkl', 'wb') as f:
-        #     dill.dump(xs, f)
+        pis, mus, sigmas = self.predict_parameters(zs, runtime_config)
 
         if not b_plot:
             # result = [gm(pi, mu,
@@ -1703,33 +1873,43 @@ class KdeMdn:
                 n_division=runtime_config["n_division"],
             )
 
+    def predict_cdf(self, zs: list, x_lb: float, x_ub: float, runtime_config):
+        """provide the probability mass within [x_lb, x_ub] for each group, using the closed-form
+        CDF of the gaussian mixtures, instead of integrating the density over a mesh.
+
+        Args:
+            zs (list): the group by values.
+            x_lb (float): lower bound
+            x_ub (float): upper bound
+            runtime_config (dict): the runtime configuration.
+
+        Returns:
+            np.ndarray: the probability mass of each group.
+        """
+        if self.b_normalize_data:
+            x_lb = self.normalize(x_lb, self.meanx, self.widthx)
+            x_ub = self.normalize(x_ub, self.meanx, self.widthx)
+
+        pis, mus, sigmas = self.predict_parameters(zs, runtime_config)
+        return gm_cdf(pis, mus, sigmas, x_lb, x_ub)
+
     def var(self, zs, runtime_config):
         encoder = self.config.config["encoder"]
         device = runtime_config["device"]
         if encoder == "onehot":
             zs_encoded = self.enc.transform(zs).toarray()
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
         elif encoder == "binary":
             zs_encoded = self.enc.transform(zs).to_numpy()
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
         elif encoder == "embedding":
             # zs_transformed =  zs.reshape(1,-1)[0]
             zs_transformed = np.array(zs).reshape(1, -1)[0]
             zs_encoded = self.enc.predicts(zs_transformed)
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs_encoded])
         else:
-            tensor_zs = torch.stack([torch.Tensor(i) for i in zs])
-        tensor_zs = tensor_zs.to(device)
+            zs_encoded = zs
         self.model = self.model.to(device)
 
-        pis, sigmas, mus = self.model(tensor_zs)
-
-        pis = pis.cpu()
-        sigmas = sigmas.cpu()
-        mus = mus.cpu()
-        mus = mus.detach().numpy().reshape(len(zs), -1)  # [0]
-        pis = pis.detach().numpy()  # [0]  # .reshape(-1,2)
-        sigmas = sigmas.detach().numpy().reshape(len(sigmas), -1)  # [0]
+        pis, sigmas, mus = batch_forward(
+            self.model, zs_encoded, device, runtime_config["inference_batch_size"])
         print("pis", pis)
         print("sigmas", sigmas)
         print("mus", mus)
@@ -2179,23 +2359,19 @@ class KdeMdn:
             # return sum(errors)
             freq_all = []
             for g in zs_set:
+                # a grouping by a list of columns is looked up by a tuple.
                 main_plot, bins, patches = plt.hist(
-                    gp.get_group(g)["x"], bins=runtime_config["n_division"]
+                    gp.get_group(g if isinstance(g, tuple) else (g,))["x"], bins=runtime_config["n_division"]
                 )
                 total = sum(main_plot)
-                freq_g = []
-                for patch in patches:
-                    left, right, frequency = patch._x0, patch._x1, patch._y1 / total
-                    freq_g.append(frequency)
-                freq_all.append(freq_g)
+                freq_all.append(list(main_plot / total))
             freq_all = np.array(freq_all)
             freq_all = freq_all.transpose()
             # print(freq_all)
             # print(freq_all.shape)
             # print(zs_set)
             pred_all = []
-            for patch in patches:
-                left, right = patch._x0, patch._x1
+            for left, right in zip(bins[:-1], bins[1:]):
                 pre_density, _, step = prepare_reg_density_data(
                     self, left, right, zs_set, None, runtime_config
                 )
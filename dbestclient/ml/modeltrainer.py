@@ -8,10 +8,12 @@
 import numpy as np
 
 from dbestclient.ml.density import DBEstDensity
-from dbestclient.ml.mdn import KdeMdn, RegMdnGroupBy  # RegMdn
+from dbestclient.ml.mdn import (KdeMdn, RegMdnGroupBy,  # RegMdn
+                                encode_groups, fit_encoder)
 from dbestclient.ml.modelwraper import (GroupByModelWrapper, KdeModelWrapper,
                                         SimpleModelWrapper)
 from dbestclient.ml.regression import DBEstReg
+from dbestclient.ml.trainingscheduler import TrainingScheduler
 from dbestclient.tools.dftools import convert_df_to_yx
 
 
@@ -137,117 +139,49 @@ class KdeModelTrainer:
         xzs_train = np.concatenate(
             (x[:, np.newaxis], groupby), axis=1)
 
+        # the encoder of the groups is fitted once, and shared by the regression and the density.
+        zs_encoded = None
+        if not b_skip_reg_training and self.config.config["encoder"] in ["onehot", "binary", "embedding"]:
+            self.enc = fit_encoder(self.config, groupby, x, y)
+            zs_encoded = encode_groups(self.enc, self.config.config["encoder"], groupby, b_sparse=True)
+
+        # the configurations of the two networks, by network size.
+        reg_config = self.config.copy()
+        density_config = self.config.copy()
+        b_store_density_data = False
         if network_size is None:
-            if b_skip_reg_training:
-                reg = None
-            else:
-                print("training regression...")
-                print("*"*80)
-                config = self.config.copy()
-                reg = RegMdnGroupBy(config).fit(
-                    groupby, x, y, runtime_config)
-
-            if b_skip_density_training:
-                density = None
-            else:
-                print("training density...")
-                print("*"*80)
-                # density = RegMdn(dim_input=1,n_mdn_layer_node=20)
-                config = self.config.copy()
-                density = KdeMdn(config,
-                                 b_store_training_data=b_plot).fit(groupby, x, runtime_config)
-                if b_plot:
-                    density.plot_density_3d(runtime_config=runtime_config)
-                    # density.plot_density_per_group(runtime_config=runtime_config)
+            b_store_density_data = b_plot
+        elif network_size.lower() == "small":
+            reg_config.config["n_gaussians_reg"] = 3
+            density_config.config["n_gaussions_density"] = 10
+        elif network_size.lower() == "large":
+            reg_config.config["n_gaussians_reg"] = 5
+            density_config.config["n_gaussians_density"] = 20
+        elif network_size.lower() == "testing":
+            reg_config.config["n_epoch"] = 1
+            reg_config.config["n_gaussians_reg"] = 2
+            reg_config.config["n_mdn_layer_node"] = 20
+            reg_config.config["b_grid_search"] = False
+            density_config.config["n_epoch"] = 2
+            density_config.config["n_gaussians_density"] = 8
+            density_config.config["n_mdn_layer_node"] = 10
+            density_config.config["b_grid_search"] = False
         else:
-            if network_size.lower() == "small":
-                if b_skip_reg_training:
-                    reg = None
-                else:
-                    print("training regression...")
-                    print("*"*80)
-                    config = self.config.copy()
-                    # config.config["n_epoch"] = 10
-                    config.config["n_gaussians_reg"] = 3
-                    # config.config["n_mdn_layer_node"] = 10
-                    # config.config["b_grid_search"] = False
-                    reg = RegMdnGroupBy(config, b_store_training_data=False).fit(
-                        groupby, x, y, runtime_config)
-
-                if b_skip_density_training:
-                    density = None
-                else:
-                    print("training density...")
-                    print("*"*80)
-                    # density = RegMdn(dim_input=1,n_mdn_layer_node=20)
-                    config = self.config.copy()
-                    # config.config["n_epoch"] = 20
-                    config.config["n_gaussions_density"] = 10
-                    # config.config["n_mdn_layer_node"] = 10
-                    # config.config["b_grid_search"] = False
-
-                    density = KdeMdn(config,
-                                     b_store_training_data=False).fit(groupby, x, runtime_config)
-
-            elif network_size.lower() == "large":
-                if b_skip_reg_training:
-                    reg = None
-                else:
-                    print("training regression...")
-                    print("*"*80)
-                    config = self.config.copy()
-                    # config.config["n_epoch"] = 20
-                    config.config["n_gaussians_reg"] = 5
-                    # config.config["n_mdn_layer_node"] = 20
-                    # config.config["b_grid_search"] = False
-                    reg = RegMdnGroupBy(config, b_store_training_data=False,).fit(
-                        groupby, x, y, runtime_config)
-
-                if b_skip_density_training:
-                    density = None
-                else:
-                    print("training density...")
-                    print("*"*80)
-                    config = self.config.copy()
-                    # config.config["n_epoch"] = 20
-                    config.config["n_gaussians_density"] = 20
-                    # config.config["n_mdn_layer_node"] = 20
-                    # config.config["b_grid_search"] = False
-                    # density = RegMdn(dim_input=1,n_mdn_layer_node=20)
-                    density = KdeMdn(config, b_store_training_data=False).fit(
-                        groupby, x, runtime_config)
-
-            elif network_size.lower() == "testing":
-                if b_skip_reg_training:
-                    reg = None
-                else:
-                    print("training regression...")
-                    print("*"*80)
-                    config = self.config.copy()
-                    config.config["n_epoch"] = 1
-                    config.config["n_gaussians_reg"] = 2
-                    config.config["n_mdn_layer_node"] = 20
-                    config.config["b_grid_search"] = False
-                    reg = RegMdnGroupBy(config, b_store_training_data=False,).fit(
-                        groupby, x, y, runtime_config)
-                if b_skip_density_training:
-                    density = None
-                else:
-                    print("training density...")
-                    print("*"*80)
-                    # density = RegMdn(dim_input=1,n_mdn_layer_node=20)
-                    config = self.config.copy()
-                    config.config["n_epoch"] = 2
-                    config.config["n_gaussians_density"] = 8
-                    config.config["n_mdn_layer_node"] = 10
-                    config.config["b_grid_search"] = False
-                    density = KdeMdn(config, b_store_training_data=False).fit(
-                        groupby, x, runtime_config)
-
-            else:
-                raise ValueError("unexpected network_size passed in "+__file__)
-
-
+            raise ValueError("unexpected network_size passed in "+__file__)
+
+        reg = None
+        density = None
+        if not b_skip_reg_training:
+            # the regression and the density are independent, they are trained concurrently if n_jobs > 1.
+            scheduler = TrainingScheduler(runtime_config)
+            fit_runtime_config = scheduler.worker_runtime_config(2)
+            scheduler.submit("regression of " + self.mdl, RegMdnGroupBy(reg_config).fit,
+                             groupby, x, y, fit_runtime_config, enc=self.enc, zs_encoded=zs_encoded)
+            scheduler.submit("density of " + self.mdl, KdeMdn(density_config, b_store_training_data=b_store_density_data).fit,
+                             groupby, x, fit_runtime_config, enc=self.enc, zs_encoded=zs_encoded)
+            reg, density = scheduler.run()
+            if b_store_density_data:
+                density.plot_density_3d(runtime_config=runtime_config)
 
         # density = DBEstDensity(config=self.config).fit(x)
         self.kde_model_wrapper.load_model(self.mdl, density, reg)
@@ -0,0 +1,118 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import random
+from datetime import datetime
+from multiprocessing import Pool as PoolCPU
+
+import numpy as np
+import torch
+from torch.multiprocessing import Pool as PoolGPU
+
+from dbestclient.tools.running_parameters import shrink_runtime_config
+
+
+def init_trainer(n_threads: int):
+    """initialize a training worker: split the cores between the workers, and give each worker its
+    own random state, instead of the one copied from the parent."""
+    torch.set_num_threads(n_threads)
+    random.seed()
+    np.random.seed()
+    torch.seed()
+
+
+def run_task(task: tuple):
+    """run a fit, and time it."""
+    index, func, args, kwargs = task
+    t1 = datetime.now()
+    result = func(*args, **kwargs)
+    return index, result, (datetime.now() - t1).total_seconds()
+
+
+class TrainingScheduler:
+    """Runs independent fits concurrently, in a pool of n_jobs worker processes.
+
+    The fits are submitted with submit(), then run() trains them all and returns the fitted models
+    in the order of submission, reporting each one as it completes. The torch intra-op threads of
+    each worker are capped to its share of the cores, so the workers do not over-subscribe them.
+    With n_jobs=1, or a single fit, the fits run one after the other in this process.
+
+    Args:
+        runtime_config (dict): the runtime configuration, whose n_jobs is the number of workers.
+    """
+
+    def __init__(self, runtime_config: dict):
+        self.runtime_config = runtime_config
+        self.n_jobs = max(1, runtime_config.get("n_jobs") or 1)
+        self.tasks = []
+
+    def worker_runtime_config(self, n_tasks: int) -> dict:
+        """get the runtime configuration to pass to the fits. In the workers, the fits must not start
+        pools of their own, so they get n_jobs=1.
+
+        Args:
+            n_tasks (int): the number of fits to be submitted.
+
+        Returns:
+            dict: the runtime configuration.
+        """
+        if min(self.n_jobs, n_tasks) <= 1:
+            return self.runtime_config
+        return shrink_runtime_config(self.runtime_config)
+
+    def submit(self, name: str, func, *args, **kwargs):
+        """add a fit to the schedule.
+
+        Args:
+            name (str): the name of the fit, for the progress report.
+            func (callable): the function or bound method doing the fit, which must be picklable.
+            args, kwargs: the arguments of func.
+        """
+        self.tasks.append((name, func, args, kwargs))
+
+    def run(self) -> list:
+        """run the fits submitted.
+
+        Returns:
+            list: the results of the fits, in the order of submission.
+        """
+        tasks, self.tasks = self.tasks, []
+        n_workers = min(self.n_jobs, len(tasks))
+        results = [None] * len(tasks)
+        if n_workers <= 1:
+            for index, (name, func, args, kwargs) in enumerate(tasks):
+                _, results[index], seconds = run_task((index, func, args, kwargs))
+                self.report(name, index + 1, len(tasks), seconds)
+            return results
+
+        n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        Pool = PoolCPU if self.runtime_config["device"] == "cpu" else PoolGPU
+        print("training " + str(len(tasks)) + " models with " + str(n_workers) + " workers...")
+        with Pool(processes=n_workers, initializer=init_trainer, initargs=(n_threads,)) as pool:
+            tasks_indexed = [(index, func, args, kwargs) for index, (_, func, args, kwargs) in enumerate(tasks)]
+            # report the fits in the order they complete.
+            for n_done, (index, result, seconds) in enumerate(pool.imap_unordered(run_task, tasks_indexed), 1):
+                results[index] = result
+                self.report(tasks[index][0], n_done, len(tasks), seconds)
+        return results
+
+    def report(self, name: str, n_done: int, n_total: int, seconds: float):
+        if self.runtime_config.get("v", True):
+            print("[" + str(n_done) + "/" + str(n_total) + "] trained " + name +
+                  " in " + "{:.2f}".format(seconds) + " seconds.")
@@ -1,8 +1,7 @@
 import multiprocessing
 
 import numpy as np
-
-# import pandas as pd
+import pandas as pd
 from gensim.models import Word2Vec
 
 # from numpy.core.defchararray import startswith
@@ -10,6 +9,53 @@ from gensim.models import Word2Vec
 # https://towardsdatascience.com/word-embedding-with-word2vec-and-fasttext-a209c1d3e12c
 
 
+def build_embedding_table(embeddings: dict, prefix: str = "", suffix: str = "") -> tuple:
+    """collect the vectors of one categorical column into a matrix.
+
+    Args:
+        embeddings (dict): the vectors, with the word as the key.
+        prefix (str, optional): the prefix of the words of this column. Defaults to "".
+        suffix (str, optional): the suffix of the words of this column. Defaults to "".
+
+    Returns:
+        tuple: the values of the column, and the (vocab, dim) float32 matrix of their vectors.
+    """
+    values = []
+    vectors = []
+    for word, vector in embeddings.items():
+        if word.startswith(prefix) and word.endswith(suffix) and len(word) >= len(prefix) + len(suffix):
+            values.append(word[len(prefix):len(word) - len(suffix)])
+            vectors.append(vector)
+    values = np.array(values, dtype=str)
+    if vectors:
+        vectors = np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+    else:
+        vectors = np.empty((0, 0), dtype=np.float32)
+    return values, vectors
+
+
+def lookup_embeddings(index: pd.Index, vectors: np.ndarray, values, prefix: str = "", suffix: str = "") -> np.ndarray:
+    """gather the vectors of a batch of values of one categorical column.
+
+    Args:
+        index (pd.Index): the values of the column, in the order of the rows of vectors.
+        vectors (np.ndarray): the (vocab, dim) matrix.
+        values (np.ndarray): the values to look up.
+        prefix (str, optional): the prefix of the words of this column, for the error message. Defaults to "".
+        suffix (str, optional): the suffix of the words of this column, for the error message. Defaults to "".
+
+    Raises:
+        KeyError: if a value has no embedding.
+
+    Returns:
+        np.ndarray: the (len(values), dim) vectors.
+    """
+    codes = index.get_indexer(values)
+    if (codes < 0).any():
+        raise KeyError(prefix + values[np.argmax(codes < 0)] + suffix)
+    return vectors[codes]
+
+
 class SkipGram:
     def __init__(self):
         # self.embedding = None
@@ -17,6 +63,13 @@ class SkipGram:
         self.usecols = None
         self.embeddings = {}
         self.header_categorical = None
+        self.tables = None  # per categorical column, the values and the (vocab, dim) matrix of vectors.
+        self.indexes = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["indexes"] = None  # rebuilt on first use.
+        return state
 
     def fit(
         self,
@@ -133,29 +186,28 @@ class SkipGram:
                 if word.startswith(head):
                     self.embeddings[word] = model.wv[word]
         # print(self.embeddings.keys())
+        self.build_tables()
         print("finish training embedding.")
         return self
 
-    def predicts(self, keys):
-        # print("keys,", type(keys))
-        # print("keys,", keys)
-        headers = np.repeat([self.header_categorical], len(keys), axis=0)
-        # print("headers", headers)
-        sentences = np.core.defchararray.add(headers, keys)  # .tolist()
-        # print("sentences",sentences)
-        # print("self.embeddings", self.embeddings.keys())
+    def build_tables(self):
+        """build the lookup table of each categorical column from the trained vectors."""
+        self.tables = [build_embedding_table(self.embeddings, prefix=head)
+                       for head in self.header_categorical]
+        self.indexes = [pd.Index(values) for values, _ in self.tables]
 
-        # exit()
-        
-        col0 =  sentences[:,0]
-        predictions = np.array([self.embeddings[i] for i in col0])
-        # print("first columns ", predictions)
+    def predicts(self, keys):
+        # models saved before the lookup tables were introduced only have the embeddings dict.
+        if getattr(self, "tables", None) is None:
+            self.build_tables()
+        elif getattr(self, "indexes", None) is None:
+            self.indexes = [pd.Index(values) for values, _ in self.tables]
 
-        for col_idx in range(1,len(sentences[0])):
-            col = sentences[:,col_idx]
-            prediction_col = np.array([self.embeddings[i] for i in col])
-            predictions = np.concatenate((predictions, prediction_col),axis=1)
-        return predictions
+        keys = np.asarray(keys, dtype=str).reshape(len(keys), -1)
+        predictions = [lookup_embeddings(index, vectors, keys[:, col_idx], prefix=head)
+                       for col_idx, (head, index, (_, vectors)) in enumerate(
+                           zip(self.header_categorical, self.indexes, self.tables))]
+        return np.concatenate(predictions, axis=1)
         # print("predictions are ")
         # print(predictions)
 
@@ -1,87 +1,110 @@
 #!/usr/bin/env python3
 
-import selectors
-import socket
-# import sys
-import traceback
+import asyncio
+import threading
 from datetime import datetime
 
-from dbestclient.socket import libclient
+from dbestclient.socket.coordinator import Coordinator
+from dbestclient.socket.libclient import ConnectionPool
 
 verbose = False
 
 
-def create_request(action, value):
-    if action == "select":
-        return dict(
-            type="text/json",
-            encoding="utf-8",
-            content=dict(action=action, value=value),
-        )
-    elif action == "search":
-        return dict(
-            type="text/json",
-            encoding="utf-8",
-            content=dict(action=action, value=value),
-        )
-    else:
-        return dict(
-            type="binary/custom-client-binary-type",
-            encoding="binary",
-            content=bytes(action + value, encoding="utf-8"),
-        )
-
-
-def start_connection(host, port, request):
-    addr = (host, port)
-    if verbose:
-        print("starting connection to", addr)
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setblocking(False)
-    sock.connect_ex(addr)
-    events = selectors.EVENT_READ | selectors.EVENT_WRITE
-    sel = selectors.DefaultSelector()
-    message = libclient.Message(sel, sock, addr, request)
-    sel.register(sock, events, data=message)
-    return sel
+class Client:
+    """The master side of the cluster mode.
+
+    The connections to the slaves are kept in a ConnectionPool, served by an event loop in a
+    background thread, so they outlive a single query and the synchronous callers can share them.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.pool = None
+        self.coordinator = Coordinator()
+        self.lock = threading.Lock()
+
+    def get_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def run(self, coro):
+        """run a coroutine on the background event loop, and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+    def get_pool(self, runtime_config) -> ConnectionPool:
+        max_connections = runtime_config.get("wire_max_connections", 2)
+        compress_level = runtime_config.get("wire_compress_level", 0)
+        if self.pool is None or self.pool.max_connections != max_connections or \
+                self.pool.compress_level != compress_level:
+            if self.pool is not None:
+                self.loop.call_soon_threadsafe(self.pool.close)
+            self.pool = ConnectionPool(max_connections, compress_level)
+        return self.pool
+
+    async def predicts_async(self, pool: ConnectionPool, host: str, port: int, mdl_name: str, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, groups: list, filter_dbest=None):
+        connection = await pool.get(host, port)
+        return await connection.predicts(mdl_name, func, x_lb, x_ub, x_categorical_conditions,
+                                         runtime_config, groups, filter_dbest)
+
+    def predicts(self, host: str, port: int, mdl_name: str, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, groups: list, filter_dbest=None):
+        """make predictions for a chunk of groups on a slave.
+
+        Returns:
+            pd.DataFrame: the predictions.
+        """
+        pool = self.get_pool(runtime_config)
+        return self.run(self.predicts_async(pool, host, port, mdl_name, func, x_lb, x_ub,
+                                            x_categorical_conditions, runtime_config, groups, filter_dbest))
+
+    def scatter(self, slaves, mdl_name: str, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config, groups: list, filter_dbest=None):
+        """scatter the groups to the slaves, and gather the predictions. See Coordinator.
+
+        Args:
+            slaves (Slaves): the slaves.
+            mdl_name (str): the model file name.
+            func (str): the aggregate function.
+            x_lb (float): lower bound
+            x_ub (float): upper bound
+            x_categorical_conditions (list): the categorical conditions.
+            runtime_config (dict): the runtime configuration for the slaves.
+            groups (list): the groups.
+            filter_dbest (list, optional): the filter. Defaults to None.
+
+        Returns:
+            pd.DataFrame: the predictions.
+        """
+        pool = self.get_pool(runtime_config)
+        hosts = [(slave.host, slave.port) for slave in slaves.get().values()]
+
+        def request(host, port, sub_group):
+            return self.predicts_async(pool, host, port, mdl_name, func, x_lb, x_ub,
+                                       x_categorical_conditions, runtime_config, sub_group, filter_dbest)
+        return self.run(self.coordinator.scatter(request, hosts, groups, runtime_config))
+
+    def close(self):
+        if self.pool is not None:
+            self.loop.call_soon_threadsafe(self.pool.close)
+            self.pool = None
+
+
+# the client shared by the queries of this process.
+client = Client()
 
 
 def run(host, port, actions, action_value):
     t1 = datetime.now()
-    action, value = actions, action_value  # 'search', 'ring'
-    request = create_request(action, value)
-    sel = start_connection(host, port, request)
-    # sel = selectors.DefaultSelector()
-    result = None
-
-    try:
-        while True:
-            events = sel.select(timeout=1)
-            for key, mask in events:
-                message = key.data
-                try:
-                    # t1 = datetime.now()
-                    reslt = message.process_events(mask)
-                    if reslt is not None:
-                        result = reslt
-                    # print("result,", result)
-                    # t2 = datetime.now()
-                    # print("time cost is ", (t2-t1).total_seconds())
-                except Exception:
-                    print(
-                        "main: error: exception for",
-                        f"{message.addr}:\n{traceback.format_exc()}",
-                    )
-                    message.close()
-            # Check for a socket being monitored to continue.
-            if not sel.get_map():
-                break
-    except KeyboardInterrupt:
-        print("caught keyboard interrupt, exiting")
-    finally:
-        sel.close()
-        # print("result,", result)
-        if verbose:
-            t2 = datetime.now()
-            print("time cost is ", (t2-t1).total_seconds())
-        return result
+    if actions != "select":
+        raise ValueError("unsupported action " + str(actions))
+    query = action_value
+    result = client.predicts(host, port, query["mdl_name"], query["func"], query["x_lb"], query["x_ub"],
+                             query["x_categorical_conditions"], query["runtime_config"],
+                             query["sub_group"], query["filter_dbest"])
+    if verbose:
+        t2 = datetime.now()
+        print("time cost is ", (t2-t1).total_seconds())
+    return result
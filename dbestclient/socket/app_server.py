@@ -1,57 +1,97 @@
 #!/usr/bin/env python3
 
-import selectors
-import socket
-import sys
+import asyncio
+import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import torch
+
 from dbestclient.socket import libserver
+from dbestclient.socket.wire import MSG_ERROR, encode_frame, read_frame
 
-sel = selectors.DefaultSelector()
 
+class Server:
+    """The slave server.
 
-def accept_wrapper(sock):
-    conn, addr = sock.accept()  # Should be ready to read
-    t1 = datetime.now()
-    print("accepted connection from", addr)
-    conn.setblocking(False)
-    message = libserver.Message(sel, conn, addr)
-    sel.register(conn, selectors.EVENT_READ, data=message)
-    return t1
+    The event loop only accepts connections, reads requests and writes responses. The requests
+    are computed by a bounded pool of worker threads, runtime_config["slave_max_workers"] of them.
+    At most runtime_config["slave_max_pending"] requests are in flight; beyond that, the server
+    stops reading from the connections, so the masters are slowed down by TCP flow control.
+    """
 
+    def __init__(self, sqlExecutor):
+        self.sqlExecutor = sqlExecutor
+        runtime_config = sqlExecutor.runtime_config
+        self.max_workers = runtime_config.get("slave_max_workers") or os.cpu_count() or 1
+        self.max_pending = runtime_config.get("slave_max_pending") or 2 * self.max_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.pending = None
+        # the workers already run in parallel, split the cores between them.
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.max_workers))
 
-def run(host, port, sqlExecutor):
-    # host, port = sys.argv[1], int(sys.argv[2])
-    lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # Avoid bind() exception: OSError: [Errno 48] Address already in use
-    lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    lsock.bind((host, port))
-    lsock.listen()
-    print("listening on", (host, port))
-    lsock.setblocking(False)
-    sel.register(lsock, selectors.EVENT_READ, data=None)
+    async def handle_connection(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        print("accepted connection from", addr)
+        session = libserver.Session()
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                await self.pending.acquire()
+                try:
+                    msg_type, request_id, meta, arrays = await read_frame(reader)
+                except BaseException:
+                    self.pending.release()
+                    raise
+                task = asyncio.ensure_future(self.process(
+                    writer, write_lock, session, msg_type, request_id, meta, arrays))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the master closed the connection.
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            print("closing connection to", addr)
+            writer.close()
+
+    async def process(self, writer, write_lock, session, msg_type, request_id, meta, arrays):
+        t1 = datetime.now()
+        try:
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, libserver.handle_message, self.sqlExecutor, session, msg_type, meta, arrays)
+            except Exception as e:
+                print("main: error: exception for", f"{writer.get_extra_info('peername')}:\n{traceback.format_exc()}")
+                response = (MSG_ERROR, {"error": repr(e)}, {})
+            msg_type, meta, arrays = response
+            frame = encode_frame(msg_type, request_id, meta, arrays, session.compress_level)
+            async with write_lock:
+                writer.write(frame)
+                await writer.drain()
+        except ConnectionError:
+            pass  # the master has gone, the response is dropped.
+        finally:
+            self.pending.release()
+        if self.sqlExecutor.runtime_config["b_show_latency"]:
+            t2 = datetime.now()
+            print("time cost is ", (t2-t1).total_seconds())
 
+    async def serve(self, host, port):
+        self.pending = asyncio.Semaphore(self.max_pending)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print("listening on", (host, port), "with", self.max_workers, "workers")
+        async with server:
+            await server.serve_forever()
+
+
+def run(host, port, sqlExecutor):
+    server = Server(sqlExecutor)
     try:
-        while True:
-            events = sel.select(timeout=None)
-            for key, mask in events:
-                if key.data is None:
-                    t1 = accept_wrapper(key.fileobj)
-                else:
-                    message = key.data
-                    try:
-                        message.process_events(mask, sqlExecutor)
-                        if mask == 2:
-                            t2 = datetime.now()
-                            print("time cost is ", (t2-t1).total_seconds())
-                    except Exception:
-                        print(
-                            "main: error: exception for",
-                            f"{message.addr}:\n{traceback.format_exc()}",
-                        )
-                        message.close()
+        asyncio.run(server.serve(host, port))
     except KeyboardInterrupt:
         print("caught keyboard interrupt, exiting")
     finally:
-        sel.close()
+        server.executor.shutdown(wait=False)
@@ -0,0 +1,231 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import math
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# the weight of the latest observation in the throughput estimate of a slave.
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class Chunk:
+    """A slice of the groups of a query, and its attempts on the slaves."""
+
+    def __init__(self, chunk_id: int, groups: list):
+        self.chunk_id = chunk_id
+        self.groups = groups
+        self.n_failures = 0
+        self.slaves = set()  # the slaves it is running on.
+        self.start = None  # when the first, not hedged, attempt started.
+        self.expected = None  # the expected duration in seconds, None if unknown.
+
+
+class Coordinator:
+    """Scatter the groups of a query to the slaves, and gather the predictions.
+
+    - chunks are sized by the throughput observed on each slave, in groups per second.
+    - each request has a deadline, runtime_config["slave_timeout"]; a failed or timed out chunk is
+      retried on another slave, up to runtime_config["slave_retries"] times.
+    - a straggler chunk, running for longer than runtime_config["hedge_after"] times its expected
+      duration, is re-issued to an idle slave, and the first response wins.
+    - the query as a whole has a deadline, runtime_config["query_timeout"]. The groups that could
+      not be answered are reported, and kept in the attrs["missing_groups"] of the result if
+      runtime_config["b_allow_partial_results"] is set. Otherwise, an error is raised.
+    """
+
+    def __init__(self):
+        self.throughputs = {}  # groups per second, with (host, port) as the key.
+
+    def update_throughput(self, slave: tuple, n_groups: int, elapsed: float):
+        throughput = n_groups / max(elapsed, 1e-6)
+        if slave in self.throughputs:
+            throughput = THROUGHPUT_SMOOTHING * throughput + \
+                (1 - THROUGHPUT_SMOOTHING) * self.throughputs[slave]
+        self.throughputs[slave] = throughput
+
+    def split(self, groups: list, slaves: list) -> list:
+        """split the groups into one chunk per slave, proportional to the throughput of each slave.
+
+        Args:
+            groups (list): the groups.
+            slaves (list): the (host, port) of the slaves.
+
+        Returns:
+            list: the chunks, in the order of the groups, and the slave each one is assigned to.
+        """
+        known = [self.throughputs[s] for s in slaves if s in self.throughputs]
+        default = np.mean(known) if known else 1.0
+        weights = np.array([self.throughputs.get(s, default) for s in slaves])
+        bounds = np.round(np.cumsum(weights) / np.sum(weights) * len(groups)).astype(int)
+        chunks = []
+        start = 0
+        for slave, end in zip(slaves, bounds):
+            if end > start:
+                chunks.append((Chunk(len(chunks), groups[start:end]), slave))
+            start = end
+        return chunks
+
+    def expected_duration(self, chunk: Chunk, slave: tuple):
+        if slave in self.throughputs:
+            return len(chunk.groups) / self.throughputs[slave]
+        return None
+
+    async def scatter(self, request, slaves: list, groups: list, runtime_config: dict) -> pd.DataFrame:
+        """send the groups to the slaves, and gather the predictions.
+
+        Args:
+            request (coroutine function): request(host, port, groups), which makes the predictions on a slave.
+            slaves (list): the (host, port) of the slaves.
+            groups (list): the groups.
+            runtime_config (dict): the runtime configuration.
+
+        Raises:
+            RuntimeError: if some groups could not be answered, and partial results are not allowed.
+
+        Returns:
+            pd.DataFrame: the predictions, in the order of the groups.
+        """
+        slave_timeout = runtime_config.get("slave_timeout")
+        n_retries = runtime_config.get("slave_retries", 1)
+        hedge_after = runtime_config.get("hedge_after")
+        query_timeout = runtime_config.get("query_timeout")
+        t_start = time.monotonic()
+        deadline = t_start + query_timeout if query_timeout is not None else math.inf
+
+        queue = deque()
+        chunks = []
+        for chunk, slave in self.split(groups, slaves):
+            chunks.append(chunk)
+            queue.append((chunk, slave))
+        results = {}
+        failed = []
+        down = set()  # slaves which failed in this query.
+        running = {}  # task -> (chunk, slave, start)
+        errors = []
+
+        def busy(slave):
+            return any(s == slave for _, s, _ in running.values())
+
+        def launch(chunk, slave):
+            now = time.monotonic()
+            if chunk.start is None:
+                chunk.start = now
+                chunk.expected = self.expected_duration(chunk, slave)
+            chunk.slaves.add(slave)
+            coro = request(slave[0], slave[1], chunk.groups)
+            if slave_timeout is not None:
+                coro = asyncio.wait_for(coro, slave_timeout)
+            running[asyncio.ensure_future(coro)] = (chunk, slave, now)
+
+        def pick_slave(chunk, preferred=None):
+            idle = [s for s in slaves if s not in down and not busy(s)]
+            if preferred in idle:
+                return preferred
+            # prefer a slave the chunk has not failed on, and the fastest one.
+            idle.sort(key=lambda s: (s in chunk.slaves, -self.throughputs.get(s, 0.0)))
+            return idle[0] if idle else None
+
+        while True:
+            # dispatch the queued chunks, to their assigned slave if it is available.
+            for _ in range(len(queue)):
+                chunk, preferred = queue.popleft()
+                slave = pick_slave(chunk, preferred)
+                if slave is None:
+                    queue.append((chunk, preferred))
+                else:
+                    launch(chunk, slave)
+            if queue and all(s in down for s in slaves):
+                failed += [chunk for chunk, _ in queue]
+                queue.clear()
+
+            # hedge the stragglers on the idle slaves.
+            now = time.monotonic()
+            next_check = deadline
+            if hedge_after is not None and not queue:
+                for chunk in chunks:
+                    if chunk.chunk_id in results or len(chunk.slaves) != 1 or chunk.expected is None:
+                        continue
+                    if not any(c is chunk for c, _, _ in running.values()):
+                        continue
+                    hedge_at = chunk.start + hedge_after * chunk.expected
+                    if now < hedge_at:
+                        next_check = min(next_check, hedge_at)
+                        continue
+                    slave = pick_slave(chunk)
+                    if slave is not None and slave not in chunk.slaves:
+                        if runtime_config.get("v"):
+                            print("hedging " + str(len(chunk.groups)) + " groups on " +
+                                  slave[0] + ":" + str(slave[1]))
+                        launch(chunk, slave)
+
+            if not running:
+                break
+            timeout = None if next_check == math.inf else max(next_check - time.monotonic(), 0)
+            done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                chunk, slave, started = running.pop(task)
+                chunk.slaves.discard(slave)
+                if chunk.chunk_id in results:
+                    continue
+                try:
+                    results[chunk.chunk_id] = task.result()
+                    self.update_throughput(slave, len(chunk.groups), time.monotonic() - started)
+                    # cancel the other attempts of this chunk.
+                    for other, (other_chunk, _, _) in list(running.items()):
+                        if other_chunk is chunk:
+                            other.cancel()
+                except Exception as e:
+                    errors.append(slave[0] + ":" + str(slave[1]) + " " + repr(e))
+                    down.add(slave)
+                    self.throughputs.pop(slave, None)
+                    if chunk.slaves:  # a hedged attempt is still running.
+                        continue
+                    chunk.n_failures += 1
+                    if chunk.n_failures <= n_retries:
+                        chunk.start = None
+                        queue.append((chunk, None))
+                    else:
+                        failed.append(chunk)
+
+            if time.monotonic() >= deadline:
+                errors.append("the query timed out after " + str(query_timeout) + "s")
+                break
+
+        for task, (chunk, _, _) in running.items():
+            task.cancel()
+            if chunk.chunk_id not in results and chunk not in failed:
+                failed.append(chunk)
+        failed += [chunk for chunk, _ in queue if chunk not in failed]
+
+        answered = [results[chunk.chunk_id] for chunk in chunks if chunk.chunk_id in results]
+        result = pd.concat(answered, ignore_index=True) if answered else pd.DataFrame()
+        if failed:
+            missing_groups = [g for chunk in chunks if chunk.chunk_id not in results for g in chunk.groups]
+            message = "partial result: " + str(len(missing_groups)) + " of " + str(len(groups)) + \
+                " groups are missing, as " + "; ".join(errors)
+            if not runtime_config.get("b_allow_partial_results", False):
+                raise RuntimeError(message)
+            print("Warning: " + message)
+            result.attrs["missing_groups"] = missing_groups
+        return result
@@ -1,218 +1,176 @@
-import io
-import json
-import selectors
-import struct
-import sys
-
-
-class Message:
-    def __init__(self, selector, sock, addr, request):
-        self.selector = selector
-        self.sock = sock
-        self.addr = addr
-        self.request = request
-        self._recv_buffer = b""
-        self._send_buffer = b""
-        self._request_queued = False
-        self._jsonheader_len = None
-        self.jsonheader = None
-        self.response = None
-        self.v = False
-
-    def _set_selector_events_mask(self, mode):
-        """Set selector to listen for events: mode is 'r', 'w', or 'rw'."""
-        if mode == "r":
-            events = selectors.EVENT_READ
-        elif mode == "w":
-            events = selectors.EVENT_WRITE
-        elif mode == "rw":
-            events = selectors.EVENT_READ | selectors.EVENT_WRITE
-        else:
-            raise ValueError(f"Invalid events mask mode {repr(mode)}.")
-        self.selector.modify(self.sock, events, data=self)
-
-    def _read(self):
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+
+import pandas as pd
+
+from dbestclient.socket.wire import (MSG_ERROR, MSG_HELLO, MSG_QUERY,
+                                     config_fingerprint, encode_frame,
+                                     pack_groups, read_frame,
+                                     unpack_dataframe)
+
+
+class Connection:
+    """A long-lived connection to a slave.
+
+    Requests are pipelined: each one gets a request id, and the responses are matched to the
+    waiting requests by a background reader, in whatever order they arrive. The runtime
+    configuration and the model are registered once per connection, by a HELLO message, so
+    each query only carries the model name, the aggregate, the bounds and the groups.
+    """
+
+    def __init__(self, host: str, port: int, compress_level: int = 0):
+        self.host = host
+        self.port = port
+        self.compress_level = compress_level
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.pending = {}
+        self.next_id = 0
+        self.sessions = set()  # the (config id, model name) pairs registered on this connection.
+        self.b_closed = False
+
+    def addr(self) -> str:
+        return self.host + ":" + str(self.port)
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.read_task = asyncio.ensure_future(self.read_responses())
+
+    async def read_responses(self):
         try:
-            # Should be ready to read
-            data = self.sock.recv(4096)
-        except BlockingIOError:
-            # Resource temporarily unavailable (errno EWOULDBLOCK)
-            pass
-        else:
-            if data:
-                self._recv_buffer += data
-            else:
-                raise RuntimeError("Peer closed.")
-
-    def _write(self):
-        if self._send_buffer:
-            if self.v:
-                print("sending", repr(self._send_buffer), "to", self.addr)
-            try:
-                # Should be ready to write
-                sent = self.sock.send(self._send_buffer)
-            except BlockingIOError:
-                # Resource temporarily unavailable (errno EWOULDBLOCK)
-                pass
-            else:
-                self._send_buffer = self._send_buffer[sent:]
-
-    def _json_encode(self, obj, encoding):
-        return json.dumps(obj, ensure_ascii=False).encode(encoding)
-
-    def _json_decode(self, json_bytes, encoding):
-        tiow = io.TextIOWrapper(
-            io.BytesIO(json_bytes), encoding=encoding, newline=""
-        )
-        obj = json.load(tiow)
-        tiow.close()
-        return obj
-
-    def _create_message(
-        self, *, content_bytes, content_type, content_encoding
-    ):
-        jsonheader = {
-            "byteorder": sys.byteorder,
-            "content-type": content_type,
-            "content-encoding": content_encoding,
-            "content-length": len(content_bytes),
-        }
-        jsonheader_bytes = self._json_encode(jsonheader, "utf-8")
-        message_hdr = struct.pack(">H", len(jsonheader_bytes))
-        message = message_hdr + jsonheader_bytes + content_bytes
-        return message
-
-    def _process_response_json_content(self):
-        content = self.response
-        result = content.get("result")
-        if self.v:
-            print(f"got result: {result}")
-        return result
-
-    def _process_response_binary_content(self):
-        content = self.response
-        if self.v:
-            print(f"got response: {repr(content)}")
-
-    def process_events(self, mask):
-        if mask & selectors.EVENT_READ:
-            return self.read()
-        if mask & selectors.EVENT_WRITE:
-            self.write()
-
-    def read(self):
-        self._read()
-
-        if self._jsonheader_len is None:
-            self.process_protoheader()
-
-        if self._jsonheader_len is not None:
-            if self.jsonheader is None:
-                self.process_jsonheader()
-
-        if self.jsonheader:
-            if self.response is None:
-                return self.process_response()
-
-    def write(self):
-        if not self._request_queued:
-            self.queue_request()
-
-        self._write()
-
-        if self._request_queued:
-            if not self._send_buffer:
-                # Set selector to listen for read events, we're done writing.
-                self._set_selector_events_mask("r")
-
-    def close(self):
-        if self.v:
-            print("closing connection to", self.addr)
-        try:
-            self.selector.unregister(self.sock)
+            while True:
+                msg_type, request_id, meta, arrays = await read_frame(self.reader)
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((msg_type, meta, arrays))
         except Exception as e:
-            print(
-                f"error: selector.unregister() exception for",
-                f"{self.addr}: {repr(e)}",
-            )
-
+            self.close(ConnectionError("connection to " + self.addr() + " is lost: " + repr(e)))
+
+    def load(self) -> int:
+        """the number of requests waiting for a response."""
+        return len(self.pending)
+
+    async def request(self, msg_type: int, meta: dict, arrays: dict = None) -> tuple:
+        """send a request, and wait for its response.
+
+        Raises:
+            ConnectionError: if the connection is lost.
+            RuntimeError: if the slave fails to process the request.
+
+        Returns:
+            tuple: the meta and the arrays of the response.
+        """
+        if self.b_closed:
+            raise ConnectionError("connection to " + self.addr() + " is closed.")
+        self.next_id += 1
+        request_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
         try:
-            self.sock.close()
-        except OSError as e:
-            print(
-                f"error: socket.close() exception for",
-                f"{self.addr}: {repr(e)}",
-            )
+            self.writer.write(encode_frame(msg_type, request_id, meta, arrays, self.compress_level))
+            await self.writer.drain()
+            msg_type, meta, arrays = await future
         finally:
-            # Delete reference to socket object for garbage collection
-            self.sock = None
-
-    def queue_request(self):
-        content = self.request["content"]
-        content_type = self.request["type"]
-        content_encoding = self.request["encoding"]
-        if content_type == "text/json":
-            req = {
-                "content_bytes": self._json_encode(content, content_encoding),
-                "content_type": content_type,
-                "content_encoding": content_encoding,
-            }
-        else:
-            req = {
-                "content_bytes": content,
-                "content_type": content_type,
-                "content_encoding": content_encoding,
-            }
-        message = self._create_message(**req)
-        self._send_buffer += message
-        self._request_queued = True
-
-    def process_protoheader(self):
-        hdrlen = 2
-        if len(self._recv_buffer) >= hdrlen:
-            self._jsonheader_len = struct.unpack(
-                ">H", self._recv_buffer[:hdrlen]
-            )[0]
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-
-    def process_jsonheader(self):
-        hdrlen = self._jsonheader_len
-        if len(self._recv_buffer) >= hdrlen:
-            self.jsonheader = self._json_decode(
-                self._recv_buffer[:hdrlen], "utf-8"
-            )
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-            for reqhdr in (
-                "byteorder",
-                "content-length",
-                "content-type",
-                "content-encoding",
-            ):
-                if reqhdr not in self.jsonheader:
-                    raise ValueError(f'Missing required header "{reqhdr}".')
-
-    def process_response(self):
-        content_len = self.jsonheader["content-length"]
-        if not len(self._recv_buffer) >= content_len:
+            self.pending.pop(request_id, None)
+        if msg_type == MSG_ERROR:
+            raise RuntimeError("slave " + self.addr() + " failed: " + meta["error"])
+        return meta, arrays
+
+    async def hello(self, config_id: str, runtime_config: dict, mdl_name: str):
+        """register the runtime configuration and the model, once per connection."""
+        if (config_id, mdl_name) in self.sessions:
             return
-        data = self._recv_buffer[:content_len]
-        self._recv_buffer = self._recv_buffer[content_len:]
-        if self.jsonheader["content-type"] == "text/json":
-            encoding = self.jsonheader["content-encoding"]
-            self.response = self._json_decode(data, encoding)
-            if self.v:
-                print("received response ", " from ",
-                      self.addr)  # repr(self.response)
-            result = self._process_response_json_content()
-        else:
-            # Binary or unknown content-type
-            self.response = data
-            if self.v:
-                print(
-                    f'received {self.jsonheader["content-type"]} response from',
-                    self.addr,
-                )
-            self._process_response_binary_content()
-        # Close when response has been processed
-        self.close()
-        return result
+        await self.request(MSG_HELLO, {"config_id": config_id, "runtime_config": runtime_config,
+                                       "mdl_name": mdl_name, "compress_level": self.compress_level})
+        self.sessions.add((config_id, mdl_name))
+
+    async def predicts(self, mdl_name: str, func: str, x_lb: float, x_ub: float, x_categorical_conditions, runtime_config: dict, groups: list, filter_dbest=None) -> pd.DataFrame:
+        """make predictions for a chunk of groups on the slave.
+
+        Returns:
+            pd.DataFrame: the predictions.
+        """
+        config_id = config_fingerprint(runtime_config)
+        await self.hello(config_id, runtime_config, mdl_name)
+        meta, arrays = pack_groups(groups)
+        meta.update(mdl_name=mdl_name, func=func, x_lb=x_lb, x_ub=x_ub,
+                    x_categorical_conditions=x_categorical_conditions,
+                    filter_dbest=filter_dbest, config_id=config_id)
+        meta, arrays = await self.request(MSG_QUERY, meta, arrays)
+        return unpack_dataframe(meta, arrays)
+
+    def close(self, error: Exception = None):
+        """close the connection, failing the waiting requests."""
+        self.b_closed = True
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error or ConnectionError(
+                    "connection to " + self.addr() + " is closed."))
+        self.pending.clear()
+        if self.writer is not None:
+            self.writer.close()
+        if self.read_task is not None and not self.read_task.done() and \
+                self.read_task is not asyncio.current_task():
+            self.read_task.cancel()
+
+
+class ConnectionPool:
+    """The connections to the slaves, reused across queries.
+
+    Up to max_connections connections are opened per slave; a new one is only opened when all the
+    open ones are busy.
+    """
+
+    def __init__(self, max_connections: int = 2, compress_level: int = 0):
+        self.max_connections = max_connections
+        self.compress_level = compress_level
+        self.connections = {}
+        self.locks = {}
+
+    async def get(self, host: str, port: int) -> Connection:
+        """get the least loaded connection to a slave, opening one if needed.
+
+        Args:
+            host (str): the host of the slave.
+            port (int): the port of the slave.
+
+        Returns:
+            Connection: the connection.
+        """
+        key = (host, port)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            connections = [c for c in self.connections.get(key, []) if not c.b_closed]
+            self.connections[key] = connections
+            if connections:
+                connection = min(connections, key=lambda c: c.load())
+                if connection.load() == 0 or len(connections) >= self.max_connections:
+                    return connection
+            connection = Connection(host, port, self.compress_level)
+            await connection.open()
+            connections.append(connection)
+            return connection
+
+    def close(self):
+        for connections in self.connections.values():
+            for connection in connections:
+                connection.close()
+        self.connections = {}
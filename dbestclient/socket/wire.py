@@ -0,0 +1,213 @@
+#
+# Created by Qingzhi Ma on Sun Oct 18 2020
+#
+# Copyright (c) 2020 Department of Computer Science, University of Warwick
+# Copyright 2020 Qingzhi Ma
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""The binary wire protocol between the master and the slaves.
+
+Each message is a frame:
+    - a fixed header: version, message type, flags, request id, meta length and body length,
+    - meta: a small json document, which also describes the arrays in the body,
+    - body: the raw bytes of the numpy arrays, zlib compressed if FLAG_COMPRESSED is set.
+The request id is echoed in the response, so requests can be pipelined on a connection.
+"""
+import hashlib
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+WIRE_VERSION = 1
+HEADER = struct.Struct(">BBHQII")
+
+# message types
+MSG_HELLO = 1  # register a runtime configuration and a model on the connection.
+MSG_HELLO_OK = 2
+MSG_QUERY = 3
+MSG_RESULT = 4
+MSG_ERROR = 5
+
+# flags
+FLAG_COMPRESSED = 1
+
+# bodies smaller than this are never compressed.
+MIN_COMPRESS_BYTES = 1024
+
+
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("Object of type " + type(value).__name__ + " is not JSON serializable")
+
+
+def encode_frame(msg_type: int, request_id: int, meta: dict, arrays: dict = None, compress_level: int = 0) -> bytes:
+    """encode a message as a frame.
+
+    Args:
+        msg_type (int): the message type.
+        request_id (int): the request id.
+        meta (dict): the json serializable part of the message.
+        arrays (dict, optional): the numpy arrays, with the name as the key. Defaults to None.
+        compress_level (int, optional): the zlib level, 0 for no compression. Defaults to 0.
+
+    Returns:
+        bytes: the frame.
+    """
+    meta = dict(meta)
+    specs = []
+    chunks = []
+    offset = 0
+    for name, array in (arrays or {}).items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise TypeError("arrays of objects can not be sent: " + name)
+        data = array.tobytes()
+        specs.append([name, array.dtype.str, list(array.shape), offset, len(data)])
+        chunks.append(data)
+        offset += len(data)
+    meta["arrays"] = specs
+    body = b"".join(chunks)
+
+    flags = 0
+    if compress_level > 0 and len(body) >= MIN_COMPRESS_BYTES:
+        body = zlib.compress(body, compress_level)
+        flags |= FLAG_COMPRESSED
+    meta_bytes = json.dumps(meta, default=json_default).encode("utf-8")
+    header = HEADER.pack(WIRE_VERSION, msg_type, flags, request_id, len(meta_bytes), len(body))
+    return header + meta_bytes + body
+
+
+def decode_header(header: bytes) -> tuple:
+    """decode the fixed header of a frame.
+
+    Returns:
+        tuple: the message type, flags, request id, meta length and body length.
+    """
+    version, msg_type, flags, request_id, meta_len, body_len = HEADER.unpack(header)
+    if version != WIRE_VERSION:
+        raise ValueError("unsupported wire protocol version " + str(version))
+    return msg_type, flags, request_id, meta_len, body_len
+
+
+def decode_payload(flags: int, meta_bytes: bytes, body: bytes) -> tuple:
+    """decode the meta and the arrays of a frame.
+
+    Returns:
+        tuple: the meta and the arrays, with the name as the key.
+    """
+    meta = json.loads(meta_bytes.decode("utf-8"))
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    arrays = {}
+    for name, dtype, shape, offset, nbytes in meta.pop("arrays", []):
+        arrays[name] = np.frombuffer(body, dtype=np.dtype(dtype), count=int(np.prod(shape)),
+                                     offset=offset).reshape(shape)
+    return meta, arrays
+
+
+async def read_frame(reader) -> tuple:
+    """read a frame from an asyncio stream.
+
+    Returns:
+        tuple: the message type, request id, meta and arrays.
+    """
+    header = await reader.readexactly(HEADER.size)
+    msg_type, flags, request_id, meta_len, body_len = decode_header(header)
+    meta_bytes = await reader.readexactly(meta_len)
+    body = await reader.readexactly(body_len)
+    meta, arrays = decode_payload(flags, meta_bytes, body)
+    return msg_type, request_id, meta, arrays
+
+
+def pack_strings(values: list) -> tuple:
+    """pack a list of strings as utf-8 bytes and the offsets of each string.
+
+    Returns:
+        tuple: the uint8 data and the int64 offsets, of length len(values)+1.
+    """
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data: np.ndarray, offsets: np.ndarray) -> list:
+    raw = data.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def pack_groups(groups: list, name: str = "groups") -> tuple:
+    """pack the group keys of a query.
+
+    Returns:
+        tuple: the meta and the arrays describing the groups.
+    """
+    if groups is None:
+        return {name: None}, {}
+    if all(isinstance(g, str) for g in groups):
+        data, offsets = pack_strings(groups)
+        return {name: "strings"}, {name + ".data": data, name + ".offsets": offsets}
+    return {name: "json", name + ".values": list(groups)}, {}
+
+
+def unpack_groups(meta: dict, arrays: dict, name: str = "groups"):
+    kind = meta.get(name)
+    if kind is None:
+        return None
+    if kind == "strings":
+        return unpack_strings(arrays[name + ".data"], arrays[name + ".offsets"])
+    return meta[name + ".values"]
+
+
+def pack_dataframe(df: pd.DataFrame) -> tuple:
+    """pack the predictions, one array per column. Columns of strings are packed with pack_strings().
+
+    Returns:
+        tuple: the meta and the arrays.
+    """
+    columns = []
+    arrays = {}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype.hasobject:
+            data, offsets = pack_strings(values.tolist())
+            arrays[str(i) + ".data"] = data
+            arrays[str(i) + ".offsets"] = offsets
+            columns.append([column, "strings"])
+        else:
+            arrays[str(i)] = values
+            columns.append([column, "array"])
+    return {"columns": columns}, arrays
+
+
+def unpack_dataframe(meta: dict, arrays: dict) -> pd.DataFrame:
+    data = {}
+    for i, (column, kind) in enumerate(meta["columns"]):
+        if kind == "strings":
+            data[column] = unpack_strings(arrays[str(i) + ".data"], arrays[str(i) + ".offsets"])
+        else:
+            data[column] = arrays[str(i)]
+    return pd.DataFrame(data, columns=[column for column, _ in meta["columns"]])
+
+
+def config_fingerprint(runtime_config: dict) -> str:
+    """the id of a runtime configuration, so that it is sent once per connection."""
+    text = json.dumps(runtime_config, sort_keys=True, default=json_default)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
@@ -34,16 +34,40 @@ RUNTIME_CONF = {
     "epsabs": 10.0,
     "epsrel": 0.1,
     "limit": 30,
-    "model_suffix": ".dill",
+    "model_suffix": ".dbest",  # models in the legacy .dill format are still readable
     "slaves": Slaves(),
     "sampling_only":False,
+    # uniform sampling reads the sampled lines only, located by an index of the lines kept in the warehouse.
+    "b_line_index": False,
     "plot":False,
+    # the number of rows fed to the network at a time, to bound the memory of inference.
+    "inference_batch_size": 100000,
+    # bounds of the models kept in memory, the least recently used ones are evicted. None means no bound.
+    "max_resident_models": None,
+    "max_resident_bytes": None,
+    # cluster mode: the connections kept open to each slave, and the zlib level of the messages (0 is off).
+    "wire_max_connections": 2,
+    "wire_compress_level": 0,
+    # cluster mode: the deadline of a request to a slave, and of the whole query, in seconds (None is no deadline).
+    "slave_timeout": 60.0,
+    "slave_retries": 1,
+    "query_timeout": None,
+    # re-issue a chunk to an idle slave, once it runs for longer than this times its expected duration.
+    "hedge_after": 2.0,
+    # answer with the groups gathered so far if some slaves fail, instead of raising an error. The missing
+    # groups are then in the attrs["missing_groups"] of the result.
+    "b_allow_partial_results": False,
+    # slave: the threads computing the requests (None is one per core), and the requests in flight
+    # before the slave stops reading from the masters (None is twice the threads).
+    "slave_max_workers": None,
+    "slave_max_pending": None,
 }
 
 
 def shrink_runtime_config(runtime_config):
     runtime_config = dict(runtime_config)
     runtime_config.pop("slaves")
+    runtime_config.pop("worker_pool", None)
     runtime_config.pop("epsabs")
     runtime_config.pop("epsrel")
     runtime_config.pop("limit")
@@ -75,6 +99,8 @@ class DbestConfig:
             "scaling_factor": None,
             "csv_split_char": ",",
             "table_header": None,
+            # csv, parquet, arrow or npy. None is by the extension of the file, and csv for the others.
+            "source_format": None,
             "accept_filter": False,
             # MDN related parameters
             "n_epoch": 20,
@@ -88,6 +114,14 @@ class DbestConfig:
             "n_embedding_dim": 20,
             "encoder": "embedding",  # onehot, embedding, binary
             "batch_size": 1000,
+            # the bound of a minibatch, which grows with the sample beyond batch_size.
+            "max_batch_bytes": 1 << 26,
+            # stop the training when the loss of the held-out rows has not improved for so many epochs (None is off,
+            # all the rows are trained on for n_epoch epochs).
+            "early_stopping_patience": None,
+            "validation_ratio": 0.1,
+            # the wall-clock time of the training of each network, in seconds (None is no limit).
+            "train_time_budget": None,
             "one_model": True,
         }
 
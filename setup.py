@@ -40,6 +40,10 @@ keywords='Approximate Query Processing AQP',
     install_requires=[
         'numpy', 'sqlparse', 'pandas', 'scikit-learn', 'qregpy', 'scipy', 'dill', 'matplotlib', 'torch', 'category_encoders', 'tox', 'sphinx', 'gensim',
     ],
+    extras_require={
+        'zst': ['zstandard'],  # to read .zst data files.
+        'columnar': ['pyarrow'],  # to read Parquet and Arrow data files.
+    },
     test_suite='nose.collector',
     tests_require=['nose'],
 )
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import dill
+from dbestclient.catalog.catalog import DBEstModelCatalog
+from dbestclient.catalog.modelformat import save_model
+from dbestclient.executor.workerpool import WorkerPool
+from dbestclient.tools.running_parameters import RUNTIME_CONF
+
+
+class ToyModel:
+    def __init__(self, mdl_name, n_groups):
+        self.mdl_name = mdl_name
+        self.n_total_point = {str(i): i for i in range(n_groups)}
+        self.usecols = {"y": ["y"], "x_continous": ["x"], "x_categorical": [], "gb": ["g"]}
+
+    def init_pickle_file_name(self, runtime_config):
+        return self.mdl_name + runtime_config["model_suffix"]
+
+    def predicts(self, func, x_lb, x_ub, x_categorical_conditions, runtime_config, groups=None, filter_dbest=None):
+        return [self.mdl_name, len(self.n_total_point), groups]
+
+
+class TestDBEstModelCatalog(unittest.TestCase):
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+        self.runtime_config = dict(RUNTIME_CONF)
+        self.runtime_config["v"] = False
+        for i in range(3):
+            with open(os.path.join(self.warehouse, "m" + str(i) + ".dill"), "wb") as f:
+                dill.dump(ToyModel("m" + str(i), i + 1), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def test_lazy_loading(self):
+        catalog = DBEstModelCatalog()
+        self.assertEqual(catalog.load_manifest(self.warehouse, self.runtime_config), 3)
+        self.assertEqual(catalog.get_model_names(), ["m0.dbest", "m1.dbest", "m2.dbest"])
+        self.assertEqual(len(catalog.model_catalog), 0)
+
+        model = catalog.get_model("m2.dbest", self.runtime_config)
+        self.assertEqual(model.mdl_name, "m2")
+        self.assertEqual(catalog.manifest["m2.dbest"]["n_groups"], 3)
+        self.assertEqual(catalog.manifest["m2.dbest"]["type"], "ToyModel")
+
+        # the details are kept in the manifest for the next session.
+        catalog = DBEstModelCatalog()
+        catalog.load_manifest(self.warehouse, self.runtime_config)
+        self.assertEqual(catalog.manifest["m2.dbest"]["columns"], ["y", "x", "g"])
+
+    def test_converted_model(self):
+        catalog = DBEstModelCatalog()
+        catalog.load_manifest(self.warehouse, self.runtime_config)
+        model = catalog.get_model("m1.dbest", self.runtime_config)
+        save_model(model, os.path.join(self.warehouse, "m1.dbest"))
+
+        catalog = DBEstModelCatalog()
+        self.assertEqual(catalog.load_manifest(self.warehouse, self.runtime_config), 3)
+        self.assertEqual(catalog.manifest["m1.dbest"]["file"], "m1.dbest")
+        self.assertEqual(catalog.get_model("m1.dbest", self.runtime_config).n_total_point, {"0": 0, "1": 1})
+
+    def test_lru_eviction(self):
+        catalog = DBEstModelCatalog()
+        catalog.load_manifest(self.warehouse, self.runtime_config)
+        self.runtime_config["max_resident_models"] = 2
+        for name in ["m0.dbest", "m1.dbest", "m0.dbest", "m2.dbest"]:
+            catalog.get_model(name, self.runtime_config)
+        self.assertEqual(list(catalog.model_catalog), ["m0.dbest", "m2.dbest"])
+
+    def test_worker_pool(self):
+        catalog = DBEstModelCatalog()
+        catalog.load_manifest(self.warehouse, self.runtime_config)
+        worker_pool = WorkerPool()
+        self.runtime_config["worker_pool"] = worker_pool
+        self.runtime_config["max_resident_models"] = 2
+        try:
+            pool = None
+            for name in ["m0.dbest", "m1.dbest", "m2.dbest", "m0.dbest"]:
+                model = catalog.get_model(name, self.runtime_config)
+                results = worker_pool.predicts(2, name, model, "count", None, None, None, self.runtime_config,
+                                               [["a"], ["b"], ["c"]])
+                self.assertEqual(results, [[model.mdl_name, len(model.n_total_point), [g]] for g in ["a", "b", "c"]])
+                # the workers are not restarted for another model.
+                self.assertIs(worker_pool.pool, pool or worker_pool.pool)
+                pool = worker_pool.pool
+                # the evicted models are not kept by the pool.
+                self.assertEqual(sorted(worker_pool.models), sorted(catalog.model_catalog))
+        finally:
+            worker_pool.close()
+
+    def test_remove_model(self):
+        catalog = DBEstModelCatalog()
+        catalog.load_manifest(self.warehouse, self.runtime_config)
+        self.assertTrue(catalog.remove_model("m1.dbest"))
+        self.assertFalse(os.path.exists(os.path.join(self.warehouse, "m1.dill")))
+        self.assertFalse(catalog.has_model("m1.dbest"))
+        self.assertIsNone(catalog.get_model("m1.dbest", self.runtime_config))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+from dbestclient.catalog.modelformat import load_model, save_model
+from dbestclient.ml.mdn import MDN
+from dbestclient.tools.running_parameters import DbestConfig
+from sklearn.preprocessing import OneHotEncoder
+
+
+class TestModelFormat(unittest.TestCase):
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def test_round_trip(self):
+        config = DbestConfig()
+        enc = OneHotEncoder(handle_unknown="ignore").fit([["a"], ["b"], ["c"]])
+        network = nn.Sequential(nn.Linear(3, 5), nn.Tanh(), nn.Dropout(0.1), MDN(5, 1, 2, "cpu"))
+        network.eval()
+        frequencies = {str(i): i for i in range(100)}
+        model = {
+            "config": config,
+            "encoder": enc,
+            "network": network,
+            "frequencies": frequencies,
+            "embeddings": {"city" + str(i): np.full(4, i, dtype=np.float32) for i in range(10)},
+            "groups": [str(i) for i in range(20)],
+            "x_min": -np.inf,
+            "mean": np.float64(1.5),
+            "cache": ({"a": 0}, np.arange(6, dtype=np.float32).reshape(2, 3)),
+            "shared": [frequencies, frequencies],
+        }
+        path = os.path.join(self.warehouse, "m.dbest")
+        save_model(model, path)
+        loaded = load_model(path)
+
+        self.assertEqual(loaded["config"].config, config.config)
+        self.assertEqual(loaded["encoder"].transform([["b"]]).toarray().tolist(), [[0.0, 1.0, 0.0]])
+        inputs = torch.rand(4, 3)
+        for expected, result in zip(network(inputs), loaded["network"](inputs)):
+            self.assertTrue(torch.allclose(expected, result))
+        self.assertEqual(loaded["frequencies"], frequencies)
+        np.testing.assert_array_equal(loaded["embeddings"]["city3"], np.full(4, 3))
+        self.assertEqual(loaded["groups"], model["groups"])
+        self.assertEqual(loaded["x_min"], -np.inf)
+        self.assertIsInstance(loaded["mean"], np.float64)
+        np.testing.assert_array_equal(loaded["cache"][1], model["cache"][1])
+        self.assertIs(loaded["shared"][0], loaded["frequencies"])
+
+    def test_numeric_categories(self):
+        groups = [[1.0], [2.0], [10.0]]
+        enc = OneHotEncoder(handle_unknown="ignore", dtype=np.float32).fit(groups)
+        path = os.path.join(self.warehouse, "m.dbest")
+        save_model(enc, path)
+        loaded = load_model(path)
+
+        # the categories keep their type and their order.
+        self.assertEqual(loaded.categories_[0].tolist(), [1.0, 2.0, 10.0])
+        self.assertEqual(loaded.dtype, np.float32)
+        self.assertEqual(loaded.transform(groups).toarray().tolist(), enc.transform(groups).toarray().tolist())
+        self.assertEqual(loaded.transform([[10.0]]).toarray().tolist(), [[0.0, 0.0, 1.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dbestclient.io.columnar import ColumnarSource, get_source_format, pa
+from dbestclient.io.reservoir import ReservoirSampling
+from dbestclient.io.stratifiedreservoir import StratifiedReservoir
+
+
+class TestColumnar(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        n = 10000
+        self.array = np.zeros(n, dtype=[("A", "f8"), ("B", "f8"), ("C", "i8"), ("D", "f8")])
+        self.array["A"] = np.arange(n)
+        self.array["B"] = 2 * np.arange(n)
+        self.array["C"] = np.arange(n) % 3
+        self.array["B"][5] = np.nan  # a null value, not sampled.
+        self.usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, extension):
+        file = os.path.join(self.folder, "table" + extension)
+        if extension == ".npy":
+            np.save(file, self.array)
+        elif extension == ".parquet":
+            pd.DataFrame(self.array).to_parquet(file, row_group_size=1000)
+        return file
+
+    def test_format(self):
+        self.assertEqual(get_source_format("a/b.PARQUET"), "parquet")
+        self.assertEqual(get_source_format("a/b.csv"), "csv")
+        self.assertEqual(get_source_format(["a/b.dat"], "npy"), "npy")
+
+    def check(self, file):
+        source = ColumnarSource(file)
+        self.assertEqual(source.columns(), ["a", "b", "c", "d"])
+        sample, n = source.read_sample(["a", "c"], ["c"], 100)
+        self.assertEqual(n, 10000)
+        self.assertEqual(len(set(sample["a"])), 100)
+        self.assertEqual(set(sample["c"]), {"0", "1", "2"})
+
+        sampler = ReservoirSampling(None)
+        sampler.build_reservoir(file, 500, usecols=self.usecols)
+        self.assertEqual(sampler.n_total_point, 10000)
+        self.assertEqual(list(sampler.sampledf.columns), ["b", "a", "c"])
+        self.assertTrue(np.all(sampler.sampledf["b"] == 2 * sampler.sampledf["a"]))
+
+        stratified = StratifiedReservoir(file, capacity=100, warehouse=self.folder)
+        stratified.save_sample = False
+        stratified.make_sample_for_sql_condition(self.usecols)
+        self.assertEqual(stratified.ft_table, {"0": 3334, "1": 3333, "2": 3333})
+        self.assertEqual(stratified.sample["2"].n_seen, 3332)
+        self.assertEqual(stratified.sample["2"].size, 100)
+        self.assertTrue(np.all(stratified.data_labels == 2 * stratified.data_features[:, 0]))
+
+    def test_npy(self):
+        self.check(self.write(".npy"))
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed.")
+    def test_parquet(self):
+        self.check(self.write(".parquet"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import os
+import shutil
+import tempfile
+import unittest
+
+from dbestclient.io.lineindex import LineIndex
+from dbestclient.io.reservoir import ReservoirSampling
+
+
+class TestLineIndex(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+        self.file = os.path.join(self.warehouse, "t.csv")
+        with open(self.file, "w") as f:
+            f.write("a|b\n")
+            for i in range(1000):
+                f.write("%d|g%d\n" % (i, i % 7))
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def test_index(self):
+        index = LineIndex(self.file, self.warehouse).load_or_build()
+        self.assertEqual(index.n_lines(), 1001)
+        self.assertEqual(list(index.read_lines([0, 1, 1000])), [b"a|b", b"0|g0", b"999|g5"])
+        self.assertTrue(os.path.isfile(index.path))
+
+        # loaded from the warehouse, and rebuilt once the file changes.
+        self.assertEqual(LineIndex(self.file, self.warehouse).load_or_build().n_lines(), 1001)
+        with open(self.file, "a") as f:
+            f.write("1000|g6")
+        index = LineIndex(self.file, self.warehouse).load_or_build()
+        self.assertEqual(list(index.read_lines([1001])), [b"1000|g6"])
+
+    def test_sample(self):
+        usecols = {"y": ["a", "real", None], "x_continous": [], "x_categorical": [], "gb": ["b"]}
+        sampler = ReservoirSampling(None)
+        index = LineIndex(self.file, self.warehouse).load_or_build()
+        sampler.build_from_index(self.file, 100, index, split_char="|", usecols=usecols)
+        self.assertEqual(sampler.n_total_point, 1000)
+        self.assertEqual(len(sampler.sampledf), 100)
+        self.assertEqual(len(set(sampler.sampledf["a"])), 100)
+        self.assertTrue(((sampler.sampledf["a"] % 7).astype(int).astype(str) ==
+                         sampler.sampledf["b"].str[1:]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from dbestclient.io.reservoir import (ReservoirSampling, read_ahead,
+                                      read_line_blocks)
+
+
+class TestReservoirSampling(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        fd, self.file = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write("A,B,C,D\n")
+            for i in range(10000):
+                f.write("%d,%d,g%d,x\n" % (i, 2 * i, i % 3))
+            f.write("bad,1,g0,x")  # no newline at the end.
+
+    def tearDown(self):
+        os.remove(self.file)
+
+    def test_sample(self):
+        usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+        sampler = ReservoirSampling(None)
+        sampler.build_reservoir(self.file, 500, usecols=usecols)
+
+        self.assertEqual(sampler.header, ["a", "b", "c", "d"])
+        self.assertEqual(sampler.n_total_point, 10001)
+        self.assertEqual(list(sampler.sampledf.columns), ["b", "a", "c"])
+        self.assertEqual(sampler.sampledf["a"].dtype, np.float64)
+        self.assertTrue(np.all(sampler.sampledf["b"] == 2 * sampler.sampledf["a"]))
+        self.assertTrue(set(sampler.sampledf["c"]) <= {"g0", "g1", "g2"})
+        # 500 rows, less the "bad" one if it is sampled.
+        self.assertGreaterEqual(len(sampler.sampledf), 499)
+        self.assertEqual(len(set(sampler.sampledf["a"])), len(sampler.sampledf))
+        # roughly uniform over the file.
+        self.assertLess(abs(sampler.sampledf["a"].mean() - 5000), 600)
+
+    def test_missing_fields(self):
+        with open(self.file, "w") as f:
+            f.write("A,B,C,D\n1,2,g1,x\n3,6\n5,10,,x\n7,14,g0\n")
+        usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+        sampler = ReservoirSampling(None)
+        sampler.build_reservoir(self.file, 100, usecols=usecols)
+        # the rows without a group are kept, in the group "", as in the stratified samples.
+        self.assertEqual(sampler.sampledf["a"].tolist(), [1.0, 3.0, 5.0, 7.0])
+        self.assertEqual(sampler.sampledf["c"].tolist(), ["g1", "", "", "g0"])
+
+    def test_small_blocks(self):
+        n_lines = sum(len(ends) for _, _, ends in read_line_blocks(self.file, block_size=7))
+        self.assertEqual(n_lines, 10002)
+
+        sampler = ReservoirSampling(None)
+        sampler.build_reservoir(self.file, None)
+        self.assertEqual(len(sampler.sampledf), 10001)
+        self.assertEqual(sampler.sampledf["a"].iloc[-1], "bad")
+
+    def test_gzip(self):
+        with open(self.file, "rb") as f, gzip.open(self.file + ".gz", "wb") as g:
+            shutil.copyfileobj(f, g)
+        try:
+            blocks = list(read_line_blocks(self.file + ".gz", block_size=1000))
+            self.assertEqual(sum(len(ends) for _, _, ends in blocks), 10002)
+            first, starts, ends = blocks[0]
+            self.assertEqual(first[starts[1]:ends[1]], b"0,0,g0,x")
+            with self.assertRaises(ValueError):
+                list(read_line_blocks(self.file + ".gz", start=10))
+
+            usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+            sampler = ReservoirSampling(None)
+            sampler.build_reservoir(self.file + ".gz", 500, usecols=usecols)
+            self.assertEqual(sampler.n_total_point, 10001)
+            self.assertTrue(np.all(sampler.sampledf["b"] == 2 * sampler.sampledf["a"]))
+        finally:
+            os.remove(self.file + ".gz")
+
+    def test_read_ahead(self):
+        with open(self.file, "rb") as f:
+            data = b"".join(read_ahead(f, 7, depth=1))
+        with open(self.file, "rb") as f:
+            self.assertEqual(data, f.read())
+        # the reader may stop early.
+        with open(self.file, "rb") as f:
+            blocks = read_ahead(f, 7)
+            self.assertEqual(next(blocks), b"A,B,C,D")
+            blocks.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
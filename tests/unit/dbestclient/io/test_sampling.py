@@ -0,0 +1,160 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import dill
+
+from dbestclient.io.samplestore import SampleStore
+from dbestclient.io.sampling import DBEstSampling, shared_scan
+
+
+class TestSharedScan(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+        self.file = os.path.join(self.warehouse, "data.csv")
+        with open(self.file, "w") as f:
+            f.write("A,B,C\n")
+            for i in range(3000):
+                f.write("%d,%d,g%d\n" % (i, 2 * i, i % 3))
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def test_uniform_and_stratified(self):
+        uniform = DBEstSampling(
+            None, {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]},
+            mdl_name="uni", warehouse=self.warehouse)
+        stratified = DBEstSampling(
+            None, {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]},
+            mdl_name="str", warehouse=self.warehouse)
+        self.assertTrue(uniform.prepare_shared_scan(self.file, 200, "uniform"))
+        self.assertTrue(stratified.prepare_shared_scan(self.file, 50, "stratified"))
+        # a uniform sample of the whole file is made without the shared scan.
+        self.assertFalse(DBEstSampling(None, None).prepare_shared_scan(self.file, 0.1, "uniform"))
+
+        header = shared_scan(self.file, [uniform, stratified], b_skip_first_row=True)
+        self.assertEqual(header, ["a", "b", "c"])
+
+        uniform.make_sample(self.file, 200, "uniform")
+        self.assertEqual(uniform.n_total_point, 3000)
+        self.assertEqual(len(uniform.sample.sampledf), 200)
+        self.assertTrue((uniform.sample.sampledf["b"] == 2 * uniform.sample.sampledf["a"]).all())
+
+        stratified.make_sample(self.file, 50, "stratified")
+        self.assertEqual(stratified.sample.ft_table, {"g0": 1000, "g1": 1000, "g2": 1000})
+        self.assertEqual(stratified.sample.sample["g1"].size, 50)
+
+
+class TestSampleStore(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+        self.file = os.path.join(self.warehouse, "data.csv")
+        with open(self.file, "w") as f:
+            f.write("A,B,C\n")
+            for i in range(3000):
+                f.write("%d,%d,g%d\n" % (i, 2 * i, i % 3))
+        self.usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def test_shared_by_models(self):
+        for method, ratio in [("uniform", 200), ("stratified", 50)]:
+            first = DBEstSampling(None, self.usecols, mdl_name="m1", warehouse=self.warehouse)
+            first.make_sample(self.file, ratio, method)
+            second = DBEstSampling(None, self.usecols, mdl_name="m2", warehouse=self.warehouse)
+            # the same sample, whatever the name of the model.
+            self.assertFalse(second.prepare_shared_scan(self.file, ratio, method))
+            second.make_sample(self.file, ratio, method)
+            if method == "uniform":
+                self.assertTrue(first.sample.sampledf.equals(second.sample.sampledf))
+                self.assertEqual(second.n_total_point, 3000)
+            else:
+                self.assertEqual(first.sample.ft_table, second.sample.ft_table)
+
+        store = SampleStore(self.warehouse)
+        samples = [name for name in os.listdir(store.path) if name.endswith(".sample")]
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(store.release("m1"), 0)
+        self.assertEqual(store.release("m2"), 2)
+        self.assertEqual([name for name in os.listdir(store.path) if name.endswith(".sample")], [])
+        self.assertEqual(store.release("m3"), 0)
+
+    def test_sample_under_model_name(self):
+        # a sample left under the model name, by a model of another file.
+        with open(os.path.join(self.warehouse, "m1.sample"), "wb") as f:
+            dill.dump(SimpleNamespace(ft_table={"x": 1}, data_categoricals=None, data_features=None,
+                                      data_labels=None), f)
+        sampler = DBEstSampling(None, self.usecols, mdl_name="m1", warehouse=self.warehouse)
+        sampler.make_sample(self.file, 50, "stratified")
+        self.assertEqual(sampler.sample.ft_table, {"g0": 1000, "g1": 1000, "g2": 1000})
+
+        sampler = DBEstSampling(None, self.usecols, mdl_name="m1", warehouse=self.warehouse)
+        SampleStore(self.warehouse).release("m1")
+        self.assertTrue(sampler.prepare_shared_scan(self.file, 50, "stratified"))
+
+
+class TestPartitions(unittest.TestCase):
+    """"""
+
+    def setUp(self):
+        self.warehouse = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.warehouse, "parts"))
+        for part in range(3):
+            self.write_partition(part)
+        self.pattern = os.path.join(self.warehouse, "parts", "*.dat")
+        self.usecols = {"y": ["b", "real", None], "x_continous": ["a"], "x_categorical": [], "gb": ["c"]}
+
+    def tearDown(self):
+        shutil.rmtree(self.warehouse)
+
+    def write_partition(self, part):
+        with open(os.path.join(self.warehouse, "parts", "%d.dat" % part), "w") as f:
+            for i in range(1000 * part, 1000 * (part + 1)):
+                f.write("%d|%d|g%d\n" % (i, 2 * i, i % 4))
+
+    def make_sample(self, method, ratio):
+        sampler = DBEstSampling(["a", "b", "c"], self.usecols, n_jobs=2, mdl_name=method, warehouse=self.warehouse)
+        sampler.make_sample(self.pattern, ratio, method, split_char="|")
+        return sampler
+
+    def test_uniform(self):
+        sampler = self.make_sample("uniform", 300)
+        self.assertEqual(sampler.n_total_point, 3000)
+        self.assertEqual(len(sampler.sample.sampledf), 300)
+        self.assertEqual(len(set(sampler.sample.sampledf["a"])), 300)
+        self.assertTrue((sampler.sample.sampledf["b"] == 2 * sampler.sample.sampledf["a"]).all())
+
+    def test_stratified(self):
+        sampler = self.make_sample("stratified", 100)
+        self.assertEqual(sampler.sample.ft_table, {"g0": 750, "g1": 750, "g2": 750, "g3": 750})
+        self.assertEqual(sampler.sample.sample["g2"].size, 100)
+
+        # a new partition: only this one is sampled, the others are reused.
+        store = SampleStore(self.warehouse)
+        n_samples = len(os.listdir(store.path))
+        self.write_partition(3)
+        sampler = self.make_sample("stratified", 100)
+        self.assertEqual(sampler.sample.ft_table, {"g0": 1000, "g1": 1000, "g2": 1000, "g3": 1000})
+        # the sample of the new partition, and the merged sample.
+        self.assertEqual(len(os.listdir(store.path)), n_samples + 2)
+
+    def test_no_match(self):
+        with self.assertRaises(ValueError):
+            DBEstSampling(None, self.usecols, warehouse=self.warehouse).make_sample(
+                os.path.join(self.warehouse, "*.none"), 100, "stratified")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,18 @@
 # Department of Computer Science
 # the University of Warwick
 # Q.Ma.2@warwick.ac.uk
+import os
+import tempfile
 import unittest
 
-from dbestclient.io.stratifiedreservoir import StratifiedReservoir
+import numpy as np
+
+from dbestclient.io.stratifiedreservoir import (
+    StratifiedReservoir,
+    StratumReservoir,
+    merge_samples,
+    sample_byte_range,
+)
 
 
 class TestStratifiedReservoir(unittest.TestCase):
@@ -27,7 +36,12 @@ class TestStratifiedReservoir(unittest.TestCase):
         )
         cate, fea, lbl = sr.get_categorical_features_label()
 
-        self.assertEqual(sr.size(), 948)
+        # the null values are dropped as the rows are read, so the group of the null ss_store_sk,
+        # with 6 rows out of 52 without null values, is kept.
+        self.assertEqual(sr.size(), 1000)
+        self.assertEqual(sr.ft_table[""], 52)
+        self.assertEqual(len(lbl), len(fea))
+        self.assertFalse(np.isnan(fea).any())
 
     def test_tpcds_2job_no_equality(self):
         sr = StratifiedReservoir(
@@ -44,7 +58,7 @@ class TestStratifiedReservoir(unittest.TestCase):
             split_char="|",
         )
 
-        self.assertEqual(sr.size(), 948)
+        self.assertEqual(sr.size(), 1000)
 
     def test_tpcds_1job(self):
         sr = StratifiedReservoir(
@@ -210,6 +224,50 @@ class TestStratifiedReservoir(unittest.TestCase):
         self.assertEqual(features, features_target)
         self.assertEqual(labels, labels_target)
 
+    def test_merge_samples(self):
+        # stratum "a" has 90 rows in the first part and 10 in the second, so about 90% of its
+        # merged reservoir comes from the first part.
+        def part(key, n, value, capacity=5):
+            reservoir = StratumReservoir([key], 1, 0, capacity)
+            for _ in range(min(n, capacity)):
+                reservoir.append([value], [])
+            reservoir.n_seen = n
+            reservoir.trim(capacity)
+            return reservoir
+
+        n_from_first = 0
+        for _ in range(200):
+            first = ({"a": part("a", 90, 1.0)}, {"a": 90}, [])
+            second = ({"a": part("a", 10, 2.0), "b": part("b", 1, 3.0)}, {"a": 10, "b": 1}, [])
+            sample, ft, _ = merge_samples(first, second, 5, False)
+            self.assertEqual(ft, {"a": 100, "b": 1})
+            self.assertEqual(sample["a"].size, 5)
+            self.assertEqual(sample["a"].n_seen, 100)
+            self.assertEqual(sample["b"].values.tolist(), [[3.0]])
+            n_from_first += int((sample["a"].values == 1.0).sum())
+        self.assertAlmostEqual(n_from_first / 1000, 0.9, delta=0.05)
+
+    def test_uniform_per_stratum(self):
+        # the rows of a stratum are equally likely to be sampled, whatever the size of the other strata.
+        fd, file = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            for i in range(300):
+                f.write("%d,%s\n" % (i, "a" if i % 3 else "b"))
+        for b_fast in [True, False]:
+            counts = np.zeros(300)
+            for _ in range(500):
+                sample, ft, _ = sample_byte_range(file, 0, None, False, ",", [1], None, [0], [], 10, b_fast)
+                for reservoir in sample.values():
+                    counts[reservoir.values[: reservoir.size, 0].astype(int)] += 1
+            self.assertEqual(ft, {"b": 100, "a": 200})
+            # 500 * 10 / 100 for the rows of b, and 500 * 10 / 200 for those of a.
+            self.assertAlmostEqual(counts[::3][:50].mean(), 50, delta=6)
+            self.assertAlmostEqual(counts[::3][50:].mean(), 50, delta=6)
+            a_rows = np.arange(300) % 3 != 0
+            self.assertAlmostEqual(counts[a_rows][:100].mean(), 25, delta=4)
+            self.assertAlmostEqual(counts[a_rows][100:].mean(), 25, delta=4)
+        os.remove(file)
+
     # def test_hw(self):
     #     sr = StratifiedReservoir(
     #         "../data/huawei/merged",
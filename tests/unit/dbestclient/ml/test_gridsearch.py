@@ -0,0 +1,55 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import tempfile
+import unittest
+
+import numpy as np
+from dbestclient.ml.gridsearch import GridSearch
+from dbestclient.tools.running_parameters import RUNTIME_CONF, DbestConfig
+
+
+class Candidate:
+    def __init__(self, error):
+        self.error = error
+
+    def fit(self, xs, runtime_config):
+        return self
+
+    def score(self, runtime_config):
+        return self.error
+
+
+class TestGridSearch(unittest.TestCase):
+    """"""
+
+    def test_search(self):
+        config = DbestConfig()
+        config.set_parameter("warehousedir", tempfile.mkdtemp())
+        runtime_config = RUNTIME_CONF.copy()
+        param_grid = {"epoch": [9], "node": [5, 10, 20], "hidden": [1, 2, 3]}
+        xs = np.arange(10000)
+        fits = []
+
+        def make_candidate(para, rows, n_epoch):
+            fits.append((len(rows), n_epoch))
+            return Candidate(abs(para["node"] - 10) + abs(para["hidden"] - 2)), (xs[rows],), {}
+
+        params = GridSearch(config, runtime_config).search("test", param_grid, (xs,), make_candidate)
+        self.assertEqual(params, {"epoch": 9, "node": 10, "hidden": 2})
+        # 9 candidates on few rows for a few epochs, then the best 3 on more of them.
+        self.assertEqual(fits, [(2000, 3)] * 9 + [(3333, 9)] * 3)
+
+        # the result of the search is kept in the warehouse.
+        fits.clear()
+        params = GridSearch(config, runtime_config).search("test", param_grid, (xs,), make_candidate)
+        self.assertEqual(params, {"epoch": 9, "node": 10, "hidden": 2})
+        self.assertEqual(fits, [])
+        GridSearch(config, runtime_config).search("test", param_grid, (xs + 1,), make_candidate)
+        self.assertEqual(len(fits), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
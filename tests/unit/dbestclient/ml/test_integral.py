@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+from dbestclient.ml.integral import approx_count, gm_cdf
+from scipy import stats
+
+
+class TestGmCdf(unittest.TestCase):
+    def setUp(self):
+        self.pis = np.array([[0.3, 0.7], [0.5, 0.5]])
+        self.mus = np.array([[-0.5, 0.2], [0.0, 0.8]])
+        self.sigmas = np.array([[0.1, 0.3], [0.2, 0.05]])
+
+    def test_match_mesh_integral(self):
+        x_lb, x_ub = -0.6, 0.4
+        xs, step = np.linspace(x_lb, x_ub, 2000, retstep=True)
+        pre_density = np.array(
+            [
+                np.multiply(stats.norm(self.mus, self.sigmas).pdf(x), self.pis).sum(axis=1)
+                for x in xs
+            ]
+        ).transpose()
+        expected = approx_count(pre_density, step)
+        result = gm_cdf(self.pis, self.mus, self.sigmas, x_lb, x_ub)
+        np.testing.assert_allclose(result, expected, rtol=1e-4)
+
+    def test_unbounded_range(self):
+        result = gm_cdf(self.pis, self.mus, self.sigmas, -np.inf, np.inf)
+        np.testing.assert_allclose(result, [1.0, 1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
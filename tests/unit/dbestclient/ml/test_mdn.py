@@ -0,0 +1,176 @@
+import sys
+import threading
+import time
+import unittest
+
+import dill
+import numpy as np
+import torch
+import torch.nn as nn
+from dbestclient.ml.mdn import (MDN, KdeMdn, RegMdnGroupBy,
+                                concatenate_features, encode_groups,
+                                fit_encoder, get_batch_size, groups_to_float,
+                                train_mdn)
+from scipy import sparse
+from dbestclient.tools.running_parameters import RUNTIME_CONF, DbestConfig
+
+
+class TestKdeMdn(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.config = DbestConfig()
+        self.config.set_parameters(
+            {"encoder": "onehot", "n_epoch": 2, "b_grid_search": False})
+        self.runtime_config = RUNTIME_CONF.copy()
+        self.runtime_config["device"] = "cpu"
+        zs = np.array([["a"], ["b"], ["c"]] * 100)
+        xs = np.random.normal(0, 1, 300)
+        self.kde = KdeMdn(self.config).fit(zs, xs, self.runtime_config)
+
+    def test_parameter_cache(self):
+        zs = [["c"], ["a"], ["c"]]
+        expected = self.kde.predict_parameters_from_model(zs, self.runtime_config)
+        self.kde.cache_parameters([["a"], ["b"]], self.runtime_config)
+        self.assertEqual(len(self.kde.parameter_cache[0]), 2)
+        result = self.kde.predict_parameters(zs, self.runtime_config)
+        self.assertEqual(len(self.kde.parameter_cache[0]), 3)
+        for r, e in zip(result, expected):
+            np.testing.assert_allclose(r, e, rtol=1e-5, atol=1e-6)
+
+    def test_concurrent_parameter_cache(self):
+        kde = KdeMdn(self.config)
+
+        def predict_parameters_from_model(zs, runtime_config):
+            # the parameters of a group are its value.
+            values = np.repeat(np.array(zs, dtype=float), 3, axis=1)
+            time.sleep(0.001)
+            return values, values + 1, values + 2
+
+        kde.predict_parameters_from_model = predict_parameters_from_model
+        failures = []
+
+        def query(seed):
+            rows = np.random.RandomState(seed).permutation(300)
+            for chunk in np.array_split(rows, 30):
+                try:
+                    pis, mus, sigmas = kde.predict_parameters([[str(i)] for i in chunk], self.runtime_config)
+                    np.testing.assert_array_equal(pis[:, 0], chunk)
+                    np.testing.assert_array_equal(sigmas[:, 2], chunk + 2)
+                except Exception as e:
+                    failures.append(e)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=query, args=(seed,)) for seed in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(failures, [])
+        self.assertEqual(len(kde.parameter_cache[0]), 300)
+
+        # the free room of the cache is not serialized, and the lock is restored on load.
+        del kde.predict_parameters_from_model
+        kde = dill.loads(dill.dumps(kde))
+        self.assertEqual(len(kde.parameter_cache[1]), 300)
+        pis, _, _ = kde.predict_parameters([["7"], ["299"]], self.runtime_config)
+        np.testing.assert_array_equal(pis[:, 0], [7, 299])
+
+
+class TestSharedEncoder(unittest.TestCase):
+    """"""
+
+    def test_shared_encoder(self):
+        np.random.seed(0)
+        config = DbestConfig()
+        config.set_parameters(
+            {"encoder": "binary", "n_epoch": 1, "b_grid_search": False})
+        runtime_config = RUNTIME_CONF.copy()
+        runtime_config["device"] = "cpu"
+        runtime_config["plot"] = False
+        zs = np.array([["a"], ["b"], ["c"]] * 100)
+        xs = np.random.normal(0, 1, 300)
+        ys = xs * 2 + np.random.normal(0, 0.1, 300)
+
+        enc = fit_encoder(config, zs, xs, ys)
+        zs_encoded = encode_groups(enc, "binary", zs)
+        kde = KdeMdn(config).fit(zs, xs, runtime_config, enc=enc, zs_encoded=zs_encoded)
+        reg = RegMdnGroupBy(config).fit(zs, xs, ys, runtime_config, enc=enc, zs_encoded=zs_encoded)
+        self.assertIs(kde.enc, reg.enc)
+
+        # the encoder is serialized once along with both models.
+        kde, reg = dill.loads(dill.dumps((kde, reg)))
+        self.assertIs(kde.enc, reg.enc)
+
+        groups = [["a"], ["c"]]
+        x_points = [0.0, 0.5]
+        expected = reg.predict(groups, x_points, runtime_config)
+        result = reg.predict(groups, x_points, runtime_config, zs_encoded=reg.encode(groups))
+        np.testing.assert_allclose(result, expected, rtol=1e-5)
+
+
+class TestGroupsToFloat(unittest.TestCase):
+    """"""
+
+    def test_groups_to_float(self):
+        np.testing.assert_array_equal(groups_to_float(
+            [["1.5"], [""], ["3"]]), [[1.5], [0.0], [3.0]])
+        np.testing.assert_array_equal(groups_to_float(np.array([[2], [4]])), [[2.0], [4.0]])
+        with self.assertRaises(ValueError):
+            groups_to_float([["a"]])
+
+
+class TestTraining(unittest.TestCase):
+    """"""
+
+    def test_batch_size(self):
+        config = DbestConfig()
+        config.set_parameters({"batch_size": 1000, "max_batch_bytes": 1 << 20})
+        self.assertEqual(get_batch_size(10000, 4, config), 1000)
+        self.assertEqual(get_batch_size(10 ** 7, 4, config), 10000)
+        # the minibatch is bounded by its memory.
+        self.assertEqual(get_batch_size(10 ** 8, 4, config), (1 << 20) // 16)
+
+    def test_time_budget(self):
+        np.random.seed(0)
+        config = DbestConfig()
+        config.set_parameters(
+            {"encoder": "onehot", "n_epoch": 1000, "b_grid_search": False, "train_time_budget": 0})
+        runtime_config = RUNTIME_CONF.copy()
+        runtime_config["device"] = "cpu"
+        runtime_config["v"] = False
+        zs = np.array([["a"], ["b"]] * 1000)
+        xs = np.random.normal(0, 1, 2000)
+        kde = KdeMdn(config).fit(zs, xs, runtime_config)
+        self.assertFalse(kde.model.training)
+
+    def test_sparse_inputs(self):
+        np.random.seed(0)
+        config = DbestConfig()
+        config.set_parameters({"encoder": "onehot", "n_epoch": 3, "batch_size": 100})
+        runtime_config = RUNTIME_CONF.copy()
+        runtime_config["device"] = "cpu"
+        runtime_config["v"] = False
+        zs = np.random.choice(["a", "b", "c"], 1000)[:, np.newaxis]
+        xs = np.random.normal(0, 1, 1000)
+        enc = fit_encoder(config, zs)
+        inputs = concatenate_features(xs, encode_groups(enc, "onehot", zs, b_sparse=True))
+        self.assertTrue(sparse.issparse(inputs))
+        np.testing.assert_array_equal(inputs.toarray(), concatenate_features(xs, encode_groups(enc, "onehot", zs)))
+        labels = torch.from_numpy(np.random.normal(0, 1, (1000, 1)).astype(np.float32))
+
+        # the network learns the same from the sparse features as from the dense ones.
+        models = []
+        for features in (inputs, torch.from_numpy(inputs.toarray())):
+            torch.manual_seed(0)
+            model = nn.Sequential(nn.Linear(4, 5), nn.Tanh(), MDN(5, 1, 2, "cpu"))
+            models.append(train_mdn(model, features, labels, config, runtime_config))
+        for sparse_weight, dense_weight in zip(models[0].parameters(), models[1].parameters()):
+            np.testing.assert_allclose(sparse_weight.detach().numpy(), dense_weight.detach().numpy(), atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
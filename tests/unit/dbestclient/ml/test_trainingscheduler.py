@@ -0,0 +1,36 @@
+# Created by Qingzhi Ma at 2020-11-23
+# All right reserved
+# Department of Computer Science
+# the University of Warwick
+# Q.Ma.2@warwick.ac.uk
+import os
+import unittest
+
+import torch
+from dbestclient.ml.trainingscheduler import TrainingScheduler
+from dbestclient.tools.running_parameters import RUNTIME_CONF
+
+
+class TestTrainingScheduler(unittest.TestCase):
+    """"""
+
+    def test_run(self):
+        for n_jobs in [1, 2]:
+            runtime_config = RUNTIME_CONF.copy()
+            runtime_config["n_jobs"] = n_jobs
+            scheduler = TrainingScheduler(runtime_config)
+            if n_jobs > 1:
+                self.assertEqual(scheduler.worker_runtime_config(3)["n_jobs"], 1)
+            for i in range(3):
+                scheduler.submit("model " + str(i), pow, i, 2)
+            scheduler.submit("threads", torch.get_num_threads)
+            results = scheduler.run()
+            self.assertEqual(results[:3], [0, 1, 4])
+            if n_jobs > 1:
+                # the cores are split between the workers.
+                self.assertEqual(results[3], max(1, (os.cpu_count() or 1) // n_jobs))
+            self.assertEqual(scheduler.run(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
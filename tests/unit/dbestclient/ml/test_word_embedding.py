@@ -166,6 +166,20 @@ class TestSkipGram(unittest.TestCase):
         results = sg.predicts(gbs)
         self.assertEqual(len(gbs), len(results))
 
+    def test_lookup_table(self):
+        gb = np.array([["london", "male"], ["paris", "female"], ["", ""]])
+        ranges = np.array([20, 30, 40])
+        labels = np.array([15000.032, 16000.80, 18000])
+        sg = SkipGram().fit(gb, ranges, labels, usecols=None, workers=1)
+        gbs = np.array([["paris", "male"], ["london", ""], ["", "female"]])
+        np.testing.assert_array_equal(sg.predicts(gbs), sg.predicts_low_efficient(gbs))
+
+        # models saved with the embeddings dict only.
+        sg.tables = None
+        np.testing.assert_array_equal(sg.predicts(gbs), sg.predicts_low_efficient(gbs))
+        with self.assertRaises(KeyError):
+            sg.predicts(np.array([["berlin", "male"]]))
+
 
 if __name__ == "__main__":
     # unittest.main()
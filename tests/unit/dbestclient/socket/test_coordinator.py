@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+import pandas as pd
+from dbestclient.socket.coordinator import Coordinator
+
+
+class TestCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.groups = [str(i) for i in range(100)]
+        self.runtime_config = {"slave_timeout": 1.0, "slave_retries": 1, "hedge_after": 2.0,
+                               "query_timeout": None, "b_allow_partial_results": True, "v": False}
+        self.delays = {("a", 1): 0.01, ("b", 1): 0.01, ("c", 1): 0.01}
+        self.calls = []
+
+    async def request(self, host, port, groups):
+        self.calls.append((host, len(groups)))
+        delay = self.delays[(host, port)]
+        if delay is None:
+            raise ConnectionError("connection refused")
+        await asyncio.sleep(delay)
+        return pd.DataFrame({0: groups, 1: [float(g) for g in groups]})
+
+    def scatter(self, coordinator):
+        return asyncio.run(coordinator.scatter(self.request, list(self.delays), self.groups, self.runtime_config))
+
+    def test_retry_and_throughput(self):
+        self.delays[("c", 1)] = None
+        coordinator = Coordinator()
+        result = self.scatter(coordinator)
+        self.assertEqual(result[0].tolist(), self.groups)
+        self.assertNotIn(("c", 1), coordinator.throughputs)
+
+        # chunks are sized by the observed throughput.
+        coordinator.throughputs = {("a", 1): 300.0, ("b", 1): 100.0, ("c", 1): 100.0}
+        self.assertEqual([len(chunk.groups) for chunk, _ in coordinator.split(self.groups, list(self.delays))],
+                         [60, 20, 20])
+
+    def test_hedging(self):
+        coordinator = Coordinator()
+        coordinator.throughputs = {s: 5000.0 for s in self.delays}
+        self.delays[("b", 1)] = 0.5
+        result = self.scatter(coordinator)
+        self.assertEqual(result[0].tolist(), self.groups)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_partial_results(self):
+        self.delays[("b", 1)] = None
+        self.delays[("c", 1)] = None
+        self.runtime_config["slave_retries"] = 0
+        result = self.scatter(Coordinator())
+        self.assertEqual(len(result) + len(result.attrs["missing_groups"]), len(self.groups))
+
+        self.runtime_config["b_allow_partial_results"] = False
+        with self.assertRaises(RuntimeError):
+            self.scatter(Coordinator())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+import numpy as np
+import pandas as pd
+from dbestclient.socket.wire import (HEADER, MSG_QUERY, decode_header,
+                                     decode_payload, encode_frame,
+                                     pack_dataframe, pack_groups, read_frame,
+                                     unpack_dataframe, unpack_groups)
+
+
+class TestWire(unittest.TestCase):
+    def test_frame(self):
+        groups = [str(i) + "," + str(i % 7) for i in range(1000)] + ["", "café"]
+        meta, arrays = pack_groups(groups)
+        meta["func"] = "avg"
+        meta["x_lb"] = np.float64(1.5)
+        for level in [0, 6]:
+            frame = encode_frame(MSG_QUERY, 42, meta, arrays, compress_level=level)
+            msg_type, flags, request_id, meta_len, body_len = decode_header(frame[:HEADER.size])
+            self.assertEqual((msg_type, request_id), (MSG_QUERY, 42))
+            self.assertEqual(bool(flags), level > 0)
+            decoded_meta, decoded_arrays = decode_payload(
+                flags, frame[HEADER.size:HEADER.size + meta_len], frame[HEADER.size + meta_len:])
+            self.assertEqual(decoded_meta["x_lb"], 1.5)
+            self.assertEqual(unpack_groups(decoded_meta, decoded_arrays), groups)
+
+    def test_dataframe(self):
+        df = pd.DataFrame({0: ["1", "2", "3,4"], 1: np.array([0.5, 1.5, 2.5])})
+        meta, arrays = pack_dataframe(df)
+
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(encode_frame(MSG_QUERY, 1, meta, arrays) * 2)
+            return [await read_frame(reader), await read_frame(reader)]
+        frames = asyncio.run(read())
+        for _, request_id, decoded_meta, decoded_arrays in frames:
+            self.assertEqual(request_id, 1)
+            pd.testing.assert_frame_equal(unpack_dataframe(decoded_meta, decoded_arrays), df)
+
+
+if __name__ == "__main__":
+    unittest.main()